@@ -0,0 +1,158 @@
+# album.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+# Telegram 媒体组最多 10 个媒体，收齐后不再等待
+MAX_ALBUM_SIZE = 10
+
+
+class TTLSet:
+    """带过期时间的集合，用于记录已处理的媒体组"""
+
+    def __init__(self, ttl: float = 600, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.items: "OrderedDict[Any, float]" = OrderedDict()
+
+    def _prune(self):
+        now = time.monotonic()
+        while self.items:
+            key, expires_at = next(iter(self.items.items()))
+            if expires_at > now and len(self.items) <= self.maxsize:
+                break
+            self.items.popitem(last=False)
+
+    def add(self, key):
+        self.items.pop(key, None)
+        self.items[key] = time.monotonic() + self.ttl
+        self._prune()
+
+    def __contains__(self, key) -> bool:
+        self._prune()
+        return key in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+class PendingAlbum:
+    """正在收集的媒体组"""
+
+    __slots__ = ('chat_id', 'grouped_id', 'messages', 'timer')
+
+    def __init__(self, chat_id: int, grouped_id: int):
+        self.chat_id = chat_id
+        self.grouped_id = grouped_id
+        self.messages: Dict[int, Any] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class AlbumAggregator:
+    """按 grouped_id 聚合媒体组消息
+
+    同一媒体组的 NewMessage 事件先缓存起来，debounce 秒内没有新成员（或收满
+    10 个）时，把整个媒体组按消息ID排序后交给 on_album 处理，不需要再
+    通过 get_messages 查询历史消息。已处理的媒体组记录在 TTLSet 中，迟到的
+    重复消息会被忽略。
+    """
+
+    def __init__(self, on_album: Callable[[List[Any]], Awaitable[None]],
+                 debounce: float = 1.0, completed_ttl: float = 600):
+        self.on_album = on_album
+        self.debounce = debounce
+        self.pending: Dict[Any, PendingAlbum] = {}
+        self.completed = TTLSet(completed_ttl)
+        # 正在放入发送通道的媒体组，chat_id -> 任务集合
+        self.emitting: Dict[int, Set[asyncio.Task]] = {}
+
+        # 统计信息
+        self.albums = 0
+        self.late_messages = 0
+
+    def add(self, chat_id: int, message) -> bool:
+        """缓存媒体组消息，返回 False 表示消息不属于媒体组"""
+        grouped_id = getattr(message, 'grouped_id', None)
+        if not grouped_id:
+            return False
+
+        key = (chat_id, grouped_id)
+        if key in self.completed:
+            self.late_messages += 1
+            logging.warning(f"媒体组 {grouped_id} 已处理，忽略迟到的消息 {message.id}")
+            return True
+
+        album = self.pending.get(key)
+        if album is None:
+            album = PendingAlbum(chat_id, grouped_id)
+            self.pending[key] = album
+        album.messages[message.id] = message
+
+        if album.timer:
+            album.timer.cancel()
+        if len(album.messages) >= MAX_ALBUM_SIZE:
+            self._emit(key)
+        else:
+            album.timer = asyncio.get_running_loop().call_later(self.debounce, self._emit, key)
+        return True
+
+    def _emit(self, key):
+        """结束收集，在后台处理媒体组"""
+        album = self.pending.pop(key, None)
+        if album is None:
+            return
+        if album.timer:
+            album.timer.cancel()
+        self.completed.add(key)
+        self.albums += 1
+
+        messages = [album.messages[message_id] for message_id in sorted(album.messages)]
+        logging.info(f"媒体组 {album.grouped_id} 收集完成: {len(messages)} 个媒体")
+        task = asyncio.create_task(self._run(messages))
+        tasks = self.emitting.setdefault(album.chat_id, set())
+        tasks.add(task)
+        task.add_done_callback(lambda t, chat_id=album.chat_id: self._done(chat_id, t))
+
+    async def _run(self, messages: List[Any]):
+        try:
+            await self.on_album(messages)
+        except Exception as e:
+            logging.error(f"处理媒体组时出错: {e}")
+
+    def _done(self, chat_id: int, task: asyncio.Task):
+        tasks = self.emitting.get(chat_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                self.emitting.pop(chat_id, None)
+
+    async def flush_chat(self, chat_id: int):
+        """立即处理该频道正在收集的媒体组，等待媒体组放入发送通道
+
+        不等待上传完成；发送通道按提交顺序发送，频道的下一条普通消息会在
+        媒体组之后发送，保持原有顺序。
+        """
+        for key in [key for key, album in self.pending.items() if album.chat_id == chat_id]:
+            self._emit(key)
+        tasks = self.emitting.get(chat_id)
+        if tasks:
+            await asyncio.gather(*list(tasks), return_exceptions=True)
+
+    async def flush_all(self):
+        """停止前把所有正在收集的媒体组放入发送通道"""
+        for key in list(self.pending):
+            self._emit(key)
+        tasks = [task for tasks in self.emitting.values() for task in tasks]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取媒体组统计信息"""
+        return {
+            'pending': len(self.pending),
+            'albums': self.albums,
+            'late_messages': self.late_messages,
+            'completed': len(self.completed)
+        }
@@ -0,0 +1,332 @@
+# async_database.py
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from database import Database, DEFAULT_CACHED_STATEMENTS, ROUTING_CHECK_INTERVAL
+from routing import RoutingTable
+
+
+def _read(name: str):
+    """在读线程中执行 Database 的同名方法"""
+    async def method(self, *args, **kwargs):
+        return await self._run(self.reader_executor, self._call_reader, name, *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(Database, name).__doc__
+    return method
+
+
+def _write(name: str):
+    """在写线程中执行 Database 的同名方法"""
+    async def method(self, *args, **kwargs):
+        return await self._run(self.writer_executor, getattr(self.writer, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(Database, name).__doc__
+    return method
+
+
+class AsyncDatabase:
+    """Database 的异步版本，方法名和参数与 Database 相同
+
+    - 所有写操作在同一个写线程中按提交顺序执行（单写者队列）
+    - 读操作由 read_connections 个读线程执行，每个线程使用自己的只读连接
+    - 数据库访问不阻塞事件循环，协程之间也不再共享同一个游标
+    - 转发关系先进入写缓冲，攒够 forward_batch_size 条或等待 forward_flush_ms
+      毫秒后在一个事务中写入，写入前 get_forwarded_message 也能查到
+    - 用户语言设置启动时全部加载到内存，get_user_language 是同步的字典查询
+    """
+
+    def __init__(self, db_name: str, read_connections: int = 2,
+                 forward_batch_size: int = 100, forward_flush_ms: int = 500,
+                 pragmas: Optional[Dict[str, Any]] = None,
+                 cached_statements: int = DEFAULT_CACHED_STATEMENTS):
+        self.database_name = db_name
+        self.pragmas = pragmas
+        self.cached_statements = cached_statements
+        self.writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self.reader_executor = ThreadPoolExecutor(max_workers=max(1, read_connections),
+                                                  thread_name_prefix='db-reader')
+        # 写连接在写线程中创建，表结构初始化也在写线程中完成
+        self.writer: Database = self.writer_executor.submit(
+            Database, db_name, pragmas=pragmas, cached_statements=cached_statements).result()
+        # user_preferences 的内存副本（写穿透），语言查询不访问数据库
+        self.languages: Dict[int, str] = self.writer_executor.submit(self.writer.get_all_user_languages).result()
+        # 每个读线程的只读连接
+        self.readers: List[Database] = []
+        self._local = threading.local()
+        self._readers_lock = threading.Lock()
+        self._routing_checked_at = time.monotonic()
+        self.closed = False
+
+        # 转发关系写缓冲，(原频道, 原消息, 目标频道) -> (目标消息, 创建时间)
+        self.forward_batch_size = max(1, forward_batch_size)
+        self.forward_flush_delay = max(0, forward_flush_ms) / 1000
+        self.pending_forwards: Dict[Tuple[int, int, int], Tuple[int, str]] = {}
+        # 已提交给写线程、尚未写入完成的转发关系
+        self.flushing_forwards: Dict[Tuple[int, int, int], Tuple[int, str]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+        # 转发关系定期清理任务
+        self.retention_task: Optional[asyncio.Task] = None
+        # 每批转发关系删除后的回调，用于让依赖这些记录的缓存失效
+        self.prune_listeners: List[Callable[[], None]] = []
+
+    async def _run(self, executor: ThreadPoolExecutor, func, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    def _call_reader(self, name: str, *args, **kwargs) -> Any:
+        reader = getattr(self._local, 'db', None)
+        if reader is None:
+            reader = Database(self.database_name, readonly=True, pragmas=self.pragmas,
+                              cached_statements=self.cached_statements)
+            self._local.db = reader
+            with self._readers_lock:
+                self.readers.append(reader)
+        return getattr(reader, name)(*args, **kwargs)
+
+    # 读操作
+    get_channels_by_type = _read('get_channels_by_type')
+    get_channel_pairs = _read('get_channel_pairs')
+    get_unpaired_forward_channels = _read('get_unpaired_forward_channels')
+    get_forward_channels = _read('get_forward_channels')
+    get_all_forward_channels = _read('get_all_forward_channels')
+    get_filter_rules = _read('get_filter_rules')
+    get_time_filters = _read('get_time_filters')
+    get_all_channel_pairs = _read('get_all_channel_pairs')
+    get_channel_info = _read('get_channel_info')
+    get_channel_stats = _read('get_channel_stats')
+
+    # 写操作
+    add_channel = _write('add_channel')
+    remove_channel = _write('remove_channel')
+    add_channel_pair = _write('add_channel_pair')
+    remove_channel_pair = _write('remove_channel_pair')
+    set_pair_timezone = _write('set_pair_timezone')
+    set_pair_send_mode = _write('set_pair_send_mode')
+    add_filter_rule = _write('add_filter_rule')
+    update_filter_rule = _write('update_filter_rule')
+    delete_filter_rule = _write('delete_filter_rule')
+    remove_filter_rule = _write('remove_filter_rule')
+    add_time_filter = _write('add_time_filter')
+    update_time_filter = _write('update_time_filter')
+    delete_time_filter = _write('delete_time_filter')
+    remove_time_filter = _write('remove_time_filter')
+    refresh_routing_table = _write('refresh_routing_table')
+    check_database_health = _write('check_database_health')
+    optimize_database = _write('optimize_database')
+
+    def get_user_language(self, user_id: int) -> str:
+        """获取用户语言设置（从内存副本读取）"""
+        return self.languages.get(user_id, 'en')
+
+    async def set_user_language(self, user_id: int, language: str) -> bool:
+        """设置用户语言偏好，写入数据库后同步更新内存副本"""
+        success = await self._run(self.writer_executor, self.writer.set_user_language, user_id, language)
+        if success:
+            self.languages[user_id] = language
+        return success
+
+    def get_routing_table(self) -> RoutingTable:
+        """获取当前路由快照，不等待数据库
+
+        写操作在写线程中直接重建快照；其他进程修改数据库的检查最多每
+        ROUTING_CHECK_INTERVAL 秒交给写线程执行一次，结果在之后的调用中生效。
+        """
+        now = time.monotonic()
+        if not self.closed and now - self._routing_checked_at >= ROUTING_CHECK_INTERVAL:
+            self._routing_checked_at = now
+            self.writer_executor.submit(self.writer.get_routing_table)
+        return self.writer.routing
+
+    async def save_forwarded_message(self, original_chat_id: int, original_message_id: int,
+                                     forwarded_chat_id: int, forwarded_message_id: int) -> bool:
+        """保存消息转发关系（进入写缓冲，批量写入）"""
+        key = (original_chat_id, original_message_id, forwarded_chat_id)
+        created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self.pending_forwards[key] = (forwarded_message_id, created_at)
+
+        if len(self.pending_forwards) >= self.forward_batch_size:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.forward_flush_delay, self._start_flush)
+        return True
+
+    async def get_forwarded_message(self, original_chat_id: int, original_message_id: int,
+                                    forwarded_chat_id: int) -> Optional[Dict[str, Any]]:
+        """获取转发消息关系（包括写缓冲中尚未写入的记录）"""
+        key = (original_chat_id, original_message_id, forwarded_chat_id)
+        pending = self.pending_forwards.get(key) or self.flushing_forwards.get(key)
+        if pending is not None:
+            return {
+                'original_chat_id': original_chat_id,
+                'original_message_id': original_message_id,
+                'forwarded_chat_id': forwarded_chat_id,
+                'forwarded_message_id': pending[0],
+                'created_at': pending[1]
+            }
+        return await self._run(self.reader_executor, self._call_reader, 'get_forwarded_message',
+                               original_chat_id, original_message_id, forwarded_chat_id)
+
+    async def get_forwarded_messages(self, original_chat_id: int, original_message_ids: List[int],
+                                     forwarded_chat_ids: List[int]) -> Dict[Tuple[int, int], int]:
+        """批量获取转发关系（包括写缓冲中尚未写入的记录），返回 {(原消息ID, 目标频道ID): 转发消息ID}"""
+        # 先取缓冲中的记录，查询期间写入完成的记录不会漏掉
+        message_ids = set(original_message_ids)
+        chat_ids = set(forwarded_chat_ids)
+        buffered = {}
+        for buffer in (self.flushing_forwards, self.pending_forwards):
+            for (chat_id, message_id, forwarded_chat_id), value in buffer.items():
+                if chat_id == original_chat_id and message_id in message_ids and forwarded_chat_id in chat_ids:
+                    buffered[(message_id, forwarded_chat_id)] = value[0]
+
+        result = await self._run(self.reader_executor, self._call_reader, 'get_forwarded_messages',
+                                 original_chat_id, original_message_ids, forwarded_chat_ids)
+        # 缓冲中的记录比数据库中的新
+        result.update(buffered)
+        return result
+
+    def _take_batch(self) -> Dict[Tuple[int, int, int], Tuple[int, str]]:
+        """取出写缓冲中的记录，写入完成前仍可通过 flushing_forwards 查到"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch = self.pending_forwards
+        self.pending_forwards = {}
+        self.flushing_forwards.update(batch)
+        return batch
+
+    def _start_flush(self):
+        batch = self._take_batch()
+        if batch:
+            task = asyncio.ensure_future(self._write_batch(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _write_batch(self, batch: Dict[Tuple[int, int, int], Tuple[int, str]]) -> bool:
+        rows = [key + value for key, value in batch.items()]
+        try:
+            saved = await self._run(self.writer_executor, self.writer.save_forwarded_messages, rows)
+        except Exception as e:
+            logging.error(f"保存消息转发关系失败 ({len(rows)} 条): {e}")
+            saved = False
+
+        for key, value in batch.items():
+            if self.flushing_forwards.get(key) is value:
+                del self.flushing_forwards[key]
+            if not saved:
+                # 写入失败的记录放回缓冲，下次写入时重试（不覆盖之后的新记录）
+                self.pending_forwards.setdefault(key, value)
+        if not saved and self._flush_handle is None and not self.closed:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.forward_flush_delay, self._start_flush)
+        return saved
+
+    async def flush_forwarded_messages(self) -> bool:
+        """把写缓冲中的转发关系在一个事务中写入数据库，并等待已提交的写入完成"""
+        running = list(self._flush_tasks)
+        batch = self._take_batch()
+        saved = await self._write_batch(batch) if batch else True
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        return saved
+
+    def start_retention_task(self, retention_days: float = 0, keep_per_chat: int = 0,
+                             interval_hours: float = 6, batch_size: int = 1000):
+        """启动转发关系定期清理任务，两种保留策略都为 0 时不清理"""
+        if (retention_days > 0 or keep_per_chat > 0) and self.retention_task is None:
+            self.retention_task = asyncio.create_task(self._run_retention(
+                retention_days, keep_per_chat, interval_hours * 3600, batch_size))
+
+    async def _run_retention(self, retention_days: float, keep_per_chat: int,
+                             interval: float, batch_size: int):
+        # 启用清理前创建的数据库需要先转换，否则删除后文件不会变小
+        await self._run(self.writer_executor, self.writer.enable_incremental_vacuum)
+        while True:
+            try:
+                await self.prune_forwarded_messages(retention_days, keep_per_chat, batch_size)
+            except Exception as e:
+                logging.error(f"清理转发关系时出错: {e}")
+            await asyncio.sleep(max(interval, 60))
+
+    async def prune_forwarded_messages(self, retention_days: float = 0, keep_per_chat: int = 0,
+                                       batch_size: int = 1000, pause: float = 0.05,
+                                       vacuum_pages: int = 1000) -> int:
+        """按保留策略清理转发关系，返回删除的行数
+
+        - retention_days > 0 时删除超过该天数的记录
+        - keep_per_chat > 0 时每个源频道只保留最近的 keep_per_chat 条源消息
+        每批最多删除 batch_size 行并单独提交，批次之间暂停 pause 秒，
+        写线程可以处理其他写操作，不会长时间占用写锁。删除后用增量 VACUUM 回收空间。
+        """
+        started = time.monotonic()
+        total = 0
+        if retention_days > 0:
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+            total += await self._prune_batches(self.writer.delete_forwarded_messages_before,
+                                               (cutoff,), batch_size, pause)
+        if keep_per_chat > 0:
+            bounds = await self._run(self.reader_executor, self._call_reader,
+                                     'get_forwarded_prune_bounds', keep_per_chat)
+            for chat_id, min_message_id in bounds:
+                total += await self._prune_batches(self.writer.delete_forwarded_messages_below,
+                                                   (chat_id, min_message_id), batch_size, pause)
+        if not total:
+            return 0
+
+        while not self.closed:
+            remaining = await self._run(self.writer_executor, self.writer.incremental_vacuum, vacuum_pages)
+            if not remaining:
+                break
+            await asyncio.sleep(pause)
+        logging.info(f"已清理 {total} 条转发关系，用时 {time.monotonic() - started:.1f}s")
+        return total
+
+    def add_prune_listener(self, listener: Callable[[], None]):
+        """注册转发关系被清理后的回调"""
+        self.prune_listeners.append(listener)
+
+    def _notify_pruned(self):
+        for listener in self.prune_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logging.error(f"转发关系清理回调出错: {e}")
+
+    async def _prune_batches(self, delete, params: Tuple, batch_size: int, pause: float) -> int:
+        total = 0
+        while not self.closed:
+            deleted = await self._run(self.writer_executor, delete, *params, batch_size)
+            total += deleted
+            if deleted:
+                self._notify_pruned()
+            if deleted < batch_size:
+                break
+            await asyncio.sleep(pause)
+        return total
+
+    async def cleanup(self):
+        """写入缓冲中的数据并关闭所有连接"""
+        if self.retention_task:
+            self.retention_task.cancel()
+            await asyncio.gather(self.retention_task, return_exceptions=True)
+            self.retention_task = None
+        await self.flush_forwarded_messages()
+        self.closed = True
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self._run(self.writer_executor, self.writer.cleanup)
+        await asyncio.to_thread(self._shutdown)
+
+    def _shutdown(self):
+        self.writer_executor.shutdown(wait=True)
+        self.reader_executor.shutdown(wait=True)
+        for reader in self.readers:
+            reader.conn.close()
+        self.readers.clear()
@@ -0,0 +1,83 @@
+# benchmarks/bench_content_filter.py
+"""内容过滤器微基准：编译后的 ContentFilter 与逐条 match_rule 循环对比
+
+用法: python benchmarks/bench_content_filter.py [关键词规则数] [消息长度]
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_filter import compile_content_filter  # noqa: E402
+from message_handler import MyMessageHandler  # noqa: E402
+
+
+def legacy_check(handler, filter_rules, content):
+    """原 check_content_filter 的逐条匹配逻辑"""
+    whitelist_rules = [r for r in filter_rules if r['rule_type'] == 'WHITELIST']
+    blacklist_rules = [r for r in filter_rules if r['rule_type'] == 'BLACKLIST']
+    if whitelist_rules and not any(handler.match_rule(r, content) for r in whitelist_rules):
+        return False
+    for rule in blacklist_rules:
+        if handler.match_rule(rule, content):
+            return False
+    return True
+
+
+def random_word(rng, length):
+    return ''.join(rng.choice(string.ascii_letters) for _ in range(length))
+
+
+def main():
+    keyword_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    text_length = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = random.Random(42)
+
+    rules = []
+    for i in range(keyword_count):
+        rules.append({
+            'rule_type': 'BLACKLIST' if i % 4 else 'WHITELIST',
+            'filter_mode': 'KEYWORD',
+            'pattern': random_word(rng, rng.randint(5, 10))
+        })
+    for i in range(10):
+        rules.append({
+            'rule_type': 'BLACKLIST',
+            'filter_mode': 'REGEX',
+            'pattern': rf"\b{random_word(rng, 4)}\d+\b"
+        })
+
+    handler = MyMessageHandler.__new__(MyMessageHandler)
+    compiled = compile_content_filter(rules)
+
+    texts = []
+    for _ in range(50):
+        words = []
+        while sum(len(w) + 1 for w in words) < text_length:
+            words.append(random_word(rng, rng.randint(2, 9)))
+        # 部分消息包含一个规则关键词
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), rng.choice(rules)['pattern'].upper())
+        texts.append(' '.join(words))
+
+    mismatches = sum(legacy_check(handler, rules, t) != compiled.is_allowed(t) for t in texts)
+    if mismatches:
+        print(f"结果不一致: {mismatches} 条消息")
+        sys.exit(1)
+
+    number = 20
+    legacy = timeit.timeit(lambda: [legacy_check(handler, rules, t) for t in texts], number=number)
+    fast = timeit.timeit(lambda: [compiled.is_allowed(t) for t in texts], number=number)
+    per_message = number * len(texts)
+
+    print(f"规则数: {len(rules)} ({keyword_count} KEYWORD + 10 REGEX), 消息长度: ~{text_length} 字符")
+    print(f"match_rule 循环:  {legacy / per_message * 1e6:9.1f} µs/消息")
+    print(f"ContentFilter:    {fast / per_message * 1e6:9.1f} µs/消息")
+    print(f"加速比:           {legacy / fast:9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
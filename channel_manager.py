@@ -22,6 +22,7 @@ from typing import Optional, Dict, Any
 from telethon import TelegramClient
 from locales import get_text, TRANSLATIONS
 from telegram.error import BadRequest
+from time_filter import load_timezone
 
 # 定义会话状态
 CHOOSING_CHANNEL_TYPE = 0
@@ -29,6 +30,13 @@ CHOOSING_ADD_METHOD = 1
 WAITING_FOR_FORWARD = 2
 WAITING_FOR_MANUAL_INPUT = 3
 
+# 配对时间段过滤可选的时区，None 表示服务器本地时区
+TIMEZONE_CHOICES = (
+    None, 'UTC', 'Europe/London', 'Europe/Berlin', 'Europe/Kyiv', 'Europe/Moscow',
+    'Asia/Dubai', 'Asia/Kolkata', 'Asia/Shanghai', 'Asia/Tokyo',
+    'America/New_York', 'America/Los_Angeles',
+)
+
 class ChannelManager:
     def __init__(self, db, config, client: TelegramClient):
         self.db = db
@@ -93,7 +101,7 @@ class ChannelManager:
         user_id = update.effective_user.id
         new_lang = query.data.split('_')[1]
 
-        success = self.db.set_user_language(user_id, new_lang)
+        success = await self.db.set_user_language(user_id, new_lang)
         if success:
             await query.message.edit_text(
                 get_text(new_lang, 'language_changed'),
@@ -181,6 +189,10 @@ class ChannelManager:
                 self.handle_add_specific_pair,
                 pattern='^add_pair_[0-9]+_[0-9]+(_add)?$'
             ),
+            CallbackQueryHandler(
+                self.handle_pair_send_mode,
+                pattern='^pair_mode_[0-9]+_[0-9]+_(BOT|USER)$'
+            ),
             CallbackQueryHandler(
                 self.handle_remove_specific_pair,
                 pattern='^remove_pair_[0-9]+_[0-9]+$'
@@ -197,6 +209,8 @@ self.handle_confirm_remove_pair,
             CallbackQueryHandler(self.show_pair_selection_for_time, pattern='^add_time_filter$'),
             CallbackQueryHandler(self.show_filter_rules_list, pattern='^list_filter_rules$'),
             CallbackQueryHandler(self.show_time_filters_list, pattern='^list_time_filters$'),
+            CallbackQueryHandler(self.show_pair_time_settings, pattern='^time_pair_[0-9]+:[0-9]+$'),
+            CallbackQueryHandler(self.handle_pair_timezone, pattern='^pair_tz_[0-9]+:[0-9]+_[0-9]+$'),
 
             # 返回处理
             CallbackQueryHandler(self.handle_back, pattern='^back_to_'),
@@ -395,7 +409,7 @@ self.handle_confirm_remove_pair,
 
             # 添加到数据库
             channel_type = context.user_data.get('channel_type', 'MONITOR')
-            success = self.db.add_channel(
+            success = await self.db.add_channel(
                 channel_id=chat_id,  # 使用标准化的ID
                 channel_name=chat_title or "Unknown",
                 channel_username=chat_username,
@@ -448,7 +462,7 @@ self.handle_confirm_remove_pair,
                 chat = await self.client.get_entity(full_id)
 
                 channel_type = context.user_data.get('channel_type')
-                success = self.db.add_channel(
+                success = await self.db.add_channel(
                     channel_id=channel_id,  # 使用标准化的ID
                     channel_name=getattr(chat, 'title', None) or getattr(chat, 'first_name', 'Unknown'),
                     channel_username=getattr(chat, 'username', None),
@@ -505,7 +519,7 @@ self.handle_confirm_remove_pair,
             channel_id = int(query.data.split('_')[-1])
             logging.info(f"获取频道信息: {channel_id}")
 
-            channel_info = self.db.get_channel_info(channel_id)
+            channel_info = await self.db.get_channel_info(channel_id)
 
             if not channel_info:
                 logging.error(f"未找到频道: {channel_id}")
@@ -623,8 +637,8 @@ self.handle_confirm_remove_pair,
                     page = 1
 
             per_page = 7
-            monitor_result = self.db.get_channels_by_type('MONITOR', page, per_page)
-            forward_result = self.db.get_channels_by_type('FORWARD', page, per_page)
+            monitor_result = await self.db.get_channels_by_type('MONITOR', page, per_page)
+            forward_result = await self.db.get_channels_by_type('FORWARD', page, per_page)
 
             monitor_channels = monitor_result['channels']
             forward_channels = forward_result['channels']
@@ -745,12 +759,12 @@ self.handle_confirm_remove_pair,
                 logging.info(f"准备删除频道ID: {channel_id}")
 
                 # 获取频道信息用于日志记录
-                channel_info = self.db.get_channel_info(channel_id)
+                channel_info = await self.db.get_channel_info(channel_id)
                 if channel_info:
                     logging.info(f"删除频道: {channel_info['channel_name']} (ID: {channel_id})")
 
                 # 执行删除操作
-                success = self.db.remove_channel(channel_id)
+                success = await self.db.remove_channel(channel_id)
                 logging.info(f"删除操作结果: {success}")
 
                 if success:
@@ -894,7 +908,7 @@ self.handle_confirm_remove_pair,
                 page = 1
 
         per_page = 7
-        monitor_result = self.db.get_channels_by_type('MONITOR', page, per_page)
+        monitor_result = await self.db.get_channels_by_type('MONITOR', page, per_page)
 
         if not monitor_result['channels']:
             await query.message.edit_text(
@@ -909,7 +923,7 @@ self.handle_confirm_remove_pair,
         keyboard = []
 
         for channel in monitor_result['channels']:
-            forward_pairs = self.db.get_forward_channels(channel['channel_id'], 1, 3)
+            forward_pairs = await self.db.get_forward_channels(channel['channel_id'], 1, 3)
             text += f"\n🔍 {channel['channel_name']}\n"
 
             if forward_pairs['channels']:
@@ -976,8 +990,8 @@ self.handle_confirm_remove_pair,
             per_page = 7  # 每页显示7个频道
 
             # 获取分页数据
-            monitor_result = self.db.get_channels_by_type('MONITOR', page, per_page)
-            forward_result = self.db.get_channels_by_type('FORWARD', page, per_page)
+            monitor_result = await self.db.get_channels_by_type('MONITOR', page, per_page)
+            forward_result = await self.db.get_channels_by_type('FORWARD', page, per_page)
 
             monitor_channels = monitor_result['channels']
             forward_channels = forward_result['channels']
@@ -1061,7 +1075,7 @@ self.handle_confirm_remove_pair,
             logging.info(f"get monitor_id -- {monitor_id}")
             page = int(parts[3]) if len(parts) > 3 else 1
 
-            monitor_info = self.db.get_channel_info(monitor_id)
+            monitor_info = await self.db.get_channel_info(monitor_id)
             if not monitor_info:
                 await query.message.edit_text(
                     get_text(lang, 'channel_not_found'),
@@ -1075,7 +1089,7 @@ self.handle_confirm_remove_pair,
             keyboard = []
 
             # 获取当前配对
-            current_pairs = self.db.get_forward_channels(monitor_id, page)
+            current_pairs = await self.db.get_forward_channels(monitor_id, page)
             if current_pairs['channels']:
                 text += get_text(lang, 'current_pairs') + "\n"
                 for channel in current_pairs['channels']:
@@ -1084,11 +1098,19 @@ self.handle_confirm_remove_pair,
                         get_text(lang, 'remove_pair_button', name=channel['channel_name']),
                         callback_data=f"remove_pair_{monitor_id}_{channel['channel_id']}"
                     )])
+                    # 点击切换发送方式：Bot 重新上传 / 用户账号直接发送原媒体
+                    send_mode = channel['send_mode']
+                    keyboard.append([InlineKeyboardButton(
+                        get_text(lang, 'send_mode_button', name=channel['channel_name'],
+                                 mode=get_text(lang, f"send_mode_{send_mode.lower()}")),
+                        callback_data=f"pair_mode_{monitor_id}_{channel['channel_id']}_"
+                                      f"{'BOT' if send_mode == 'USER' else 'USER'}"
+                    )])
             else:
                 text += get_text(lang, 'no_pairs') + "\n"
 
             # 获取可用的转发频道
-            available_channels = self.db.get_unpaired_forward_channels(monitor_id, page)
+            available_channels = await self.db.get_unpaired_forward_channels(monitor_id, page)
             if available_channels['channels']:
                 text += "\n" + get_text(lang, 'available_channels') + "\n"
                 for channel in available_channels['channels']:
@@ -1159,8 +1181,8 @@ self.handle_confirm_remove_pair,
                 raise ValueError("Invalid callback data format")
 
             # 获取频道信息用于显示
-            monitor_info = self.db.get_channel_info(monitor_id)
-            forward_info = self.db.get_channel_info(forward_id)
+            monitor_info = await self.db.get_channel_info(monitor_id)
+            forward_info = await self.db.get_channel_info(forward_id)
 
             if not monitor_info or not forward_info:
                 await query.message.edit_text(
@@ -1171,7 +1193,7 @@ self.handle_confirm_remove_pair,
                 )
                 return
 
-            success = self.db.add_channel_pair(monitor_id, forward_id)
+            success = await self.db.add_channel_pair(monitor_id, forward_id)
 
             if success:
                 await query.message.edit_text(
@@ -1205,6 +1227,55 @@ self.handle_confirm_remove_pair,
                 ]])
             )
 
+    async def handle_pair_send_mode(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """处理配对发送方式切换"""
+        query = update.callback_query
+        await query.answer()
+
+        user_id = update.effective_user.id
+        lang = self.db.get_user_language(user_id)
+
+        try:
+            parts = query.data.split('_')
+            monitor_id = int(parts[2])
+            forward_id = int(parts[3])
+            send_mode = parts[4]
+
+            forward_info = await self.db.get_channel_info(forward_id)
+            if not forward_info:
+                await query.message.edit_text(
+                    get_text(lang, 'channel_not_found'),
+                    reply_markup=InlineKeyboardMarkup([[
+                        InlineKeyboardButton(get_text(lang, 'back'), callback_data=f"manage_pair_{monitor_id}_1")
+                    ]])
+                )
+                return
+
+            if await self.db.set_pair_send_mode(monitor_id, forward_id, send_mode):
+                text = get_text(lang, 'send_mode_changed',
+                                forward=forward_info['channel_name'],
+                                mode=get_text(lang, f"send_mode_{send_mode.lower()}"))
+            else:
+                text = get_text(lang, 'send_mode_change_failed')
+
+            await query.message.edit_text(
+                text,
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton(
+                        get_text(lang, 'back_to_pairs_management'),
+                        callback_data=f"manage_pair_{monitor_id}_1"
+                    )
+                ]])
+            )
+        except Exception as e:
+            logging.error(f"Error in handle_pair_send_mode: {e}")
+            await query.message.edit_text(
+                get_text(lang, 'error_occurred'),
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton(get_text(lang, 'back'), callback_data="view_pairs")
+                ]])
+            )
+
     async def handle_remove_specific_pair(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """处理移除配对"""
         query = update.callback_query
@@ -1219,8 +1290,8 @@ self.handle_confirm_remove_pair,
             forward_id = int(parts[3])
 
             # 获取频道信息用于显示
-            monitor_info = self.db.get_channel_info(monitor_id)
-            forward_info = self.db.get_channel_info(forward_id)
+            monitor_info = await self.db.get_channel_info(monitor_id)
+            forward_info = await self.db.get_channel_info(forward_id)
 
             if not monitor_info or not forward_info:
                 await query.message.edit_text(
@@ -1275,7 +1346,7 @@ self.handle_confirm_remove_pair,
             monitor_id = int(parts[3])
             forward_id = int(parts[4])
 
-            success = self.db.remove_channel_pair(monitor_id, forward_id)
+            success = await self.db.remove_channel_pair(monitor_id, forward_id)
 
             if success:
                 await query.message.edit_text(
@@ -1354,7 +1425,7 @@ self.handle_confirm_remove_pair,
         lang = self.db.get_user_language(user_id)
 
         # 获取所有频道配对
-        pairs = self.db.get_all_channel_pairs()
+        pairs = await self.db.get_all_channel_pairs()
 
         if not pairs:
             await query.message.edit_text(
@@ -1388,7 +1459,7 @@ self.handle_confirm_remove_pair,
         lang = self.db.get_user_language(user_id)
 
         # 获取所有频道配对
-        pairs = self.db.get_all_channel_pairs()
+        pairs = await self.db.get_all_channel_pairs()
 
         if not pairs:
             await query.message.edit_text(
@@ -1413,6 +1484,118 @@ self.handle_confirm_remove_pair,
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
+    async def get_pair(self, pair_id: str) -> Optional[Dict[str, Any]]:
+        """按 "monitor_id:forward_id" 查找频道配对"""
+        pairs = await self.db.get_all_channel_pairs()
+        return next((pair for pair in pairs if pair['pair_id'] == pair_id), None)
+
+    async def show_pair_time_settings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """显示频道配对的时间设置和时区选择"""
+        query = update.callback_query
+        await query.answer()
+
+        user_id = update.effective_user.id
+        lang = self.db.get_user_language(user_id)
+
+        try:
+            pair_id = query.data[len('time_pair_'):]
+            pair = await self.get_pair(pair_id)
+            if not pair:
+                await query.message.edit_text(
+                    get_text(lang, 'no_pairs'),
+                    reply_markup=InlineKeyboardMarkup([[
+                        InlineKeyboardButton(get_text(lang, 'back'), callback_data="add_time_filter")
+                    ]])
+                )
+                return
+
+            text = get_text(lang, 'pair_time_settings',
+                            monitor=pair['monitor_name'],
+                            forward=pair['forward_name'],
+                            timezone=pair['timezone'] or get_text(lang, 'server_timezone')) + "\n\n"
+
+            filters = await self.db.get_time_filters(pair_id)
+            if not filters:
+                text += get_text(lang, 'no_time_filters') + "\n"
+            else:
+                for filter in filters:
+                    mode = get_text(lang, filter['mode'].lower())
+                    text += f"- {mode}: {filter['start_time']}-{filter['end_time']} ({filter['days_of_week']})\n"
+
+            # 每行两个时区按钮，当前时区前加 ✅
+            keyboard = []
+            row = []
+            for index, tz_name in enumerate(TIMEZONE_CHOICES):
+                label = tz_name or get_text(lang, 'server_timezone')
+                if tz_name == (pair['timezone'] or None):
+                    label = f"✅ {label}"
+                row.append(InlineKeyboardButton(label, callback_data=f"pair_tz_{pair_id}_{index}"))
+                if len(row) == 2:
+                    keyboard.append(row)
+                    row = []
+            if row:
+                keyboard.append(row)
+            keyboard.append([InlineKeyboardButton(get_text(lang, 'back'), callback_data="add_time_filter")])
+
+            try:
+                await query.message.edit_text(
+                    text,
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+            except BadRequest as e:
+                if not str(e).startswith("Message is not modified"):
+                    raise
+
+        except Exception as e:
+            logging.error(f"Error in show_pair_time_settings: {e}")
+            await query.message.edit_text(
+                get_text(lang, 'error_occurred'),
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton(get_text(lang, 'back'), callback_data="time_settings")
+                ]])
+            )
+
+    async def handle_pair_timezone(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """处理配对时区设置"""
+        query = update.callback_query
+        await query.answer()
+
+        user_id = update.effective_user.id
+        lang = self.db.get_user_language(user_id)
+
+        try:
+            pair_id, index = query.data[len('pair_tz_'):].rsplit('_', 1)
+            tz_name = TIMEZONE_CHOICES[int(index)]
+            pair = await self.get_pair(pair_id)
+
+            # 系统缺少时区数据时不保存，避免静默使用服务器本地时区
+            success = False
+            if pair and (tz_name is None or load_timezone(tz_name) is not None):
+                success = await self.db.set_pair_timezone(pair['monitor_id'], pair['forward_id'], tz_name)
+
+            if success:
+                text = get_text(lang, 'timezone_changed',
+                                monitor=pair['monitor_name'],
+                                forward=pair['forward_name'],
+                                timezone=tz_name or get_text(lang, 'server_timezone'))
+            else:
+                text = get_text(lang, 'timezone_change_failed')
+
+            await query.message.edit_text(
+                text,
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton(get_text(lang, 'back'), callback_data=f"time_pair_{pair_id}")
+                ]])
+            )
+        except Exception as e:
+            logging.error(f"Error in handle_pair_timezone: {e}")
+            await query.message.edit_text(
+                get_text(lang, 'error_occurred'),
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton(get_text(lang, 'back'), callback_data="time_settings")
+                ]])
+            )
+
     async def show_filter_rules_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """显示过滤规则列表"""
         query = update.callback_query
@@ -1422,7 +1605,7 @@ self.handle_confirm_remove_pair,
         lang = self.db.get_user_language(user_id)
 
         # 获取所有频道配对
-        pairs = self.db.get_all_channel_pairs()
+        pairs = await self.db.get_all_channel_pairs()
 
         if not pairs:
             await query.message.edit_text(
@@ -1438,7 +1621,7 @@ self.handle_confirm_remove_pair,
         # 获取每个配对的过滤规则
         for pair in pairs:
             pair_id = pair['pair_id']
-            rules = self.db.get_filter_rules(pair_id)
+            rules = await self.db.get_filter_rules(pair_id)
 
             text += f"\n**{pair['monitor_name']} → {pair['forward_name']}**\n"
 
@@ -1467,7 +1650,7 @@ self.handle_confirm_remove_pair,
         lang = self.db.get_user_language(user_id)
 
         # 获取所有频道配对
-        pairs = self.db.get_all_channel_pairs()
+        pairs = await self.db.get_all_channel_pairs()
 
         if not pairs:
             await query.message.edit_text(
@@ -1483,7 +1666,7 @@ self.handle_confirm_remove_pair,
         # 获取每个配对的时间过滤器
         for pair in pairs:
             pair_id = pair['pair_id']
-            filters = self.db.get_time_filters(pair_id)
+            filters = await self.db.get_time_filters(pair_id)
 
             text += f"\n**{pair['monitor_name']} → {pair['forward_name']}**\n"
 
@@ -2,6 +2,7 @@
 from dataclasses import dataclass
 import os
 from dotenv import load_dotenv
+from database import DEFAULT_CACHED_STATEMENTS, DEFAULT_PRAGMAS
 
 # 加载.env文件
 load_dotenv()
@@ -16,8 +17,60 @@ class Config:
     SESSION_NAME: str = os.getenv("SESSION_NAME", "forwarder_session")
     OWNER_ID: int = int(os.getenv("OWNER_ID", "0"))
     DATABASE_NAME: str = os.getenv("DATABASE_NAME", "forward_bot.db")
+    # SQLite 设置：日志模式、同步级别、内存映射和页缓存大小（MB）、每个连接缓存的语句数
+    # 未设置时使用 database.DEFAULT_PRAGMAS 中的默认值
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", DEFAULT_PRAGMAS['journal_mode'])
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", DEFAULT_PRAGMAS['synchronous'])
+    SQLITE_MMAP_SIZE_MB: int = int(os.getenv("SQLITE_MMAP_SIZE_MB", DEFAULT_PRAGMAS['mmap_size'] // (1024 * 1024)))
+    SQLITE_CACHE_SIZE_MB: int = int(os.getenv("SQLITE_CACHE_SIZE_MB", -DEFAULT_PRAGMAS['cache_size'] // 1024))
+    SQLITE_CACHED_STATEMENTS: int = int(os.getenv("SQLITE_CACHED_STATEMENTS", DEFAULT_CACHED_STATEMENTS))
+    # 转发关系保留策略：保留天数、每个源频道保留的消息数（0 表示不限制），以及清理间隔（小时）
+    FORWARD_RETENTION_DAYS: float = float(os.getenv("FORWARD_RETENTION_DAYS", "0"))
+    FORWARD_RETENTION_PER_CHAT: int = int(os.getenv("FORWARD_RETENTION_PER_CHAT", "0"))
+    FORWARD_PRUNE_INTERVAL_HOURS: float = float(os.getenv("FORWARD_PRUNE_INTERVAL_HOURS", "6"))
+    FORWARD_PRUNE_BATCH: int = int(os.getenv("FORWARD_PRUNE_BATCH", "1000"))
+    # 数据库后台备份：间隔（小时，0 表示关闭）、保留个数、保留天数（0 表示不按天数清理）
+    BACKUP_DIR: str = os.getenv("BACKUP_DIR", "data/backups")
+    BACKUP_INTERVAL_HOURS: float = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+    BACKUP_KEEP: int = int(os.getenv("BACKUP_KEEP", "7"))
+    BACKUP_MAX_AGE_DAYS: float = float(os.getenv("BACKUP_MAX_AGE_DAYS", "0"))
+    # 数据库读线程数（每个线程一个只读连接）
+    DB_READ_CONNECTIONS: int = int(os.getenv("DB_READ_CONNECTIONS", "2"))
+    # 转发关系写缓冲：攒够多少条或等待多少毫秒后写入一次
+    FORWARD_LOG_BATCH_SIZE: int = int(os.getenv("FORWARD_LOG_BATCH_SIZE", "100"))
+    FORWARD_LOG_FLUSH_MS: int = int(os.getenv("FORWARD_LOG_FLUSH_MS", "500"))
     # 默认语言设置
     DEFAULT_LANGUAGE: str = os.getenv("DEFAULT_LANGUAGE", "en")
+    # 接收队列设置
+    INTAKE_WORKERS: int = int(os.getenv("INTAKE_WORKERS", "4"))
+    INTAKE_QUEUE_SIZE: int = int(os.getenv("INTAKE_QUEUE_SIZE", "1000"))
+    # 同时向多少个转发目标发送
+    FANOUT_CONCURRENCY: int = int(os.getenv("FANOUT_CONCURRENCY", "32"))
+    # 发送通道中最多积压的任务数，超过后暂停接收新消息
+    FANOUT_MAX_PENDING: int = int(os.getenv("FANOUT_MAX_PENDING", "1000"))
+    # 媒体组收集等待时间（秒），超过该时间没有新成员即视为收齐
+    ALBUM_DEBOUNCE: float = float(os.getenv("ALBUM_DEBOUNCE", "1.0"))
+    # 媒体组同时下载的媒体数
+    ALBUM_DOWNLOAD_CONCURRENCY: int = int(os.getenv("ALBUM_DOWNLOAD_CONCURRENCY", "5"))
+    # 大文件分段下载：连接数和启用阈值（MB），连接数为 1 时使用单连接下载
+    DOWNLOAD_CONNECTIONS: int = int(os.getenv("DOWNLOAD_CONNECTIONS", "4"))
+    PARALLEL_DOWNLOAD_THRESHOLD_MB: int = int(os.getenv("PARALLEL_DOWNLOAD_THRESHOLD_MB", "10"))
+    # 不超过该大小（MB）的视频和文档边下载边上传，0 表示关闭；使用本地 Bot API 服务器时可以调大
+    PIPELINE_UPLOAD_MAX_MB: int = int(os.getenv("PIPELINE_UPLOAD_MAX_MB", "50"))
+    # 目标频道验证缓存（秒）
+    DESTINATION_CACHE_TTL: float = float(os.getenv("DESTINATION_CACHE_TTL", "3600"))
+    DESTINATION_CACHE_NEGATIVE_TTL: float = float(os.getenv("DESTINATION_CACHE_NEGATIVE_TTL", "300"))
+    # 回复链缓存保留的消息数
+    REPLY_CACHE_SIZE: int = int(os.getenv("REPLY_CACHE_SIZE", "10000"))
+    # 本地媒体缓存
+    MEDIA_CACHE_DIR: str = os.getenv("MEDIA_CACHE_DIR", "data/media_cache")
+    MEDIA_CACHE_MAX_MB: int = int(os.getenv("MEDIA_CACHE_MAX_MB", "2048"))
+    # Bot API 发送限速
+    SEND_GLOBAL_RATE: float = float(os.getenv("SEND_GLOBAL_RATE", "25"))  # 每秒
+    SEND_GLOBAL_BURST: float = float(os.getenv("SEND_GLOBAL_BURST", "5"))
+    SEND_CHAT_PER_MINUTE: float = float(os.getenv("SEND_CHAT_PER_MINUTE", "20"))
+    SEND_CHAT_BURST: float = float(os.getenv("SEND_CHAT_BURST", "3"))
+    SEND_MAX_RETRIES: int = int(os.getenv("SEND_MAX_RETRIES", "5"))
 
     def __post_init__(self):
         """验证必要的配置是否存在"""
@@ -0,0 +1,199 @@
+# content_filter.py
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # 可选依赖，未安装时使用纯 Python 实现
+    ahocorasick = None
+
+# 规则类型标记，可以按位组合
+WHITELIST = 1
+BLACKLIST = 2
+
+RULE_TYPE_FLAGS = {
+    'WHITELIST': WHITELIST,
+    'BLACKLIST': BLACKLIST
+}
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多关键词匹配自动机
+
+    安装了 pyahocorasick 时使用其 C 实现；否则构建时把失败链接展开成完整的
+    状态转移表，扫描时每个字符只需一次字典查找。两种实现的耗时都与文本长度成正比，
+    与关键词数量无关。
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, int]]):
+        keywords = [(keyword, flag) for keyword, flag in keywords if keyword]
+        self._native = None
+        if ahocorasick is not None:
+            native = ahocorasick.Automaton()
+            for keyword, flag in keywords:
+                native.add_word(keyword, native.get(keyword, 0) | flag)
+            native.make_automaton()
+            self._native = native
+            return
+
+        goto: List[Dict[str, int]] = [{}]
+        output: List[int] = [0]
+
+        # 构建关键词前缀树
+        for keyword, flag in keywords:
+            state = 0
+            for ch in keyword:
+                next_state = goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][ch] = next_state
+                    goto.append({})
+                    output.append(0)
+                state = next_state
+            output[state] |= flag
+
+        # 按层次计算失败链接，并把失败状态的转移合并进来
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            output[state] |= output[fail[state]]
+            transitions = dict(delta[fail[state]])
+            for ch, next_state in goto[state].items():
+                fail[next_state] = delta[fail[state]].get(ch, 0)
+                transitions[ch] = next_state
+                queue.append(next_state)
+            delta[state] = transitions
+
+        self._delta = delta
+        self._output = output
+
+    def scan(self, text: str, stop_mask: int = 0) -> int:
+        """扫描文本，返回所有命中关键词的标记（按位或）
+
+        一旦命中 stop_mask 中的标记立即返回。
+        """
+        found = 0
+        if self._native is not None:
+            for _, flags in self._native.iter(text):
+                found |= flags
+                if found & stop_mask:
+                    break
+            return found
+
+        delta = self._delta
+        output = self._output
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            flags = output[state]
+            if flags:
+                found |= flags
+                if found & stop_mask:
+                    break
+        return found
+
+
+def _compile_regex_group(patterns: List[str]) -> List[re.Pattern]:
+    """预编译一组正则，不含捕获组的表达式尽量合并成一个交替式"""
+    compiled = []
+    mergeable = []
+    for pattern in patterns:
+        try:
+            regex = re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            # 无效的正则永远不会匹配，与逐条匹配时的行为一致
+            logging.warning(f"忽略无效的正则过滤规则 {pattern!r}: {e}")
+            continue
+        # 带捕获组的表达式合并后反向引用的编号会变化，单独保留
+        if regex.groups:
+            compiled.append(regex)
+        else:
+            mergeable.append((pattern, regex))
+
+    if len(mergeable) > 1:
+        try:
+            merged = re.compile('|'.join(f"(?:{pattern})" for pattern, _ in mergeable), re.IGNORECASE)
+            compiled.insert(0, merged)
+            return compiled
+        except re.error:
+            # 例如包含只能出现在开头的全局内联标记，退回逐条匹配
+            pass
+    compiled[:0] = [regex for _, regex in mergeable]
+    return compiled
+
+
+class ContentFilter:
+    """单个频道配对的编译后内容过滤器
+
+    与逐条调用 match_rule 的语义一致：
+    - 有白名单规则时，至少命中一条才允许
+    - 命中任一黑名单规则则拒绝
+    - KEYWORD 规则忽略大小写做子串匹配，REGEX 规则使用 re.IGNORECASE 搜索
+    """
+
+    def __init__(self, rules: Iterable[Tuple[str, str, str]]):
+        keywords = []
+        regex_patterns = {WHITELIST: [], BLACKLIST: []}
+        self.has_whitelist = False
+
+        for rule_type, filter_mode, pattern in rules:
+            flag = RULE_TYPE_FLAGS.get(rule_type)
+            if not flag:
+                continue
+            if flag == WHITELIST:
+                self.has_whitelist = True
+            if not pattern:
+                continue
+            if filter_mode == 'KEYWORD':
+                keywords.append((pattern.lower(), flag))
+            elif filter_mode == 'REGEX':
+                regex_patterns[flag].append(pattern)
+
+        self.automaton = KeywordAutomaton(keywords) if keywords else None
+        self.whitelist_regexes = _compile_regex_group(regex_patterns[WHITELIST])
+        self.blacklist_regexes = _compile_regex_group(regex_patterns[BLACKLIST])
+
+    def is_allowed(self, content: str) -> bool:
+        """检查内容是否通过过滤"""
+        found = 0
+        if self.automaton:
+            # 文本只做一次大小写归一化
+            found = self.automaton.scan(content.lower(), stop_mask=BLACKLIST)
+            if found & BLACKLIST:
+                return False
+
+        # 白名单未命中时无需再检查黑名单正则
+        if self.has_whitelist and not found & WHITELIST:
+            if not any(regex.search(content) for regex in self.whitelist_regexes):
+                return False
+
+        for regex in self.blacklist_regexes:
+            if regex.search(content):
+                return False
+
+        return True
+
+
+@lru_cache(maxsize=1024)
+def _compile_cached(rules: Tuple[Tuple[str, str, str], ...]) -> ContentFilter:
+    return ContentFilter(rules)
+
+
+def compile_content_filter(filter_rules: Iterable[Dict]) -> Optional[ContentFilter]:
+    """把过滤规则编译成 ContentFilter，没有规则时返回 None
+
+    相同的规则集合会复用已编译的结果，重建路由表时未变化的配对无需重新编译。
+    """
+    rules = tuple(
+        (rule.get('rule_type'), rule.get('filter_mode', 'KEYWORD'), rule.get('pattern') or '')
+        for rule in filter_rules
+    )
+    if not rules:
+        return None
+    return _compile_cached(rules)
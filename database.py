@@ -1,39 +1,91 @@
 # database.py
+import os
 import sqlite3
-from typing import List, Dict, Optional, Any
+from pathlib import Path
+from typing import List, Dict, Optional, Any, Iterable, Tuple
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+from routing import RoutingTable, build_routing_table
+
+# 检查其他连接是否修改过数据库的最小间隔（秒）
+ROUTING_CHECK_INTERVAL = 1.0
+
+# 连接打开时应用的 PRAGMA 设置，cache_size 为负数时单位是 KiB
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+# 每个连接缓存的预编译语句数
+DEFAULT_CACHED_STATEMENTS = 256
+
+# PRAGMA 查询时返回的数值
+_PRAGMA_VALUES = {
+    'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3},
+    'temp_store': {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2},
+}
+
+
+def _pragma_value(name: str, value: Any) -> Any:
+    """把 PRAGMA 设置值转换为查询时返回的形式"""
+    if name == 'journal_mode':
+        return str(value).lower()
+    if name in _PRAGMA_VALUES and isinstance(value, str):
+        return _PRAGMA_VALUES[name][value.upper()]
+    return int(value)
+
 
 class Database:
-    def __init__(self, db_name: str):
+    def __init__(self, db_name: str, readonly: bool = False, pragmas: Optional[Dict[str, Any]] = None,
+                 cached_statements: int = DEFAULT_CACHED_STATEMENTS):
         self.database_name = db_name
-        self.conn = sqlite3.connect(db_name)
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        if readonly:
+            # 只读连接：不初始化表结构，关闭时可能不在创建它的线程中
+            uri = Path(os.path.abspath(db_name)).as_uri() + '?mode=ro'
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                        cached_statements=cached_statements)
+            self.cursor = self.conn.cursor()
+            # 日志模式是数据库文件的属性，由写连接设置
+            self.pragmas.pop('journal_mode', None)
+            self.apply_pragmas()
+            return
+        self.conn = sqlite3.connect(db_name, cached_statements=cached_statements)
         self.cursor = self.conn.cursor()
+        # 新数据库在写入文件头（设置 WAL）之前启用增量 VACUUM，
+        # 已有数据库由 enable_incremental_vacuum 转换
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.apply_pragmas()
+        # 路由快照，只在配置变更时重建
+        self.routing = RoutingTable()
+        self._data_version = None
+        self._routing_checked_at = 0.0
         self.setup_database()
+        self.refresh_routing_table()
+
+    def apply_pragmas(self):
+        """应用 PRAGMA 设置"""
+        for name, value in self.pragmas.items():
+            try:
+                self.conn.execute(f"PRAGMA {name}={value}")
+            except sqlite3.Error as e:
+                logging.error(f"设置 PRAGMA {name}={value} 失败: {e}")
+
+    def check_pragmas(self) -> bool:
+        """检查 PRAGMA 设置是否生效"""
+        ok = True
+        for name, value in self.pragmas.items():
+            actual = self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+            if actual != _pragma_value(name, value):
+                logging.warning(f"PRAGMA {name} 未生效: 期望 {value}, 实际 {actual}")
+                ok = False
+        return ok
 
     def setup_database(self):
         """初始化数据库表"""
-        # 首先检查数据库是否已存在且有数据
-        import os
-        import time
-        import shutil
-
-        existing_db = os.path.exists(self.database_name) and os.path.getsize(self.database_name) > 0
-
-        # 如果数据库已存在，创建备份
-        if existing_db:
-            # 确保备份目录存在
-            backup_dir = "data/backups"
-            os.makedirs(backup_dir, exist_ok=True)
-
-            # 生成备份文件名
-            db_filename = os.path.basename(self.database_name)
-            backup_name = os.path.join(backup_dir, f"{db_filename}.backup_{int(time.time())}")
-
-            # 创建备份
-            shutil.copy2(self.database_name, backup_name)
-            logging.info(f"已创建数据库备份: {backup_name}")
-
         # 使用 CREATE TABLE IF NOT EXISTS 添加新表
         # 这样不会影响现有表和数据
         self.cursor.executescript('''
@@ -97,6 +149,10 @@ class Database:
                 PRIMARY KEY (original_chat_id, original_message_id, forwarded_chat_id)
             );
 
+            -- 按时间清理转发关系
+            CREATE INDEX IF NOT EXISTS idx_forwarded_messages_created_at
+            ON forwarded_messages(created_at);
+
             CREATE INDEX IF NOT EXISTS idx_channels_type
             ON channels(channel_type);
 
@@ -125,8 +181,50 @@ class Database:
             CREATE INDEX IF NOT EXISTS idx_time_filters_active
             ON time_filters(is_active);
         ''')
+
+        # 为已有数据库补充新增的列
+        self._ensure_column('channel_pairs', 'timezone', 'TEXT')  # 时间段过滤使用的时区，如 "Asia/Shanghai"
+        self._ensure_column('channel_pairs', 'send_mode', "TEXT DEFAULT 'BOT'")  # 'BOT' 或 'USER'（用户账号直接发送原媒体）
         self.conn.commit()
 
+    def _ensure_column(self, table: str, column: str, definition: str):
+        """如果表中不存在指定列则添加"""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in self.cursor.fetchall()]:
+            self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logging.info(f"已为表 {table} 添加列 {column}")
+
+    def _get_data_version(self) -> int:
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def refresh_routing_table(self):
+        """重建路由快照并整体替换"""
+        try:
+            routing = build_routing_table(self.conn.cursor())
+            self._data_version = self._get_data_version()
+            self._routing_checked_at = time.monotonic()
+            self.routing = routing
+        except sqlite3.Error as e:
+            # 重建失败时继续使用旧快照
+            logging.error(f"Error rebuilding routing table: {e}")
+
+    def get_routing_table(self) -> RoutingTable:
+        """获取当前路由快照
+
+        本连接的写操作会立即重建快照；其他进程对数据库文件的修改
+        通过 PRAGMA data_version 发现，最多每 ROUTING_CHECK_INTERVAL 秒检查一次。
+        """
+        now = time.monotonic()
+        if now - self._routing_checked_at >= ROUTING_CHECK_INTERVAL:
+            self._routing_checked_at = now
+            try:
+                if self._get_data_version() != self._data_version:
+                    logging.info("检测到数据库被外部修改，重建路由表")
+                    self.refresh_routing_table()
+            except sqlite3.Error as e:
+                logging.error(f"Error checking data_version: {e}")
+        return self.routing
+
     def get_user_language(self, user_id: int) -> str:
         """获取用户语言设置"""
         try:
@@ -140,6 +238,15 @@ class Database:
             logging.error(f"Error getting user language: {e}")
             return 'en'
 
+    def get_all_user_languages(self) -> Dict[int, str]:
+        """获取所有用户的语言设置"""
+        try:
+            self.cursor.execute('SELECT user_id, language FROM user_preferences')
+            return {user_id: language for user_id, language in self.cursor.fetchall() if language}
+        except sqlite3.Error as e:
+            logging.error(f"Error loading user languages: {e}")
+            return {}
+
     def set_user_language(self, user_id: int, language: str) -> bool:
         """设置用户语言偏好"""
         try:
@@ -194,6 +301,7 @@ class Database:
                 ''', (channel_id, channel_name, channel_username, channel_type))
 
             self.conn.commit()
+            self.refresh_routing_table()
             return True
         except sqlite3.Error as e:
             logging.error(f"Error in add_channel: {e}")
@@ -221,6 +329,7 @@ class Database:
 
             # 提交事务
             self.conn.commit()
+            self.refresh_routing_table()
             return True
         except sqlite3.Error as e:
             # 发生错误时回滚
@@ -444,7 +553,8 @@ class Database:
                     c.channel_id,
                     c.channel_name,
                     c.channel_username,
-                    cp.added_date
+                    cp.added_date,
+                    cp.send_mode
                 FROM channels c
                 JOIN channel_pairs cp ON c.channel_id = cp.forward_channel_id
                 WHERE cp.monitor_channel_id = ?
@@ -458,7 +568,8 @@ class Database:
                 'channel_id': row[0],
                 'channel_name': row[1],
                 'channel_username': row[2],
-                'added_date': row[3]
+                'added_date': row[3],
+                'send_mode': row[4] or 'BOT'
             } for row in self.cursor.fetchall()]
 
             return {
@@ -552,6 +663,7 @@ class Database:
 
             # 提交事务
             self.conn.commit()
+            self.refresh_routing_table()
             return True
 
         except sqlite3.Error as e:
@@ -573,11 +685,52 @@ class Database:
             ''', (monitor_channel_id, forward_channel_id))
 
             self.conn.commit()
+            self.refresh_routing_table()
             return True
         except sqlite3.Error as e:
             logging.error(f"Error in remove_channel_pair: {e}")
             return False
 
+    def set_pair_timezone(self, monitor_channel_id: int, forward_channel_id: int,
+                          timezone: Optional[str]) -> bool:
+        """设置频道配对的时间段过滤时区，None 表示使用服务器本地时区"""
+        try:
+            self.cursor.execute('''
+                UPDATE channel_pairs
+                SET timezone = ?
+                WHERE monitor_channel_id = ?
+                AND forward_channel_id = ?
+            ''', (timezone, monitor_channel_id, forward_channel_id))
+            self.conn.commit()
+            self.refresh_routing_table()
+            return self.cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error in set_pair_timezone: {e}")
+            return False
+
+    def set_pair_send_mode(self, monitor_channel_id: int, forward_channel_id: int, send_mode: str) -> bool:
+        """设置频道配对的发送方式
+
+        'BOT': Bot 下载后重新上传（默认）
+        'USER': 用户账号直接引用原媒体发送，原媒体引用被拒绝时改用 Bot 方式
+        """
+        if send_mode not in ('BOT', 'USER'):
+            logging.error(f"Invalid send_mode: {send_mode}")
+            return False
+        try:
+            self.cursor.execute('''
+                UPDATE channel_pairs
+                SET send_mode = ?
+                WHERE monitor_channel_id = ?
+                AND forward_channel_id = ?
+            ''', (send_mode, monitor_channel_id, forward_channel_id))
+            self.conn.commit()
+            self.refresh_routing_table()
+            return self.cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error in set_pair_send_mode: {e}")
+            return False
+
     # 过滤规则相关方法
     def add_filter_rule(self, pair_id: str, rule_type: str, filter_mode: str, pattern: str) -> bool:
         """添加过滤规则
@@ -594,6 +747,7 @@ class Database:
                 (pair_id, rule_type, filter_mode, pattern)
             )
             self.conn.commit()
+            self.refresh_routing_table()
             return True
         except Exception as e:
             logging.error(f"Error adding filter rule: {e}")
@@ -643,6 +797,7 @@ class Database:
                 (rule_id,)
             )
             self.conn.commit()
+            self.refresh_routing_table()
             return True
         except Exception as e:
             logging.error(f"Error removing filter rule: {e}")
@@ -665,6 +820,7 @@ class Database:
                 (pair_id, start_time, end_time, days_of_week, mode)
             )
             self.conn.commit()
+            self.refresh_routing_table()
             return True
         except Exception as e:
             logging.error(f"Error adding time filter: {e}")
@@ -715,6 +871,7 @@ class Database:
                 (filter_id,)
             )
             self.conn.commit()
+            self.refresh_routing_table()
             return True
         except Exception as e:
             logging.error(f"Error removing time filter: {e}")
@@ -726,7 +883,8 @@ class Database:
             self.cursor.execute(
                 """
                 SELECT cp.monitor_channel_id, cp.forward_channel_id,
-                       m.channel_name as monitor_name, f.channel_name as forward_name
+                       m.channel_name as monitor_name, f.channel_name as forward_name,
+                       cp.timezone
                 FROM channel_pairs cp
                 JOIN channels m ON cp.monitor_channel_id = m.channel_id
                 JOIN channels f ON cp.forward_channel_id = f.channel_id
@@ -741,6 +899,7 @@ class Database:
                     'forward_id': pair[1],
                     'monitor_name': pair[2],
                     'forward_name': pair[3],
+                    'timezone': pair[4],
                     'pair_id': f"{pair[0]}:{pair[1]}"
                 })
             return result
@@ -820,6 +979,7 @@ class Database:
                 VALUES (?, ?, ?, ?)
             ''', (pair_id, rule_type, filter_mode, pattern))
             self.conn.commit()
+            self.refresh_routing_table()
             return True
         except Exception as e:
             logging.error(f"添加过滤规则失败: {e}")
@@ -860,6 +1020,7 @@ class Database:
 
             self.cursor.execute(query, params)
             self.conn.commit()
+            self.refresh_routing_table()
             return self.cursor.rowcount > 0
         except Exception as e:
             logging.error(f"更新过滤规则失败: {e}")
@@ -870,6 +1031,7 @@ class Database:
         try:
             self.cursor.execute("UPDATE filter_rules SET is_active = 0 WHERE rule_id = ?", (rule_id,))
             self.conn.commit()
+            self.refresh_routing_table()
             return self.cursor.rowcount > 0
         except Exception as e:
             logging.error(f"删除过滤规则失败: {e}")
@@ -886,6 +1048,7 @@ class Database:
                 VALUES (?, ?, ?, ?, ?)
             ''', (pair_id, start_time, end_time, days_of_week, mode))
             self.conn.commit()
+            self.refresh_routing_table()
             return True
         except Exception as e:
             logging.error(f"添加时间段设置失败: {e}")
@@ -930,6 +1093,7 @@ class Database:
 
             self.cursor.execute(query, params)
             self.conn.commit()
+            self.refresh_routing_table()
             return self.cursor.rowcount > 0
         except Exception as e:
             logging.error(f"更新时间段设置失败: {e}")
@@ -940,6 +1104,7 @@ class Database:
         try:
             self.cursor.execute("UPDATE time_filters SET is_active = 0 WHERE filter_id = ?", (filter_id,))
             self.conn.commit()
+            self.refresh_routing_table()
             return self.cursor.rowcount > 0
         except Exception as e:
             logging.error(f"删除时间段设置失败: {e}")
@@ -970,7 +1135,8 @@ class Database:
                 WHERE type='index' AND sql IS NOT NULL
             """)
 
-            return True
+            # 检查 PRAGMA 设置
+            return self.check_pragmas()
         except sqlite3.Error as e:
             logging.error(f"Database health check failed: {e}")
             return False
@@ -992,17 +1158,27 @@ class Database:
     def save_forwarded_message(self, original_chat_id: int, original_message_id: int,
                               forwarded_chat_id: int, forwarded_message_id: int) -> bool:
         """保存消息转发关系"""
+        return self.save_forwarded_messages([
+            (original_chat_id, original_message_id, forwarded_chat_id, forwarded_message_id,
+             datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'))
+        ])
+
+    def save_forwarded_messages(self, rows: Iterable[Tuple[int, int, int, int, str]]) -> bool:
+        """在一个事务中保存多条转发关系
+
+        每行为 (原频道, 原消息, 目标频道, 目标消息, 创建时间)。
+        """
         try:
             query = """
             INSERT OR REPLACE INTO forwarded_messages
-            (original_chat_id, original_message_id, forwarded_chat_id, forwarded_message_id)
-            VALUES (?, ?, ?, ?)
+            (original_chat_id, original_message_id, forwarded_chat_id, forwarded_message_id, created_at)
+            VALUES (?, ?, ?, ?, ?)
             """
-            self.cursor.execute(query, (original_chat_id, original_message_id,
-                                      forwarded_chat_id, forwarded_message_id))
+            self.cursor.executemany(query, rows)
             self.conn.commit()
             return True
         except sqlite3.Error as e:
+            self.conn.rollback()
             logging.error(f"保存消息转发关系失败: {e}")
             return False
 
@@ -1027,4 +1203,122 @@ class Database:
             return None
         except sqlite3.Error as e:
             logging.error(f"获取转发消息关系失败: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def get_forwarded_messages(self, original_chat_id: int, original_message_ids: List[int],
+                               forwarded_chat_ids: List[int]) -> Dict[Tuple[int, int], int]:
+        """批量获取转发关系，返回 {(原消息ID, 目标频道ID): 转发消息ID}"""
+        result: Dict[Tuple[int, int], int] = {}
+        message_ids = list(dict.fromkeys(original_message_ids))
+        chat_ids = list(dict.fromkeys(forwarded_chat_ids))
+        if not message_ids or not chat_ids:
+            return result
+        # 参数总数不超过 SQLite 默认上限 999，消息ID过多时分批查询
+        step = max(1, 900 - len(chat_ids))
+        try:
+            for start in range(0, len(message_ids), step):
+                chunk = message_ids[start:start + step]
+                self.cursor.execute(f"""
+                    SELECT original_message_id, forwarded_chat_id, forwarded_message_id
+                    FROM forwarded_messages
+                    WHERE original_chat_id = ?
+                    AND original_message_id IN ({','.join('?' * len(chunk))})
+                    AND forwarded_chat_id IN ({','.join('?' * len(chat_ids))})
+                """, (original_chat_id, *chunk, *chat_ids))
+                for message_id, chat_id, forwarded_message_id in self.cursor.fetchall():
+                    result[(message_id, chat_id)] = forwarded_message_id
+            return result
+        except sqlite3.Error as e:
+            logging.error(f"批量获取转发消息关系失败: {e}")
+            return result
+
+    def delete_forwarded_messages_before(self, cutoff: str, limit: int) -> int:
+        """删除 created_at 早于 cutoff 的转发关系，最多删除 limit 条，返回删除的行数"""
+        try:
+            self.cursor.execute("""
+                DELETE FROM forwarded_messages WHERE rowid IN (
+                    SELECT rowid FROM forwarded_messages WHERE created_at < ? LIMIT ?
+                )
+            """, (cutoff, limit))
+            self.conn.commit()
+            return self.cursor.rowcount
+        except sqlite3.Error as e:
+            logging.error(f"清理转发关系失败: {e}")
+            return 0
+
+    def get_forwarded_prune_bounds(self, keep_per_chat: int) -> List[Tuple[int, int]]:
+        """获取每个源频道需要保留的最小消息ID
+
+        只返回转发关系超过 keep_per_chat 条源消息的频道，格式为 (源频道, 最小保留消息ID)。
+        源频道通过主键索引逐个跳跃查找，不扫描整张表。
+        """
+        try:
+            self.cursor.execute("""
+                WITH RECURSIVE chats(chat_id) AS (
+                    SELECT MIN(original_chat_id) FROM forwarded_messages
+                    UNION ALL
+                    SELECT (SELECT MIN(original_chat_id) FROM forwarded_messages
+                            WHERE original_chat_id > chats.chat_id)
+                    FROM chats WHERE chat_id IS NOT NULL
+                )
+                SELECT chat_id FROM chats WHERE chat_id IS NOT NULL
+            """)
+            chat_ids = [row[0] for row in self.cursor.fetchall()]
+            bounds = []
+            for chat_id in chat_ids:
+                self.cursor.execute("""
+                    SELECT DISTINCT original_message_id FROM forwarded_messages
+                    WHERE original_chat_id = ?
+                    ORDER BY original_message_id DESC
+                    LIMIT 1 OFFSET ?
+                """, (chat_id, keep_per_chat - 1))
+                row = self.cursor.fetchone()
+                if row:
+                    bounds.append((chat_id, row[0]))
+            return bounds
+        except sqlite3.Error as e:
+            logging.error(f"获取转发关系保留范围失败: {e}")
+            return []
+
+    def delete_forwarded_messages_below(self, original_chat_id: int, min_message_id: int, limit: int) -> int:
+        """删除源频道中消息ID小于 min_message_id 的转发关系，最多删除 limit 条，返回删除的行数"""
+        try:
+            self.cursor.execute("""
+                DELETE FROM forwarded_messages WHERE rowid IN (
+                    SELECT rowid FROM forwarded_messages
+                    WHERE original_chat_id = ? AND original_message_id < ?
+                    LIMIT ?
+                )
+            """, (original_chat_id, min_message_id, limit))
+            self.conn.commit()
+            return self.cursor.rowcount
+        except sqlite3.Error as e:
+            logging.error(f"清理转发关系失败: {e}")
+            return 0
+
+    def enable_incremental_vacuum(self) -> bool:
+        """已有数据库转换为增量 VACUUM 模式（需要执行一次完整 VACUUM），返回是否进行了转换"""
+        try:
+            if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 0:
+                return False
+            started = time.monotonic()
+            self.conn.commit()
+            self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self.conn.execute("VACUUM")
+            logging.info(f"数据库已转换为增量 VACUUM 模式，用时 {time.monotonic() - started:.1f}s")
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"转换增量 VACUUM 模式失败: {e}")
+            return False
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """回收最多 pages 个空闲页，返回剩余的空闲页数（未启用增量 VACUUM 时返回 0）"""
+        try:
+            if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 0
+            # execute 只执行一步，每次只回收一页；executescript 执行到结束
+            self.conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            return self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        except sqlite3.Error as e:
+            logging.error(f"增量 VACUUM 失败: {e}")
+            return 0
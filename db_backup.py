@@ -0,0 +1,160 @@
+# db_backup.py
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class _BackupAborted(Exception):
+    """分批备份被中止（停止运行或重新开始次数过多）"""
+
+
+class DatabaseBackup:
+    """在后台定期备份数据库
+
+    - 使用 sqlite3 在线备份 API，每次复制 pages 页后暂停 sleep 秒，不阻塞写入
+    - 备份期间其他连接写入会让 SQLite 从头重新复制，重新开始超过 max_restarts
+      次时改为一次复制完（WAL 模式下只持有读快照，同样不阻塞写入）
+    - 先写入 .tmp 文件，完成后再改名，备份目录中不会出现不完整的备份
+    - 按数量（keep）和保留天数（max_age_days）清理旧备份
+    """
+
+    def __init__(self, db_name: str, backup_dir: str = 'data/backups', interval_hours: float = 24,
+                 keep: int = 7, max_age_days: float = 0, pages: int = 1024, sleep: float = 0.05,
+                 max_restarts: int = 20):
+        self.db_name = db_name
+        self.backup_dir = backup_dir
+        self.interval = max(0.0, interval_hours) * 3600
+        self.keep = max(1, keep)
+        self.max_age = max(0.0, max_age_days) * 86400
+        self.pages = max(1, pages)
+        self.sleep = sleep
+        self.max_restarts = max_restarts
+        self.prefix = f"{os.path.basename(db_name)}.backup_"
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = False
+
+        # 统计信息
+        self.backups = 0
+        self.failures = 0
+        self.last_backup: Optional[str] = None
+
+    def start(self):
+        """启动定时备份任务，interval_hours 为 0 时不备份"""
+        if self.interval and self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """停止定时备份，正在进行的分批备份会在下一批后中止"""
+        self.stopping = True
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        # 距离上一次备份不足 interval 时等到期再备份，重启不会重复备份
+        backups = await asyncio.to_thread(self._list_backups)
+        if backups:
+            wait = backups[0][0] + self.interval - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        while True:
+            await self.backup_once()
+            await asyncio.sleep(self.interval)
+
+    async def backup_once(self) -> Optional[str]:
+        """备份一次并清理旧备份，返回备份文件路径"""
+        try:
+            path = await asyncio.to_thread(self._backup)
+        except Exception as e:
+            self.failures += 1
+            logging.error(f"数据库备份失败: {e}")
+            return None
+        self.backups += 1
+        self.last_backup = path
+        try:
+            await asyncio.to_thread(self._prune)
+        except OSError as e:
+            logging.error(f"清理旧数据库备份失败: {e}")
+        return path
+
+    def _backup(self) -> str:
+        if not os.path.exists(self.db_name):
+            raise FileNotFoundError(self.db_name)
+        os.makedirs(self.backup_dir, exist_ok=True)
+        path = os.path.join(self.backup_dir, f"{self.prefix}{int(time.time())}")
+        tmp_path = path + '.tmp'
+        started = time.monotonic()
+
+        uri = Path(os.path.abspath(self.db_name)).as_uri() + '?mode=ro'
+        source = sqlite3.connect(uri, uri=True)
+        target = sqlite3.connect(tmp_path)
+        try:
+            state = {'remaining': None, 'restarts': 0}
+
+            def progress(status: int, remaining: int, total: int):
+                if self.stopping:
+                    raise _BackupAborted("程序正在停止")
+                if state['remaining'] is not None and remaining > state['remaining']:
+                    state['restarts'] += 1
+                    if state['restarts'] > self.max_restarts:
+                        raise _BackupAborted("数据库写入频繁")
+                state['remaining'] = remaining
+
+            try:
+                source.backup(target, pages=self.pages, progress=progress, sleep=self.sleep)
+            except _BackupAborted:
+                if self.stopping:
+                    raise
+                logging.info(f"分批备份重新开始 {state['restarts']} 次，改为一次复制")
+                source.backup(target)
+        except BaseException:
+            target.close()
+            os.remove(tmp_path)
+            raise
+        finally:
+            source.close()
+        target.close()
+        os.replace(tmp_path, path)
+
+        size = os.path.getsize(path)
+        logging.info(f"已创建数据库备份: {path} ({size / (1024 * 1024):.1f}MB, "
+                     f"{time.monotonic() - started:.1f}s)")
+        return path
+
+    def _list_backups(self) -> List[Tuple[int, str]]:
+        """列出已有备份，按时间从新到旧排序"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        pattern = re.compile(re.escape(self.prefix) + r'(\d+)$')
+        backups = []
+        for name in os.listdir(self.backup_dir):
+            match = pattern.match(name)
+            if match:
+                backups.append((int(match.group(1)), os.path.join(self.backup_dir, name)))
+        return sorted(backups, reverse=True)
+
+    def _prune(self):
+        now = time.time()
+        for index, (timestamp, path) in enumerate(self._list_backups()):
+            if index >= self.keep or (self.max_age and now - timestamp > self.max_age):
+                os.remove(path)
+                logging.info(f"已删除旧数据库备份: {path}")
+        # 进程中断时留下的不完整备份
+        pattern = re.compile(re.escape(self.prefix) + r'\d+\.tmp$')
+        for name in os.listdir(self.backup_dir):
+            if pattern.match(name):
+                os.remove(os.path.join(self.backup_dir, name))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取备份统计信息"""
+        return {
+            'backups': self.backups,
+            'failures': self.failures,
+            'last_backup': self.last_backup
+        }
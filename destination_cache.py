@@ -0,0 +1,163 @@
+# destination_cache.py
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+from telegram import error as telegram_error
+
+# 表示目标频道不可用（不存在或没有权限）的错误信息
+DESTINATION_ERROR_MARKERS = (
+    'chat not found',
+    'not enough rights',
+    'have no rights',
+    'need administrator rights',
+    'chat_write_forbidden',
+    'channel_private',
+    'bot is not a member',
+    'bot was kicked',
+)
+
+
+def is_destination_error(error: Exception) -> bool:
+    """检查错误是否说明目标频道不可用"""
+    if isinstance(error, telegram_error.Forbidden):
+        return True
+    if isinstance(error, telegram_error.BadRequest):
+        message = str(error).lower()
+        return any(marker in message for marker in DESTINATION_ERROR_MARKERS)
+    return False
+
+
+class DestinationCache:
+    """转发目标频道可用性的 TTL 缓存
+
+    代替每次转发前调用 bot.get_chat：
+    - 验证成功的频道缓存 ttl 秒
+    - "Chat not found" 等错误缓存 negative_ttl 秒，期间直接跳过该频道
+    - 发送时出现权限或频道不存在错误会使缓存失效，下次转发重新验证
+    """
+
+    # 日志中显示的频道类别
+    label = '目标频道'
+
+    def __init__(self, bot, ttl: float = 3600, negative_ttl: float = 300):
+        self.bot = bot
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # chat_id -> (是否可用, 过期时间)
+        self.entries: Dict[Any, Tuple[bool, float]] = {}
+        # 正在验证的频道，避免并发转发时重复调用 get_chat
+        self.pending: Dict[Any, asyncio.Future] = {}
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, chat_id) -> Optional[bool]:
+        """读取缓存，未缓存或已过期时返回 None"""
+        entry = self.entries.get(chat_id)
+        if entry is None:
+            return None
+        available, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self.entries.pop(chat_id, None)
+            return None
+        return available
+
+    def set(self, chat_id, available: bool):
+        """记录验证结果"""
+        ttl = self.ttl if available else self.negative_ttl
+        self.entries[chat_id] = (available, time.monotonic() + ttl)
+
+    def invalidate(self, chat_id):
+        """移除频道的缓存"""
+        if self.entries.pop(chat_id, None) is not None:
+            self.invalidations += 1
+            logging.info(f"{self.label} {chat_id} 的验证缓存已失效")
+
+    def on_send_error(self, chat_id, error: Exception):
+        """发送失败时调用，权限或频道不存在错误会使缓存失效"""
+        if chat_id is not None and is_destination_error(error):
+            self.invalidate(chat_id)
+
+    async def is_available(self, chat_id) -> bool:
+        """检查目标频道是否可用，优先使用缓存"""
+        available = self.get(chat_id)
+        if available is not None:
+            self.hits += 1
+            return available
+
+        self.misses += 1
+        future = self.pending.get(chat_id)
+        if future is None:
+            future = asyncio.ensure_future(self._validate(chat_id))
+            self.pending[chat_id] = future
+            future.add_done_callback(lambda _: self.pending.pop(chat_id, None))
+        return await asyncio.shield(future)
+
+    async def _validate(self, chat_id) -> bool:
+        """调用 get_chat 验证频道"""
+        try:
+            chat = await self.bot.get_chat(chat_id)
+            available = bool(chat)
+        except telegram_error.RetryAfter:
+            raise
+        except Exception as e:
+            if not is_destination_error(e):
+                # 网络等临时错误不缓存，按可用处理，由发送结果决定
+                logging.warning(f"验证频道失败: {str(e)}")
+                return True
+            available = False
+
+        if not available:
+            logging.error(f"频道 {chat_id} 不存在或机器人无法访问，请检查权限或频道ID")
+        self.set(chat_id, available)
+        return available
+
+    async def prewarm(self, chat_ids: Iterable[Any]):
+        """启动时预先验证所有转发目标"""
+        chat_ids = [chat_id for chat_id in dict.fromkeys(chat_ids) if self.get(chat_id) is None]
+        if not chat_ids:
+            return
+        results = await asyncio.gather(*(self.is_available(chat_id) for chat_id in chat_ids),
+                                       return_exceptions=True)
+        available = sum(1 for result in results if result is True)
+        logging.info(f"{self.label}验证缓存已预热: {available}/{len(chat_ids)} 个频道可用")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+
+class SourceAccessCache(DestinationCache):
+    """监控频道能否被 Bot 读取的 TTL 缓存
+
+    Bot 是监控频道的成员（频道中为管理员）时，可以用 copyMessage 在服务器端
+    复制消息。复制失败时调用 invalidate，下次转发重新检查。
+    """
+
+    label = '源频道'
+
+    async def _validate(self, chat_id) -> bool:
+        """调用 get_chat_member 检查 Bot 是否在频道中"""
+        try:
+            member = await self.bot.get_chat_member(chat_id, self.bot.id)
+            available = member.status in ('creator', 'administrator', 'member')
+        except telegram_error.RetryAfter:
+            raise
+        except Exception as e:
+            if not isinstance(e, (telegram_error.BadRequest, telegram_error.Forbidden)):
+                # 网络等临时错误不缓存，按不可读取处理，使用下载上传方式
+                logging.warning(f"检查源频道 {chat_id} 失败: {str(e)}")
+                return False
+            available = False
+
+        logging.info(f"源频道 {chat_id} {'可以' if available else '不能'}使用 copyMessage 复制")
+        self.set(chat_id, available)
+        return available
@@ -0,0 +1,266 @@
+# dispatcher.py
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# 队列状态日志的输出间隔（秒）
+STATS_LOG_INTERVAL = 60
+
+
+class IntakeQueue:
+    """Telethon 事件与转发处理之间的有界接收队列
+
+    事件处理器只负责入队，真正的转发由工作协程完成，慢速上传不会阻塞
+    Telethon 的更新分发。事件按 chat_id 分配到固定的工作协程，同一频道的
+    新消息、编辑和删除事件保持原有顺序。
+
+    队列满时入队会等待（背压），并记录等待次数和时长。
+    """
+
+    def __init__(self, workers: int = 4, maxsize: int = 1000):
+        self.workers = max(1, workers)
+        # 每个工作协程一个子队列，总容量约等于 maxsize
+        self.shard_size = max(1, -(-maxsize // self.workers))
+        self.queues: List[asyncio.Queue] = []
+        self.tasks: List[asyncio.Task] = []
+        self.stats_task: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.backpressure_events = 0
+        self.backpressure_seconds = 0.0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def start(self):
+        """启动工作协程"""
+        if self.tasks:
+            return
+        self.queues = [asyncio.Queue(maxsize=self.shard_size) for _ in range(self.workers)]
+        self.tasks = [
+            asyncio.create_task(self._worker(index, queue))
+            for index, queue in enumerate(self.queues)
+        ]
+        self.stats_task = asyncio.create_task(self._log_stats())
+        logging.info(f"接收队列已启动: {self.workers} 个工作协程, 每个队列容量 {self.shard_size}")
+
+    async def stop(self, timeout: float = 10):
+        """停止工作协程，先在超时时间内处理完已入队的事件"""
+        if not self.tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self.queues)),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logging.warning(f"接收队列在 {timeout} 秒内未处理完，剩余 {self.depth} 个事件将被丢弃")
+
+        for task in self.tasks + [self.stats_task]:
+            if task:
+                task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.stats_task = None
+
+    @property
+    def depth(self) -> int:
+        """当前排队的事件数"""
+        return sum(queue.qsize() for queue in self.queues)
+
+    async def put(self, key: Any, handler: Callable[[Any], Awaitable[None]], event):
+        """把事件放入 key 对应的子队列"""
+        queue = self.queues[hash(key) % self.workers]
+        item = (time.monotonic(), handler, event)
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # 背压：等待工作协程腾出空间，期间 Telethon 会暂停分发新的更新
+            self.backpressure_events += 1
+            logging.warning(f"接收队列已满 (chat_id={key}, 排队={self.depth})，等待处理")
+            blocked_at = time.monotonic()
+            await queue.put(item)
+            self.backpressure_seconds += time.monotonic() - blocked_at
+
+        self.enqueued += 1
+        depth = self.depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    async def _worker(self, index: int, queue: asyncio.Queue):
+        """逐个处理子队列中的事件"""
+        while True:
+            enqueued_at, handler, event = await queue.get()
+            try:
+                wait = time.monotonic() - enqueued_at
+                self.total_wait += wait
+                if wait > self.max_wait:
+                    self.max_wait = wait
+                await handler(event)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"接收队列工作协程 {index} 处理事件时出错: {e}")
+            finally:
+                queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计信息"""
+        handled = self.processed + self.failed
+        return {
+            'workers': self.workers,
+            'capacity': self.shard_size * self.workers,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'avg_wait': self.total_wait / handled if handled else 0.0,
+            'max_wait': self.max_wait,
+            'backpressure_events': self.backpressure_events,
+            'backpressure_seconds': self.backpressure_seconds
+        }
+
+    async def _log_stats(self):
+        """定期输出队列状态，方便观察是否饱和"""
+        while True:
+            await asyncio.sleep(STATS_LOG_INTERVAL)
+            stats = self.get_stats()
+            logging.info(
+                "接收队列状态: 排队={depth}/{capacity}, 最大排队={max_depth}, 已处理={processed}, "
+                "失败={failed}, 平均等待={avg_wait:.3f}s, 最大等待={max_wait:.3f}s, "
+                "背压次数={backpressure_events} ({backpressure_seconds:.1f}s)".format(**stats)
+            )
+            # 最大值只统计一个周期
+            self.max_depth = stats['depth']
+            self.max_wait = 0.0
+
+
+class TargetLanes:
+    """按转发目标划分的 FIFO 发送通道
+
+    同一个目标频道的任务在各自的通道中依次执行，消息 N+1 不会先于消息 N
+    到达；不同目标之间并发执行，并发数由信号量限制。通道在首次使用时创建，
+    空闲一段时间后自动回收。
+
+    未完成的任务超过 max_pending 时 put 会等待（背压）。
+    """
+
+    def __init__(self, concurrency: int = 32, idle_timeout: float = 60, max_pending: int = 1000):
+        self.concurrency = max(1, concurrency)
+        self.idle_timeout = idle_timeout
+        self.max_pending = max(1, max_pending)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.lanes: Dict[Any, asyncio.Queue] = {}
+        self.tasks: Dict[Any, asyncio.Task] = {}
+        # 已提交但未完成的任务
+        self.unfinished: Set[asyncio.Future] = set()
+        self.space = asyncio.Event()
+        self.space.set()
+
+        # 统计信息
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.backpressure_events = 0
+        self.backpressure_seconds = 0.0
+
+    def submit(self, key: Any, job: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """把任务加入 key 对应的通道，返回任务结果的 Future"""
+        future = asyncio.get_running_loop().create_future()
+        queue = self.lanes.get(key)
+        if queue is None:
+            queue = asyncio.Queue()
+            self.lanes[key] = queue
+            self.tasks[key] = asyncio.create_task(self._run_lane(key, queue))
+        queue.put_nowait((job, future))
+        self.submitted += 1
+        self.unfinished.add(future)
+        if len(self.unfinished) >= self.max_pending:
+            self.space.clear()
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: asyncio.Future):
+        self.unfinished.discard(future)
+        if len(self.unfinished) < self.max_pending:
+            self.space.set()
+
+    async def put(self, key: Any, job: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """提交任务，未完成的任务过多时先等待，返回任务结果的 Future"""
+        if not self.space.is_set():
+            self.backpressure_events += 1
+            logging.warning(f"发送通道积压 {len(self.unfinished)} 个任务，等待处理")
+            blocked_at = time.monotonic()
+            while not self.space.is_set():
+                await self.space.wait()
+            self.backpressure_seconds += time.monotonic() - blocked_at
+        return self.submit(key, job)
+
+    async def run(self, jobs: List[Tuple[Any, Callable[[], Awaitable[Any]]]]) -> List[Any]:
+        """并发执行一组 (key, job)，按原顺序返回结果，出错的任务返回异常对象"""
+        futures = [self.submit(key, job) for key, job in jobs]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _run_lane(self, key: Any, queue: asyncio.Queue):
+        """依次执行通道中的任务"""
+        while True:
+            try:
+                job, future = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                # 检查和删除之间没有 await，不会与 submit 交错
+                if queue.empty():
+                    self.lanes.pop(key, None)
+                    self.tasks.pop(key, None)
+                    return
+                continue
+
+            if future.cancelled():
+                continue
+            try:
+                async with self.semaphore:
+                    result = await job()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.completed += 1
+                if not future.done():
+                    future.set_result(result)
+
+    async def stop(self, timeout: float = 30):
+        """停止所有通道，先在超时时间内执行完已提交的任务"""
+        if self.unfinished:
+            _, pending = await asyncio.wait(list(self.unfinished), timeout=timeout)
+            if pending:
+                logging.warning(f"发送通道在 {timeout} 秒内未处理完，剩余 {len(pending)} 个任务将被取消")
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.lanes.clear()
+        self.tasks.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取通道统计信息"""
+        return {
+            'lanes': len(self.lanes),
+            'concurrency': self.concurrency,
+            'pending': sum(queue.qsize() for queue in self.lanes.values()),
+            'unfinished': len(self.unfinished),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'backpressure_events': self.backpressure_events,
+            'backpressure_seconds': self.backpressure_seconds
+        }
@@ -0,0 +1,108 @@
+# file_id_cache.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+from telegram import error as telegram_error
+from reply_cache import LRUCache
+
+# 表示 file_id 不能再使用的错误信息
+FILE_ID_ERROR_MARKERS = (
+    'file identifier',
+    'wrong file',
+    'file_id',
+    'type of file mismatch',
+    'file reference',
+)
+
+
+def is_file_id_error(error: Exception) -> bool:
+    """检查错误是否由失效或类型不匹配的 file_id 引起"""
+    if not isinstance(error, telegram_error.BadRequest):
+        return False
+    message = str(error).lower()
+    return any(marker in message for marker in FILE_ID_ERROR_MARKERS)
+
+
+def extract_file_id(sent, media_type: str) -> Optional[str]:
+    """从 Bot API 返回的消息中取出上传文件的 file_id"""
+    if sent is None or isinstance(sent, bool):
+        return None
+    if media_type == 'photo' and getattr(sent, 'photo', None):
+        # 取最大尺寸
+        return sent.photo[-1].file_id
+    # 视频可能被 Telegram 识别为动画或文档，按顺序查找
+    for attr in (media_type, 'video', 'animation', 'document', 'sticker', 'audio', 'voice'):
+        media = getattr(sent, attr, None)
+        if media and not isinstance(media, (list, tuple)) and getattr(media, 'file_id', None):
+            return media.file_id
+    return None
+
+
+class FileIdCache:
+    """源媒体 → Bot API file_id 的缓存
+
+    第一个目标上传成功后记录 file_id，其余目标直接发送 file_id，同一媒体
+    只需下载和上传一次。media_id 对应的锁保证同一时间只有一个上传。
+    """
+
+    def __init__(self, ttl: float = 86400, maxsize: int = 5000):
+        self.ttl = ttl
+        # media_id -> (file_id, 媒体信息, 过期时间)
+        self.entries = LRUCache(maxsize)
+        # media_id -> (上传锁, 持有和等待锁的任务数)
+        self.locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+        # 统计信息
+        self.hits = 0
+        self.uploads = 0
+        self.invalidations = 0
+
+    def get(self, media_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """获取 (file_id, 媒体信息)，未缓存或过期时返回 None"""
+        entry = self.entries.get(media_id)
+        if entry is None:
+            return None
+        file_id, media_info, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self.entries.pop(media_id)
+            return None
+        return file_id, media_info
+
+    def set(self, media_id: str, file_id: str, media_info: Dict[str, Any]):
+        """记录上传后的 file_id，媒体信息中不保留本地文件路径"""
+        media_info = {key: value for key, value in media_info.items()
+                      if key not in ('file_path', 'thumb_path', 'timestamp')}
+        self.entries.set(media_id, (file_id, media_info, time.monotonic() + self.ttl))
+        self.uploads += 1
+
+    def invalidate(self, media_id: str):
+        """移除失效的 file_id"""
+        if self.entries.pop(media_id) is not None:
+            self.invalidations += 1
+
+    @asynccontextmanager
+    async def lock(self, media_id: str):
+        """持有 media_id 对应的上传锁，最后一个使用者退出后移除锁"""
+        lock, users = self.locks.get(media_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self.locks[media_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self.locks[media_id]
+            if users > 1:
+                self.locks[media_id] = (lock, users - 1)
+            else:
+                del self.locks[media_id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'uploads': self.uploads,
+            'invalidations': self.invalidations
+        }
@@ -47,6 +47,10 @@ TRANSLATIONS = {
         'select_pair_for_time': "Оберіть пару каналів для налаштування часу:",
         'no_filter_rules': "Немає фільтрів для цієї пари.",
         'no_time_filters': "Немає часових налаштувань для цієї пари.",
+        'pair_time_settings': "🕒 {monitor} → {forward}\n\nЧасовий пояс: {timezone}\nЧасові вікна перевіряються в цьому поясі. Оберіть часовий пояс:",
+        'server_timezone': "Локальний час сервера",
+        'timezone_changed': "✅ Часовий пояс для {monitor} → {forward} встановлено: {timezone}",
+        'timezone_change_failed': "❌ Не вдалося змінити часовий пояс",
         'filter_rule_added': "✅ Фільтр додано успішно",
         'time_filter_added': "✅ Часовий фільтр додано успішно",
         'filter_rule_deleted': "✅ Фільтр видалено",
@@ -151,6 +155,11 @@ TRANSLATIONS = {
     'available_channels': 'Доступні канали пересилання:',
     'add_pair_button': '➕ Додати {name}',
     'remove_pair_button': '❌ Видалити {name}',
+    'send_mode_button': '🔁 {name}: {mode}',
+    'send_mode_bot': 'Бот (повторне завантаження)',
+    'send_mode_user': 'Акаунт користувача (без завантаження)',
+    'send_mode_changed': '✅ Спосіб надсилання для {forward} змінено на: {mode}',
+    'send_mode_change_failed': '❌ Не вдалося змінити спосіб надсилання',
     'manage_pairs_button': 'Керувати парами для {name}',
     'error_occurred': 'Сталася помилка. Спробуйте ще раз.',
     'pair_management_title': "Керування парами каналів",
@@ -224,6 +233,10 @@ TRANSLATIONS = {
         'select_pair_for_time': "Выберите пару каналов для настройки времени:",
         'no_filter_rules': "Для этой пары нет правил фильтрации.",
         'no_time_filters': "Для этой пары нет временных настроек.",
+        'pair_time_settings': "🕒 {monitor} → {forward}\n\nЧасовой пояс: {timezone}\nВременные окна проверяются в этом поясе. Выберите часовой пояс:",
+        'server_timezone': "Локальное время сервера",
+        'timezone_changed': "✅ Часовой пояс для {monitor} → {forward} установлен: {timezone}",
+        'timezone_change_failed': "❌ Не удалось изменить часовой пояс",
         'filter_rule_added': "✅ Правило фильтрации успешно добавлено",
         'time_filter_added': "✅ Временной фильтр успешно добавлен",
         'filter_rule_deleted': "✅ Правило фильтрации удалено",
@@ -328,6 +341,11 @@ TRANSLATIONS = {
     'available_channels': 'Доступные каналы пересылки:',
     'add_pair_button': '➕ Добавить {name}',
     'remove_pair_button': '❌ Удалить {name}',
+    'send_mode_button': '🔁 {name}: {mode}',
+    'send_mode_bot': 'Бот (повторная загрузка)',
+    'send_mode_user': 'Аккаунт пользователя (без загрузки)',
+    'send_mode_changed': '✅ Способ отправки для {forward} изменён на: {mode}',
+    'send_mode_change_failed': '❌ Не удалось изменить способ отправки',
     'manage_pairs_button': 'Управлять парами для {name}',
     'error_occurred': 'Произошла ошибка. Пожалуйста, попробуйте снова.',
     'pair_management_title': 'Управление парами каналов',
@@ -402,6 +420,10 @@ TRANSLATIONS = {
         'select_pair_for_time': "Select a channel pair to configure time settings:",
         'no_filter_rules': "No filter rules configured for this pair.",
         'no_time_filters': "No time settings configured for this pair.",
+        'pair_time_settings': "🕒 {monitor} → {forward}\n\nTimezone: {timezone}\nTime windows are evaluated in this timezone. Select a timezone:",
+        'server_timezone': "Server local time",
+        'timezone_changed': "✅ Timezone for {monitor} → {forward} set to: {timezone}",
+        'timezone_change_failed': "❌ Failed to change the timezone",
         'filter_rule_added': "✅ Filter rule added successfully",
         'time_filter_added': "✅ Time filter added successfully",
         'filter_rule_deleted': "✅ Filter rule deleted successfully",
@@ -506,6 +528,11 @@ TRANSLATIONS = {
         'available_channels': 'Available Forward Channels:',
         'add_pair_button': '➕ Add {name}',
         'remove_pair_button': '❌ Remove {name}',
+        'send_mode_button': '🔁 {name}: {mode}',
+        'send_mode_bot': 'Bot re-upload',
+        'send_mode_user': 'User account, no re-upload',
+        'send_mode_changed': '✅ Send mode for {forward} set to: {mode}',
+        'send_mode_change_failed': '❌ Failed to change the send mode',
         'manage_pairs_button': 'Manage pairs for {name}',
         'error_occurred': 'An error occurred. Please try again.',
         'pair_management_title': "Channel Pair Management",
@@ -591,6 +618,10 @@ TRANSLATIONS = {
         'select_pair_for_time': "选择要配置时间设置的频道配对：",
         'no_filter_rules': "此配对没有配置过滤规则。",
         'no_time_filters': "此配对没有配置时间设置。",
+        'pair_time_settings': "🕒 {monitor} → {forward}\n\n时区：{timezone}\n时间段按此时区判断，请选择时区：",
+        'server_timezone': "服务器本地时间",
+        'timezone_changed': "✅ {monitor} → {forward} 的时区已设置为：{timezone}",
+        'timezone_change_failed': "❌ 修改时区失败",
         'filter_rule_added': "✅ 过滤规则添加成功",
         'time_filter_added': "✅ 时间过滤器添加成功",
         'filter_rule_deleted': "✅ 过滤规则删除成功",
@@ -701,6 +732,11 @@ TRANSLATIONS = {
         'available_channels': '可添加的转发频道：',
         'add_pair_button': '➕ 添加 {name}',
         'remove_pair_button': '❌ 移除 {name}',
+        'send_mode_button': '🔁 {name}：{mode}',
+        'send_mode_bot': 'Bot 重新上传',
+        'send_mode_user': '用户账号直接发送',
+        'send_mode_changed': '✅ {forward} 的发送方式已设置为：{mode}',
+        'send_mode_change_failed': '❌ 修改发送方式失败',
         'manage_pairs_button': '管理 {name} 的配对',
         'error_occurred': '发生错误，请重试。',
         'pair_management_title': "频道配对管理",
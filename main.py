@@ -4,11 +4,16 @@ import logging
 import os
 from telegram.ext import Application, CommandHandler
 from telethon import TelegramClient, events
-from database import Database
+from async_database import AsyncDatabase
+from database import DEFAULT_PRAGMAS
+from db_backup import DatabaseBackup
 from channel_manager import ChannelManager
 from config import Config
 from message_handler import MyMessageHandler
 from commands import BotCommands
+from dispatcher import IntakeQueue
+from rate_limiter import SendScheduler
+from upload_bridge import StreamingRequest
 from telegram import (
     Update,
     InlineKeyboardButton,
@@ -28,10 +33,31 @@ from locales import get_text
 class ForwardBot:
     def __init__(self, config):
         self.config = config
-        self.db = Database(config.DATABASE_NAME)
+        self.db = AsyncDatabase(
+            config.DATABASE_NAME,
+            read_connections=config.DB_READ_CONNECTIONS,
+            forward_batch_size=config.FORWARD_LOG_BATCH_SIZE,
+            forward_flush_ms=config.FORWARD_LOG_FLUSH_MS,
+            pragmas=dict(
+                DEFAULT_PRAGMAS,
+                journal_mode=config.SQLITE_JOURNAL_MODE,
+                synchronous=config.SQLITE_SYNCHRONOUS,
+                mmap_size=config.SQLITE_MMAP_SIZE_MB * 1024 * 1024,
+                cache_size=-config.SQLITE_CACHE_SIZE_MB * 1024,
+            ),
+            cached_statements=config.SQLITE_CACHED_STATEMENTS
+        )
+        self.backup = DatabaseBackup(
+            config.DATABASE_NAME,
+            backup_dir=config.BACKUP_DIR,
+            interval_hours=config.BACKUP_INTERVAL_HOURS,
+            keep=config.BACKUP_KEEP,
+            max_age_days=config.BACKUP_MAX_AGE_DAYS
+        )
 
         # Initialize Telegram bot
-        self.application = Application.builder().token(config.TELEGRAM_TOKEN).build()
+        # StreamingRequest 在线程中读取上传文件，并支持边下载边上传
+        self.application = Application.builder().token(config.TELEGRAM_TOKEN).request(StreamingRequest()).build()
 
         # Initialize Telethon client
         self.client = TelegramClient(
@@ -42,7 +68,37 @@ class ForwardBot:
 
         # Initialize components
         self.channel_manager = ChannelManager(self.db, config, self.client)
-        self.message_handler = MyMessageHandler(self.db, self.client, self.application.bot)
+        # 转发使用的 Bot API 调用统一经过发送调度器限速
+        self.send_scheduler = SendScheduler(
+            self.application.bot,
+            global_rate=config.SEND_GLOBAL_RATE,
+            global_burst=config.SEND_GLOBAL_BURST,
+            chat_per_minute=config.SEND_CHAT_PER_MINUTE,
+            chat_burst=config.SEND_CHAT_BURST,
+            max_retries=config.SEND_MAX_RETRIES
+        )
+        self.message_handler = MyMessageHandler(
+            self.db, self.client, self.send_scheduler,
+            fanout_concurrency=config.FANOUT_CONCURRENCY,
+            fanout_max_pending=config.FANOUT_MAX_PENDING,
+            destination_ttl=config.DESTINATION_CACHE_TTL,
+            destination_negative_ttl=config.DESTINATION_CACHE_NEGATIVE_TTL,
+            reply_cache_size=config.REPLY_CACHE_SIZE,
+            media_cache_dir=config.MEDIA_CACHE_DIR,
+            media_cache_max_bytes=config.MEDIA_CACHE_MAX_MB * 1024 * 1024,
+            album_debounce=config.ALBUM_DEBOUNCE,
+            album_download_concurrency=config.ALBUM_DOWNLOAD_CONCURRENCY,
+            download_connections=config.DOWNLOAD_CONNECTIONS,
+            parallel_download_threshold=config.PARALLEL_DOWNLOAD_THRESHOLD_MB * 1024 * 1024,
+            pipeline_upload_max_bytes=config.PIPELINE_UPLOAD_MAX_MB * 1024 * 1024
+        )
+        # 发送时出现权限或频道不存在错误，使目标频道的验证缓存失效
+        self.send_scheduler.add_error_listener(self.message_handler.destinations.on_send_error)
+        self.intake = IntakeQueue(
+            workers=config.INTAKE_WORKERS,
+            maxsize=config.INTAKE_QUEUE_SIZE
+        )
+        self.prewarm_task = None
 
         # Setup handlers
         self.setup_handlers()
@@ -168,29 +224,53 @@ class ForwardBot:
             # 启动 Telethon 客户端
             await self.client.start(phone=self.config.PHONE_NUMBER)
 
-            # 启动清理任务
+            # 启动清理任务、后台数据库备份和转发关系清理
             await self.message_handler.start_cleanup_task()
+            self.backup.start()
+            # 清理后的转发记录不再从回复链缓存中返回
+            self.db.add_prune_listener(self.message_handler.reply_cache.clear_forwards)
+            self.db.start_retention_task(
+                retention_days=self.config.FORWARD_RETENTION_DAYS,
+                keep_per_chat=self.config.FORWARD_RETENTION_PER_CHAT,
+                interval_hours=self.config.FORWARD_PRUNE_INTERVAL_HOURS,
+                batch_size=self.config.FORWARD_PRUNE_BATCH
+            )
+
+            # 启动接收队列，事件处理器只负责入队
+            await self.intake.start()
 
             # 注册消息处理器
             @self.client.on(events.NewMessage)
             async def handle_new_message(event):
-                await self.message_handler.handle_channel_message(event)
+                await self.intake.put(event.chat_id, self.message_handler.handle_channel_message, event)
 
             # 注册消息编辑处理器
             @self.client.on(events.MessageEdited)
             async def handle_edited_message(event):
-                await self.message_handler.handle_edited_message(event)
+                await self.intake.put(event.chat_id, self.message_handler.handle_edited_message, event)
 
             # 注册消息删除处理器
             @self.client.on(events.MessageDeleted)
             async def handle_deleted_message(event):
-                await self.message_handler.handle_deleted_message(event)
+                await self.intake.put(event.chat_id, self.message_handler.handle_deleted_message, event)
 
             # 启动机器人
             await self.application.initialize()
             await self.application.start()
             await self.application.updater.start_polling()
 
+            if not await self.db.check_database_health():
+                logging.warning("数据库健康检查未通过，详见上方日志")
+
+            # 后台预热目标频道验证缓存和源频道读取权限，不阻塞启动
+            pairs = await self.db.get_all_channel_pairs()
+            forward_ids = [int("-100" + str(pair['forward_id'])) for pair in pairs]
+            monitor_ids = [int("-100" + str(pair['monitor_id'])) for pair in pairs]
+            self.prewarm_task = asyncio.gather(
+                self.message_handler.destinations.prewarm(forward_ids),
+                self.message_handler.sources.prewarm(monitor_ids)
+            )
+
             print("Bot started successfully!")
 
             # 保持运行
@@ -206,8 +286,22 @@ class ForwardBot:
     async def stop(self):
         """停止机器人"""
         try:
+            # 处理完已入队的事件后停止接收队列
+            await self.intake.stop()
+            # 转发还在收集中的媒体组，再发送完通道中已提交的任务
+            await self.message_handler.albums.flush_all()
+            await self.message_handler.lanes.stop()
+            # 写入缓冲中的转发关系
+            await self.db.flush_forwarded_messages()
+            if self.prewarm_task:
+                self.prewarm_task.cancel()
+
             if self.message_handler.cleanup_task:
                 self.message_handler.cleanup_task.cancel()
+            await self.backup.stop()
+
+            # 保存媒体缓存索引
+            await self.message_handler.media_store.save()
 
             # 清理所有剩余的临时文件
             for file_path in list(self.message_handler.temp_files.keys()):
@@ -215,7 +309,7 @@ class ForwardBot:
 
             await self.application.stop()
             await self.client.disconnect()
-            self.db.cleanup()
+            await self.db.cleanup()
             print("Bot stopped successfully!")
         except Exception as e:
             logging.error(f"Error stopping bot: {e}")
@@ -0,0 +1,56 @@
+# media_io.py
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, BinaryIO, Optional
+from telegram import InputFile
+from upload_bridge import DownloadPipe
+
+
+@asynccontextmanager
+async def open_upload(path: str):
+    """在线程中打开待上传的文件，返回文件句柄，退出时关闭
+
+    文件句柄交给 python-telegram-bot 后由 StreamingRequest 在线程中
+    按块读取，不会把整个文件读入内存。
+    """
+    handle = await asyncio.to_thread(open, path, 'rb')
+    try:
+        yield handle
+    finally:
+        await asyncio.to_thread(handle.close)
+
+
+def as_input_file(media: Any, filename: Optional[str] = None, attach: bool = False):
+    """把文件句柄或 DownloadPipe 包装成流式上传的 InputFile，file_id 原样返回
+
+    放在 InputMedia 中上传时需要 attach=True。
+    """
+    if isinstance(media, (str, InputFile)) or not (hasattr(media, 'read') or isinstance(media, DownloadPipe)):
+        return media
+    if not filename:
+        filename = os.path.basename(getattr(media, 'name', '') or '') or None
+    return InputFile(media, filename=filename, attach=attach, read_file_handle=False)
+
+
+async def write_chunk(handle: BinaryIO, chunk: bytes):
+    """在线程中写入下载的数据块"""
+    await asyncio.to_thread(handle.write, chunk)
+
+
+async def sync_file(handle: BinaryIO):
+    """在线程中把已写入的数据同步到磁盘"""
+    def sync():
+        handle.flush()
+        os.fsync(handle.fileno())
+
+    await asyncio.to_thread(sync)
+
+
+async def read_file(path: str) -> bytes:
+    """在线程中读取小文件（如缩略图）"""
+    def read():
+        with open(path, 'rb') as f:
+            return f.read()
+
+    return await asyncio.to_thread(read)
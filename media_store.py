@@ -0,0 +1,243 @@
+# media_store.py
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+INDEX_FILE = 'index.json'
+# 旧版本和下载中断留下的临时文件前缀
+TEMP_PREFIX = 'tg_'
+# 持久化的媒体信息字段
+INFO_FIELDS = ('media_type', 'file_size', 'width', 'height', 'duration', 'filename')
+# 索引变更后等待多少秒再写入磁盘，期间的多次变更合并为一次写入
+SAVE_DELAY = 5.0
+
+
+def _file_name(media_id: str, media_type: str) -> str:
+    """由媒体ID生成缓存文件名"""
+    safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', media_id)
+    return f"{safe_id}.{media_type or 'bin'}"
+
+
+class MediaStore:
+    """按 Telegram 媒体ID寻址的本地媒体缓存
+
+    - 文件保存在 root 目录下，文件名由媒体ID生成
+    - index.json 记录每个文件的大小、最近使用时间和媒体信息，重启后继续使用
+    - 总大小超过 max_bytes 时按最近最少使用淘汰，持有租约的文件在租约全部释放后才会被淘汰
+    - 启动时清理下载中断留下的 tg_* 临时文件和不在索引中的文件
+    - 索引变更后延迟 save_delay 秒写入，序列化和写文件都在线程中进行
+    """
+
+    def __init__(self, root: str = 'data/media_cache', max_bytes: int = 2 * 1024 ** 3,
+                 save_delay: float = SAVE_DELAY):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.save_delay = save_delay
+        self.index_path = os.path.join(root, INDEX_FILE)
+        # media_id -> {'file': 文件名, 'size': 字节数, 'last_used': 时间戳, 'info': 媒体信息}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.total_bytes = 0
+        # 持有租约的文件，media_id -> 租约数
+        self.in_use: Dict[str, int] = {}
+        self.dirty = False
+        self.loaded = False
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self._save_lock = asyncio.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def load(self):
+        """加载索引并清理孤立文件"""
+        if self.loaded:
+            return
+        entries, removed = await asyncio.to_thread(self._load_and_sweep)
+        self.entries = entries
+        self.total_bytes = sum(entry['size'] for entry in entries.values())
+        self.loaded = True
+        logging.info(f"媒体缓存已加载: {len(entries)} 个文件, {self.total_bytes / (1024 * 1024):.1f}MB, "
+                     f"清理孤立文件 {removed} 个")
+        await self.evict()
+
+    def _load_and_sweep(self):
+        os.makedirs(self.root, exist_ok=True)
+        entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            logging.warning(f"媒体缓存索引损坏，将重新建立: {e}")
+
+        # 去掉文件已经不存在的记录
+        for media_id, entry in list(entries.items()):
+            path = os.path.join(self.root, entry.get('file', ''))
+            if not entry.get('file') or not os.path.isfile(path):
+                entries.pop(media_id)
+                continue
+            entry['size'] = os.path.getsize(path)
+
+        # 删除不在索引中的文件（包括 tg_* 临时文件）
+        known = {entry['file'] for entry in entries.values()}
+        known.add(INDEX_FILE)
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name in known or not os.path.isfile(path):
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logging.warning(f"清理孤立媒体文件失败 {path}: {e}")
+        return entries, removed
+
+    def __contains__(self, media_id: str) -> bool:
+        return media_id in self.entries
+
+    def get(self, media_id: str) -> Optional[Dict[str, Any]]:
+        """获取缓存的媒体信息（包含 file_path），未缓存时返回 None"""
+        entry = self.entries.get(media_id)
+        if entry is not None:
+            path = os.path.join(self.root, entry['file'])
+            if os.path.exists(path):
+                entry['last_used'] = time.time()
+                self.dirty = True
+                self.hits += 1
+                media_info = dict(entry.get('info', {}))
+                media_info['file_path'] = path
+                return media_info
+            # 文件被外部删除
+            self.entries.pop(media_id, None)
+            self.total_bytes -= entry['size']
+            self.dirty = True
+        self.misses += 1
+        return None
+
+    def owns(self, path: str) -> bool:
+        """检查路径是否是缓存管理的文件"""
+        if not path:
+            return False
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.root) \
+            and not os.path.basename(path).startswith(TEMP_PREFIX)
+
+    async def put(self, media_id: str, temp_path: str, media_info: Dict[str, Any]) -> Dict[str, Any]:
+        """把下载完成的临时文件加入缓存，返回包含 file_path 的媒体信息"""
+        media_type = media_info.get('media_type')
+        name = _file_name(media_id, media_type)
+        path = os.path.join(self.root, name)
+        await asyncio.to_thread(os.replace, temp_path, path)
+        size = await asyncio.to_thread(os.path.getsize, path)
+
+        old = self.entries.get(media_id)
+        if old is not None:
+            self.total_bytes -= old['size']
+        info = {key: media_info[key] for key in INFO_FIELDS if media_info.get(key) is not None}
+        self.entries[media_id] = {'file': name, 'size': size, 'last_used': time.time(), 'info': info}
+        self.total_bytes += size
+        self.dirty = True
+
+        await self.evict(keep=media_id)
+        self.schedule_save()
+
+        result = dict(info)
+        result['file_path'] = path
+        return result
+
+    @contextmanager
+    def lease(self, media_id: str):
+        """持有文件租约，租约全部释放前文件不会被淘汰删除"""
+        self.in_use[media_id] = self.in_use.get(media_id, 0) + 1
+        try:
+            yield
+        finally:
+            count = self.in_use.get(media_id, 0) - 1
+            if count > 0:
+                self.in_use[media_id] = count
+            else:
+                self.in_use.pop(media_id, None)
+                # 租约期间推迟的淘汰
+                if self.total_bytes > self.max_bytes:
+                    asyncio.ensure_future(self.evict())
+
+    async def evict(self, keep: Optional[str] = None):
+        """按最近最少使用淘汰文件，直到总大小不超过预算"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        candidates = sorted(
+            (entry['last_used'], media_id) for media_id, entry in self.entries.items()
+            if media_id != keep and media_id not in self.in_use
+        )
+        paths = []
+        for _, media_id in candidates:
+            if self.total_bytes <= self.max_bytes:
+                break
+            entry = self.entries.pop(media_id)
+            self.total_bytes -= entry['size']
+            paths.append(os.path.join(self.root, entry['file']))
+        if not paths:
+            return
+        self.evictions += len(paths)
+        self.dirty = True
+        self.schedule_save()
+        await asyncio.to_thread(self._remove_files, paths)
+        logging.info(f"媒体缓存淘汰 {len(paths)} 个文件，当前 {self.total_bytes / (1024 * 1024):.1f}MB")
+
+    @staticmethod
+    def _remove_files(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"删除缓存文件失败 {path}: {e}")
+
+    def schedule_save(self):
+        """save_delay 秒后写入索引，已经安排写入时不重复安排"""
+        if self._save_handle is None and self.loaded:
+            self._save_handle = asyncio.get_running_loop().call_later(
+                self.save_delay, lambda: asyncio.ensure_future(self.save()))
+
+    async def save(self):
+        """把索引写入磁盘（先写临时文件再替换）"""
+        if self._save_handle:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if not self.dirty or not self.loaded:
+            return
+        # 只在事件循环中复制字典，序列化在线程中进行（记录本身只会被整体替换或更新时间）
+        snapshot = dict(self.entries)
+        self.dirty = False
+        async with self._save_lock:
+            await asyncio.to_thread(self._write_index, snapshot)
+
+    def _write_index(self, snapshot: Dict[str, Dict[str, Any]]):
+        tmp_path = self.index_path + '.tmp'
+        try:
+            data = json.dumps(snapshot, ensure_ascii=False)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            self.dirty = True
+            logging.error(f"保存媒体缓存索引失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return {
+            'files': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -1,32 +1,71 @@
 # message_handler.py
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, utils
 import os
 import re
 import logging
 import traceback
 from typing import Optional, BinaryIO, Dict, List, Any, Tuple
 from tempfile import NamedTemporaryFile
+from contextlib import AsyncExitStack, ExitStack
 import asyncio
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta, time, timezone
 from telegram import error as telegram_error
 from locales import get_text
+from dispatcher import TargetLanes
+from destination_cache import DestinationCache, SourceAccessCache
+from reply_cache import ReplyCache, shorten
+from file_id_cache import FileIdCache, extract_file_id, is_file_id_error
+from media_store import MediaStore
+from album import AlbumAggregator
+from media_io import as_input_file, open_upload, read_file, sync_file, write_chunk
+from parallel_download import ParallelDownloader
+from upload_bridge import DownloadPipe, DownloadPipeError, StreamingRequest
+from user_resend import CAPTION_LIMIT, can_resend, is_reference_error, resend as user_resend
 
 class MyMessageHandler:
-    def __init__(self, db, client: TelegramClient, bot):
+    def __init__(self, db, client: TelegramClient, bot, fanout_concurrency: int = 32,
+                 fanout_max_pending: int = 1000,
+                 destination_ttl: float = 3600, destination_negative_ttl: float = 300,
+                 reply_cache_size: int = 10000, media_cache_dir: str = 'data/media_cache',
+                 media_cache_max_bytes: int = 2 * 1024 ** 3, album_debounce: float = 1.0,
+                 album_download_concurrency: int = 5, download_connections: int = 4,
+                 parallel_download_threshold: int = 10 * 1024 * 1024,
+                 pipeline_upload_max_bytes: int = 50 * 1024 * 1024):
         self.db = db
         self.client = client
         self.bot = bot
+        # 每个转发目标一个 FIFO 通道，目标之间并发发送
+        self.lanes = TargetLanes(concurrency=fanout_concurrency, max_pending=fanout_max_pending)
+        # 目标频道验证缓存
+        self.destinations = DestinationCache(bot, ttl=destination_ttl, negative_ttl=destination_negative_ttl)
+        # 监控频道能否被 Bot 读取，可以读取时用 copyMessage 复制媒体
+        self.sources = SourceAccessCache(bot, ttl=destination_ttl, negative_ttl=destination_negative_ttl)
+        # 最近的源消息和转发关系，用于解析回复链
+        self.reply_cache = ReplyCache(reply_cache_size)
+        # 正在获取的被回复消息，(频道ID, 消息ID) -> Future
+        self.reply_requests = {}
+        # 已上传媒体的 file_id，同一媒体只上传一次
+        self.file_ids = FileIdCache()
         # 用于跟踪临时文件
         self.temp_files = {}
         # 启动清理任务
         self.cleanup_task = None
-        # 媒体缓存
-        self.media_cache = {}
-        # 已处理的媒体组
-        self.processed_media_groups = set()
+        # 本地媒体缓存，按媒体ID保存已下载的文件
+        self.media_store = MediaStore(media_cache_dir, media_cache_max_bytes)
+        # 正在下载的媒体，media_id -> Future
+        self.media_downloads = {}
+        # 媒体组聚合器，收齐同一 grouped_id 的消息后一起转发
+        self.albums = AlbumAggregator(self.handle_album, debounce=album_debounce)
+        # 媒体组下载的并发数
+        self.album_downloads = asyncio.Semaphore(max(1, album_download_concurrency))
+        # 大文件多连接分段下载
+        self.parallel_downloader = ParallelDownloader(client, download_connections, parallel_download_threshold)
+        # 不超过该大小的视频和文档边下载边上传，0 表示关闭
+        self.pipeline_upload_max_bytes = pipeline_upload_max_bytes
 
     async def start_cleanup_task(self):
-        """启动定期清理任务"""
+        """加载媒体缓存并启动定期清理任务"""
+        await self.media_store.load()
         if self.cleanup_task is None:
             self.cleanup_task = asyncio.create_task(self.cleanup_old_files())
 
@@ -52,18 +91,8 @@ class MyMessageHandler:
                 for file_path in files_to_remove:
                     self.temp_files.pop(file_path, None)
 
-                # 清理媒体缓存
-                media_ids_to_remove = []
-                for media_id, media_info in list(self.media_cache.items()):
-                    if current_time - media_info.get('timestamp', current_time) > timedelta(minutes=10):  # 10分钟后清理
-                        media_ids_to_remove.append(media_id)
-
-                # 从缓存中移除过期的媒体
-                for media_id in media_ids_to_remove:
-                    self.media_cache.pop(media_id, None)
-
-                # 清理已处理的媒体组
-                self.processed_media_groups.clear()
+                # 保存媒体缓存索引（记录最近使用时间）
+                await self.media_store.save()
 
             except Exception as e:
                 logging.error(get_text('en', 'cleanup_task_error', error=str(e)))
@@ -71,13 +100,6 @@ class MyMessageHandler:
             # 每小时运行一次
             await asyncio.sleep(3600)
 
-    async def clear_media_cache(self, media_id, delay_seconds=600):
-        """延迟清理媒体缓存"""
-        await asyncio.sleep(delay_seconds)
-        if media_id in self.media_cache:
-            self.media_cache.pop(media_id, None)
-            logging.info(f"媒体缓存已清理: {media_id}")
-
     def get_media_id(self, message) -> str:
         """获取媒体文件的唯一标识"""
         try:
@@ -117,6 +139,114 @@ class MyMessageHandler:
         else:
             return 'unknown'
 
+    def get_route_targets(self, chat_id: int):
+        """从路由快照中获取频道的转发目标，不访问数据库"""
+        if chat_id is None:
+            return ()
+        # 事件中的 chat_id 带有 -100 前缀，数据库中存储的是不带前缀的ID
+        real_id, _ = utils.resolve_id(chat_id)
+        return self.db.get_routing_table().get_targets(real_id)
+
+    async def get_forwarded_record(self, original_chat_id: int, original_message_id: int,
+                             forwarded_chat_id: int) -> Optional[Dict[str, Any]]:
+        """获取转发关系，优先使用回复链缓存"""
+        if self.reply_cache.has_forward(original_chat_id, original_message_id, forwarded_chat_id):
+            forwarded_message_id = self.reply_cache.get_forward(original_chat_id, original_message_id, forwarded_chat_id)
+            if forwarded_message_id is None:
+                return None
+            return {
+                'original_chat_id': original_chat_id,
+                'original_message_id': original_message_id,
+                'forwarded_chat_id': forwarded_chat_id,
+                'forwarded_message_id': forwarded_message_id
+            }
+
+        record = await self.db.get_forwarded_message(original_chat_id, original_message_id, forwarded_chat_id)
+        self.reply_cache.remember_forward(original_chat_id, original_message_id, forwarded_chat_id,
+                                          record['forwarded_message_id'] if record else None)
+        return record
+
+    async def get_forwarded_records(self, original_chat_id: int, original_message_ids: List[int],
+                                    forwarded_chat_ids: List[int]) -> Dict[Tuple[int, int], int]:
+        """批量获取转发关系，返回 {(原消息ID, 目标频道ID): 转发消息ID}
+
+        优先使用回复链缓存，缓存中没有的记录合并为一次数据库查询。
+        """
+        result: Dict[Tuple[int, int], int] = {}
+        missing = []
+        for message_id in original_message_ids:
+            for chat_id in forwarded_chat_ids:
+                if self.reply_cache.has_forward(original_chat_id, message_id, chat_id):
+                    forwarded_message_id = self.reply_cache.get_forward(original_chat_id, message_id, chat_id)
+                    if forwarded_message_id is not None:
+                        result[(message_id, chat_id)] = forwarded_message_id
+                else:
+                    missing.append((message_id, chat_id))
+        if not missing:
+            return result
+
+        records = await self.db.get_forwarded_messages(
+            original_chat_id,
+            list(dict.fromkeys(message_id for message_id, _ in missing)),
+            list(dict.fromkeys(chat_id for _, chat_id in missing))
+        )
+        for key in missing:
+            self.reply_cache.remember_forward(original_chat_id, key[0], key[1], records.get(key))
+            if key in records:
+                result[key] = records[key]
+        return result
+
+    async def record_forward(self, original_chat_id: int, original_message_id: int,
+                       forwarded_chat_id: int, forwarded_message_id: int) -> bool:
+        """保存转发关系，同时写入回复链缓存"""
+        self.reply_cache.remember_forward(original_chat_id, original_message_id,
+                                          forwarded_chat_id, forwarded_message_id)
+        return await self.db.save_forwarded_message(original_chat_id, original_message_id,
+                                              forwarded_chat_id, forwarded_message_id)
+
+    async def get_reply_info(self, chat_id: int, message_id: int) -> Optional[Dict[str, Any]]:
+        """获取被回复消息的预览信息，最近经过的消息直接从缓存读取"""
+        short_content = self.reply_cache.get_message(chat_id, message_id)
+        if short_content is not None:
+            return {'id': message_id, 'short_content': short_content}
+
+        # 多个目标并发处理同一条回复时，只请求一次
+        request = self.reply_requests.get((chat_id, message_id))
+        if request is None:
+            request = asyncio.ensure_future(self.client.get_messages(chat_id, ids=message_id))
+            self.reply_requests[(chat_id, message_id)] = request
+            request.add_done_callback(lambda _: self.reply_requests.pop((chat_id, message_id), None))
+        original_reply_message = await asyncio.shield(request)
+        if not original_reply_message:
+            return None
+
+        reply_content = original_reply_message.text or original_reply_message.caption or ""
+        self.reply_cache.remember_message(chat_id, message_id, reply_content)
+        return {'id': original_reply_message.id, 'short_content': shorten(reply_content)}
+
+    async def submit_target_jobs(self, jobs, error_key: str = None):
+        """把任务放入各目标频道的 FIFO 通道，不等待发送完成
+
+        jobs 是 (target, job) 列表。每个目标的任务按提交顺序执行，不同目标
+        之间并发，单个目标失败不影响其他目标，失败时记录日志。
+        """
+        for target, job in jobs:
+            future = await self.lanes.put(target.forward_id, job)
+            future.add_done_callback(
+                lambda future, target=target: self.log_target_job_error(target, future, error_key))
+
+    def log_target_job_error(self, target, future: asyncio.Future, error_key: str = None):
+        """记录发送通道中任务的错误"""
+        if future.cancelled() or future.exception() is None:
+            return
+        error = future.exception()
+        if error_key:
+            logging.error(get_text('en', error_key,
+                                   channel_id=target.forward_id,
+                                   error=str(error)))
+        else:
+            logging.error(f"发送到频道 {target.forward_id} 失败: {error}")
+
     async def handle_channel_message(self, event):
         """处理频道消息"""
         try:
@@ -124,16 +254,18 @@ class MyMessageHandler:
             if not message:
                 return
 
-            chat = await event.get_chat()
-            channel_info = self.db.get_channel_info(chat.id)
-
-            if not channel_info or not channel_info.get('is_active'):
+            # 先用路由快照判断是否需要处理，避免为无关频道获取实体
+            targets = self.get_route_targets(event.chat_id)
+            if not targets:
                 return
 
-            # 获取所有转发频道
-            forward_channels = self.db.get_all_forward_channels(chat.id)
-            if not forward_channels:
+            # 媒体组消息先交给聚合器，收齐后由 handle_album 一起转发
+            if self.albums.add(event.chat_id, message):
                 return
+            # 先提交该频道正在收集的媒体组，保持消息顺序
+            await self.albums.flush_chat(event.chat_id)
+
+            chat = await event.get_chat()
 
             # 获取消息内容用于过滤
             content = ""
@@ -142,115 +274,88 @@ class MyMessageHandler:
             elif getattr(message, 'caption', None):
                 content = message.caption
 
-            # 获取当前时间
-            current_time = datetime.now()
-            current_time_str = current_time.strftime('%H:%M')
-            current_weekday = current_time.weekday() + 1  # 周一为1，周日为7
+            # 记录源消息预览，之后回复这条消息时无需再次获取
+            self.reply_cache.remember_message(chat.id, message.id, content)
 
-            for channel in forward_channels:
-                try:
-                    monitor_id = chat.id
-                    forward_id = channel.get('channel_id')
-
-                    # 检查时间段过滤
-                    if not self.check_time_filter(monitor_id, forward_id, current_time_str, current_weekday):
-                        logging.info(f"消息被时间段过滤器拦截: 监控频道={monitor_id}, 转发频道={forward_id}")
-                        continue
+            # 使用消息的发布时间判断时间段，积压的消息也按发布时间处理
+            message_date = getattr(message, 'date', None) or datetime.now(timezone.utc)
 
-                    # 检查内容过滤
-                    if content and not self.check_content_filter(monitor_id, forward_id, content):
-                        logging.info(f"消息被内容过滤器拦截: 监控频道={monitor_id}, 转发频道={forward_id}")
-                        continue
+            jobs = []
+            for target in targets:
+                # 检查时间段过滤
+                if not self.check_time_filter(target, message_date):
+                    logging.info(f"消息被时间段过滤器拦截: 监控频道={target.monitor_id}, 转发频道={target.forward_id}")
+                    continue
 
-                    # 通过所有过滤器，转发消息
-                    await self.handle_forward_message(message, chat, channel)
-                except Exception as e:
-                    logging.error(get_text('en', 'forward_channel_error',
-                                         channel_id=channel.get('channel_id'),
-                                         error=str(e)))
+                # 检查内容过滤
+                if content and not self.check_content_filter(target, content):
+                    logging.info(f"消息被内容过滤器拦截: 监控频道={target.monitor_id}, 转发频道={target.forward_id}")
                     continue
+
+                # 通过所有过滤器，放入目标频道的发送通道
+                jobs.append((target, lambda channel=target.channel: self.handle_forward_message(message, chat, channel)))
+
+            await self.submit_target_jobs(jobs, 'forward_channel_error')
         except Exception as e:
             logging.error(get_text('en', 'message_handler_error', error=str(e)))
             logging.error(get_text('en', 'error_details', details=traceback.format_exc()))
 
-    def check_time_filter(self, monitor_id: int, forward_id: int, current_time: str, current_weekday: int) -> bool:
-        """检查时间段过滤器"""
+    async def handle_album(self, messages):
+        """处理聚合完成的媒体组"""
         try:
-            # 获取时间段过滤器
-            time_filters = self.db.get_time_filters(monitor_id, forward_id)
+            first = messages[0]
+            targets = self.get_route_targets(first.chat_id)
+            if not targets:
+                return
 
-            # 如果没有过滤器，允许所有时间
-            if not time_filters:
-                return True
+            chat = await first.get_chat()
 
-            # 检查每个时间段过滤器
-            for filter_rule in time_filters:
-                # 检查当前星期是否在过滤器的星期范围内
-                days_of_week = filter_rule.get('days_of_week', '').split(',')
-                if days_of_week and str(current_weekday) not in days_of_week:
-                    continue
+            # 媒体组的说明文字通常只在其中一条消息上
+            caption_message = next((msg for msg in messages if getattr(msg, 'text', None)), first)
+            content = "\n".join(msg.text for msg in messages if getattr(msg, 'text', None))
+            for msg in messages:
+                self.reply_cache.remember_message(chat.id, msg.id, getattr(msg, 'text', None))
 
-                # 检查当前时间是否在过滤器的时间范围内
-                start_time = filter_rule.get('start_time')
-                end_time = filter_rule.get('end_time')
+            message_date = getattr(first, 'date', None) or datetime.now(timezone.utc)
 
-                if start_time and end_time:
-                    # 如果当前时间在范围内
-                    in_time_range = start_time <= current_time <= end_time
+            jobs = []
+            for target in targets:
+                if not self.check_time_filter(target, message_date):
+                    logging.info(f"媒体组被时间段过滤器拦截: 监控频道={target.monitor_id}, 转发频道={target.forward_id}")
+                    continue
+                if content and not self.check_content_filter(target, content):
+                    logging.info(f"媒体组被内容过滤器拦截: 监控频道={target.monitor_id}, 转发频道={target.forward_id}")
+                    continue
+                jobs.append((target, lambda channel=target.channel: self.handle_forward_message(
+                    caption_message, chat, channel, album=messages)))
 
-                    # 根据模式决定是否允许
-                    mode = filter_rule.get('mode', 'ALLOW')
-                    if mode == 'ALLOW' and in_time_range:
-                        return True
-                    elif mode == 'BLOCK' and in_time_range:
-                        return False
+            await self.submit_target_jobs(jobs, 'forward_channel_error')
+        except Exception as e:
+            logging.error(get_text('en', 'message_handler_error', error=str(e)))
+            logging.error(get_text('en', 'error_details', details=traceback.format_exc()))
 
-            # 如果没有匹配的规则，默认允许
-            return True
+    def check_time_filter(self, target, message_date: datetime) -> bool:
+        """检查时间段过滤器"""
+        try:
+            # 时间段在构建路由快照时已编译成位图，没有设置时允许所有时间
+            if not target.time_filter:
+                return True
+
+            return target.time_filter.is_allowed(message_date)
 
         except Exception as e:
             logging.error(f"检查时间段过滤器时出错: {e}")
             # 出错时默认允许
             return True
 
-    def check_content_filter(self, monitor_id: int, forward_id: int, content: str) -> bool:
+    def check_content_filter(self, target, content: str) -> bool:
         """检查内容过滤器"""
         try:
-            # 获取过滤规则
-            filter_rules = self.db.get_filter_rules(monitor_id, forward_id)
-
-            # 如果没有规则，允许所有内容
-            if not filter_rules:
+            # 过滤规则在构建路由快照时已编译，没有规则时允许所有内容
+            if not target.content_filter:
                 return True
 
-            # 分类规则
-            whitelist_rules = []
-            blacklist_rules = []
-
-            for rule in filter_rules:
-                if rule.get('rule_type') == 'WHITELIST':
-                    whitelist_rules.append(rule)
-                elif rule.get('rule_type') == 'BLACKLIST':
-                    blacklist_rules.append(rule)
-
-            # 如果有白名单规则，必须匹配至少一条才允许
-            if whitelist_rules:
-                whitelist_match = False
-                for rule in whitelist_rules:
-                    if self.match_rule(rule, content):
-                        whitelist_match = True
-                        break
-
-                if not whitelist_match:
-                    return False
-
-            # 如果有黑名单规则，匹配任一条则拒绝
-            for rule in blacklist_rules:
-                if self.match_rule(rule, content):
-                    return False
-
-            # 通过所有过滤
-            return True
+            return target.content_filter.is_allowed(content)
 
         except Exception as e:
             logging.error(f"检查内容过滤器时出错: {e}")
@@ -279,101 +384,410 @@ class MyMessageHandler:
             logging.error(f"匹配规则时出错: {e}")
             return False
 
-    async def handle_media_send(self, message, channel_id, media_type: str = None, reply_to_message_id: int = None, from_chat = None):
-        """处理媒体发送并确保清理"""
-        # 下载媒体文件
-        media_info = await self.download_media_file(message, media_type)
-        if not media_info:
-            logging.error("媒体文件下载失败")
-            return
-
-        file_path = media_info.get('file_path')
-        media_type = media_info.get('media_type')
+    async def send_media_once(self, message, media_type: str, send):
+        """发送媒体，同一媒体只下载和上传一次
 
-        try:
-            # 只有在没有回复消息时才添加说明文字
-            caption = None
-            if not reply_to_message_id and from_chat:
-                # 构建用户名部分
-                username = f"(@{from_chat.username})" if getattr(from_chat, 'username', None) else ""
-
-                # 使用简化的模板作为媒体文件的标题
-                caption = f"📨 转发自 {getattr(from_chat, 'title', 'Unknown Channel')} {username}"
-            elif message.text or message.caption:
-                caption = message.text or message.caption
-
-            # 发送文件
-            with open(file_path, 'rb') as media_file:
+        send(media, media_info) 负责实际发送，media 为 file_id 或文件内容。
+        第一个目标上传成功后记录 file_id，其余目标直接使用 file_id 发送；
+        file_id 失效时重新下载上传。下载失败时返回 None。
+        """
+        media_id = self.get_media_id(message)
+        for _ in range(2):
+            cached = self.file_ids.get(media_id)
+            if cached is None:
+                async with self.file_ids.lock(media_id):
+                    # 等待期间其他目标可能已经上传完成
+                    cached = self.file_ids.get(media_id)
+                    if cached is None:
+                        return await self.upload_media(message, media_type, media_id, send)
+
+            file_id, media_info = cached
+            try:
+                self.file_ids.hits += 1
+                return await send(file_id, media_info)
+            except telegram_error.BadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                logging.warning(f"file_id 已失效，重新上传媒体 {media_id}: {e}")
+                self.file_ids.invalidate(media_id)
+        return None
+
+    async def upload_media(self, message, media_type: str, media_id: str, send):
+        """下载媒体并上传，记录返回的 file_id"""
+        # 上传期间持有租约，文件不会被缓存淘汰；文件保留在缓存中，重发和失败重试时直接使用
+        with self.media_store.lease(media_id):
+            if self.can_pipeline_upload(message, media_type, media_id):
                 try:
-                    file_data = media_file.read()
-                    send_kwargs = {
-                        'chat_id': channel_id,
-                        'caption': caption,
-                        'read_timeout': 1800,
-                        'write_timeout': 1800
-                    }
+                    return await self.pipeline_upload(message, media_type, media_id, send)
+                except DownloadPipeError as e:
+                    logging.warning(f"边下载边上传失败，改为下载完成后上传: {e}")
 
-                    if reply_to_message_id:
-                        send_kwargs['reply_to_message_id'] = reply_to_message_id
+            media_info = await self.download_media_file(message, media_type)
+            if not media_info:
+                logging.error("媒体文件下载失败")
+                return None
 
-                    if media_type == 'photo':
-                        send_kwargs['photo'] = file_data
-                        await self.bot.send_photo(**send_kwargs)
-                    elif media_type == 'video':
-                        send_kwargs.update({
-                            'video': file_data,
-                            'supports_streaming': True
-                        })
+            try:
+                # 以文件句柄流式上传，不把整个文件读入内存
+                async with open_upload(media_info['file_path']) as media_file:
+                    sent = await send(media_file, media_info)
+
+                file_id = extract_file_id(sent, media_type)
+                if file_id:
+                    self.file_ids.set(media_id, file_id, media_info)
+                    logging.info(f"已记录媒体 {media_id} 的 file_id，其余目标将直接复用")
+                return sent
+            finally:
+                thumb_path = media_info.get('thumb_path')
+                if thumb_path and os.path.exists(thumb_path):
+                    os.remove(thumb_path)
+
+    def can_pipeline_upload(self, message, media_type: str, media_id: str) -> bool:
+        """检查是否可以边下载边上传
+
+        只用于大小已知、不超过 Bot API 上传限制的视频和文档；媒体已缓存或
+        正在被其他任务下载时按原方式处理。
+        """
+        if media_type not in ('video', 'document'):
+            return False
+        if not isinstance(getattr(self.bot, 'request', None), StreamingRequest):
+            return False
+        file_size = self.get_file_size(message)
+        if not 0 < file_size <= self.pipeline_upload_max_bytes:
+            return False
+        return media_id not in self.media_downloads and media_id not in self.media_store
 
-                        # 添加视频参数
-                        if 'width' in media_info:
-                            send_kwargs['width'] = media_info['width']
-                        if 'height' in media_info:
-                            send_kwargs['height'] = media_info['height']
-                        if 'duration' in media_info:
-                            send_kwargs['duration'] = media_info['duration']
+    async def pipeline_upload(self, message, media_type: str, media_id: str, send):
+        """边下载边上传：下载写入的数据直接作为上传内容发送
 
-                        # 如果有缩略图
-                        if 'thumb_path' in media_info and os.path.exists(media_info['thumb_path']):
-                            with open(media_info['thumb_path'], 'rb') as thumb_file:
-                                send_kwargs['thumb'] = thumb_file.read()
+        总耗时接近下载和上传中较慢的一个，而不是两者之和。下载失败时抛出
+        DownloadPipeError，由调用方改为下载完成后上传。
+        """
+        file_size = self.get_file_size(message)
+        media_info = self.collect_media_info(message, media_type, file_size)
+        name = media_info.get('filename') or f"{media_id}.{media_type}"
+        pipe = DownloadPipe(file_size, name)
+        self.start_download(message, media_type, media_id, pipe)
+        logging.info(f"边下载边上传媒体 {media_id}: {file_size / (1024 * 1024):.2f}MB")
+
+        thumb_path = await self.download_thumb(message, media_type)
+        if thumb_path:
+            media_info['thumb_path'] = thumb_path
+        try:
+            try:
+                sent = await send(pipe, media_info)
+            except telegram_error.NetworkError as e:
+                # python-telegram-bot 把请求体中抛出的异常包装为 NetworkError
+                if isinstance(e.__cause__, DownloadPipeError):
+                    raise e.__cause__
+                raise
+            file_id = extract_file_id(sent, media_type)
+            if file_id:
+                self.file_ids.set(media_id, file_id, media_info)
+                logging.info(f"已记录媒体 {media_id} 的 file_id，其余目标将直接复用")
+            return sent
+        finally:
+            pipe.close()
+            if thumb_path and os.path.exists(thumb_path):
+                os.remove(thumb_path)
 
-                        await self.bot.send_video(**send_kwargs)
+    async def handle_media_send(self, message, channel_id, media_type: str = None, reply_to_message_id: int = None, from_chat = None):
+        """处理媒体发送，多个目标共用一次下载和上传"""
+        if media_type is None:
+            media_type = self.get_media_type(message)
 
-                        # 清理缩略图
-                        if 'thumb_path' in media_info and os.path.exists(media_info['thumb_path']):
-                            os.remove(media_info['thumb_path'])
+        # 只有在没有回复消息时才添加说明文字
+        caption = None
+        if not reply_to_message_id and from_chat:
+            # 构建用户名部分
+            username = f"(@{from_chat.username})" if getattr(from_chat, 'username', None) else ""
 
-                    elif media_type == 'document':
-                        send_kwargs['document'] = file_data
-                        if 'filename' in media_info:
-                            send_kwargs['filename'] = media_info['filename']
-                        await self.bot.send_document(**send_kwargs)
-                    elif media_type == 'sticker':
-                        # 发送贴图
-                        await self.bot.send_sticker(
-                            chat_id=channel_id,
-                            sticker=file_data,
-                            reply_to_message_id=reply_to_message_id
-                        )
+            # 使用简化的模板作为媒体文件的标题
+            caption = f"📨 转发自 {getattr(from_chat, 'title', 'Unknown Channel')} {username}"
+        elif message.text or message.caption:
+            caption = message.text or message.caption
+
+        async def send(media, media_info):
+            send_kwargs = {
+                'chat_id': channel_id,
+                'caption': caption,
+                'read_timeout': 1800,
+                'write_timeout': 1800
+            }
+
+            if reply_to_message_id:
+                send_kwargs['reply_to_message_id'] = reply_to_message_id
+
+            if media_type == 'photo':
+                send_kwargs['photo'] = as_input_file(media)
+                return await self.bot.send_photo(**send_kwargs)
+            elif media_type == 'video':
+                send_kwargs.update({
+                    'video': as_input_file(media),
+                    'supports_streaming': True
+                })
+
+                # 添加视频参数
+                if 'width' in media_info:
+                    send_kwargs['width'] = media_info['width']
+                if 'height' in media_info:
+                    send_kwargs['height'] = media_info['height']
+                if 'duration' in media_info:
+                    send_kwargs['duration'] = media_info['duration']
+
+                # 如果有缩略图（使用 file_id 发送时不需要）
+                if 'thumb_path' in media_info and os.path.exists(media_info['thumb_path']):
+                    send_kwargs['thumbnail'] = await read_file(media_info['thumb_path'])
+
+                return await self.bot.send_video(**send_kwargs)
+            elif media_type == 'document':
+                send_kwargs['document'] = as_input_file(media, media_info.get('filename'))
+                if 'filename' in media_info:
+                    send_kwargs['filename'] = media_info['filename']
+                return await self.bot.send_document(**send_kwargs)
+            elif media_type == 'sticker':
+                # 发送贴图
+                return await self.bot.send_sticker(
+                    chat_id=channel_id,
+                    sticker=as_input_file(media),
+                    reply_to_message_id=reply_to_message_id
+                )
 
-                    logging.info(f"文件发送成功: {media_type}" +
-                           (f" (回复到消息: {reply_to_message_id})" if reply_to_message_id else ""))
-                finally:
-                    del file_data  # 释放内存
+        try:
+            sent = await self.send_media_once(message, media_type, send)
+            if sent is None:
+                return False
 
-            # 发送成功后清理文件
-            await self.cleanup_file(file_path)
+            logging.info(f"文件发送成功: {media_type}" +
+                   (f" (回复到消息: {reply_to_message_id})" if reply_to_message_id else ""))
             return True
 
         except Exception as e:
             logging.error(f"处理媒体文件时出错: {str(e)}")
-            if file_path:
-                await self.cleanup_file(file_path)
             return False
 
-    async def handle_forward_message(self, message, from_chat, to_channel):
-        """处理消息转发"""
+    def build_forwarded_text(self, content: str, from_chat, to_channel, reply_info=None,
+                             reply_to_message_id=None) -> Tuple[str, str]:
+        """按 forwarded_message_template 构建转发文本，返回 (转发文本, 回复信息文本)"""
+        # 获取频道类型
+        chat_type_key = 'chat_type_channel'  # 默认类型
+        if hasattr(from_chat, 'type'):
+            if from_chat.type == 'channel':
+                if getattr(from_chat, 'username', None):
+                    chat_type_key = 'chat_type_public_channel'
+                else:
+                    chat_type_key = 'chat_type_private_channel'
+            elif from_chat.type == 'group':
+                chat_type_key = 'chat_type_group'
+            elif from_chat.type == 'supergroup':
+                chat_type_key = 'chat_type_supergroup'
+            elif from_chat.type == 'gigagroup':
+                chat_type_key = 'chat_type_gigagroup'
+
+        # 获取用户语言
+        lang = self.db.get_user_language(to_channel.get('channel_id', 0)) or 'en'
+
+        # 获取频道类型显示文本
+        chat_type = get_text(lang, chat_type_key)
+
+        # 获取当前时间
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        # 构建用户名部分
+        username = f"(@{from_chat.username})" if getattr(from_chat, 'username', None) else ""
+
+        # 检查是否是回复消息
+        reply_text = ""
+        # 如果有回复消息但无法使用原生回复，则在消息中添加回复信息
+        if reply_info and not reply_to_message_id:
+            reply_text = get_text(lang, 'reply_to_message', text=reply_info['short_content']) + "\n"
+            logging.info(f"添加回复信息到消息中: {reply_info['short_content']}")
+
+        # 确保频道标题和类型正确显示
+        channel_title = getattr(from_chat, 'title', None)
+        if not channel_title:
+            channel_title = getattr(from_chat, 'first_name', 'Unknown Channel')
+
+        # 使用新的消息模板
+        forwarded_text = get_text(lang, 'forwarded_message_template',
+                                 title=channel_title,
+                                 username=username,
+                                 chat_type=chat_type,
+                                 time=current_time,
+                                 content=reply_text + content)
+
+        # 记录转发信息以便调试
+        logging.info(f"转发消息信息: 标题={channel_title}, 类型={chat_type}, 用户名={username}")
+        return forwarded_text, reply_text
+
+    async def forward_with_user_client(self, message, from_chat, to_channel, channel_id: int, album=None,
+                                       reply_to_message_id: int = None, reply_info=None) -> bool:
+        """用户账号直接发送原媒体（图片、文档及其媒体组）
+
+        说明文字和标题与 forwarded_message_template 相同。返回 False 表示
+        不适用或原媒体引用被拒绝，由调用方改用 Bot 下载上传的方式；其他错误直接抛出。
+        """
+        messages = album or [message]
+        if not all(can_resend(msg) for msg in messages):
+            return False
+
+        content = getattr(message, 'text', None) or getattr(message, 'caption', None)
+        if not content and not album:
+            # 与 Bot 方式一致：没有文字的单条媒体不转发
+            return False
+
+        caption = None
+        if content:
+            caption, _ = self.build_forwarded_text(
+                content, from_chat, to_channel, reply_info, reply_to_message_id)
+
+        try:
+            sent = await user_resend(self.client, channel_id, messages, caption, reply_to_message_id)
+        except Exception as e:
+            if is_reference_error(e):
+                logging.warning(f"原媒体引用被拒绝，改用下载上传方式: {e}")
+                return False
+            raise
+
+        # 保存转发关系：说明文字所在的消息对应第一条发送的消息，媒体组其余消息一一对应
+        await self.record_forward(from_chat.id, message.id, channel_id, sent[0].id)
+        media_sent = sent[-len(messages):]
+        for msg, sent_msg in zip(messages, media_sent):
+            if msg.id != message.id:
+                await self.record_forward(from_chat.id, msg.id, channel_id, sent_msg.id)
+        logging.info(f"用户账号直接发送 {len(messages)} 个媒体到频道 {channel_id}")
+        return True
+
+    async def send_with_fallback(self, method: str, **kwargs):
+        """调用 bot 方法，Markdown 解析失败时改用纯文本，被回复的消息不存在时取消回复"""
+        while True:
+            try:
+                return await getattr(self.bot, method)(**kwargs)
+            except telegram_error.BadRequest as e:
+                error = str(e).lower()
+                if "can't parse entities" in error and kwargs.get('parse_mode'):
+                    logging.warning(f"实体解析错误，尝试使用纯文本: {e}")
+                    kwargs['parse_mode'] = None
+                elif 'replied not found' in error and kwargs.get('reply_to_message_id'):
+                    logging.warning("回复的消息不存在，移除回复ID后重试")
+                    kwargs['reply_to_message_id'] = None
+                else:
+                    raise
+
+    async def forward_with_copy(self, message, from_chat, to_channel, channel_id: int, album=None,
+                                reply_to_message_id: int = None, reply_info=None) -> bool:
+        """Bot 可以读取源频道时，用 copyMessage / copyMessages 在服务器端复制媒体
+
+        单条媒体和贴图各一次 copyMessage，媒体组一次 copyMessages，不需要下载
+        和上传。返回 False 表示不适用或复制失败，由调用方改用下载上传的方式。
+        """
+        messages = album or [message]
+        if not all(getattr(msg, 'media', None) for msg in messages):
+            return False
+        media_types = [self.get_media_type(msg) for msg in messages]
+        if 'unknown' in media_types:
+            return False
+
+        content = getattr(message, 'text', None) or getattr(message, 'caption', None)
+        is_sticker = not album and media_types[0] == 'sticker'
+        if not album and not is_sticker and not content:
+            # 与下载上传方式一致：没有文字的单条媒体不转发
+            return False
+
+        source_id = message.chat_id
+        if not await self.sources.is_available(source_id):
+            return False
+
+        sent_text = None
+        try:
+            if album:
+                # copyMessages 不支持回复，回复信息写在说明文字中
+                if reply_to_message_id and reply_info is None:
+                    reply_info = await self.get_reply_info(from_chat.id, message.reply_to_msg_id)
+                copied = await self.bot.copy_messages(
+                    chat_id=channel_id,
+                    from_chat_id=source_id,
+                    message_ids=[msg.id for msg in messages]
+                )
+                if len(copied) != len(messages):
+                    # copyMessages 会跳过不能复制的消息，结果无法与源消息一一对应，
+                    # 删除已复制的部分，改用下载上传，不记录按位置猜测的转发关系
+                    logging.warning(f"copyMessages 只复制了 {len(copied)}/{len(messages)} 个媒体，改用下载上传方式")
+                    if copied:
+                        try:
+                            await self.bot.delete_messages(
+                                chat_id=channel_id, message_ids=[copy.message_id for copy in copied])
+                        except telegram_error.TelegramError as e:
+                            logging.error(f"删除不完整的复制结果失败: {e}")
+                    return False
+                copied_ids = {msg.id: copy.message_id for msg, copy in zip(messages, copied)}
+                for msg_id, copied_id in copied_ids.items():
+                    await self.record_forward(from_chat.id, msg_id, channel_id, copied_id)
+
+                if content:
+                    forwarded_text, _ = self.build_forwarded_text(content, from_chat, to_channel, reply_info)
+                    caption_copy = copied_ids.get(message.id, copied[0].message_id)
+                    try:
+                        if len(forwarded_text) <= CAPTION_LIMIT:
+                            await self.send_with_fallback(
+                                'edit_message_caption', chat_id=channel_id, message_id=caption_copy,
+                                caption=forwarded_text, parse_mode='Markdown')
+                        else:
+                            await self.send_with_fallback(
+                                'send_message', chat_id=channel_id, text=forwarded_text, parse_mode='Markdown',
+                                disable_web_page_preview=True, reply_to_message_id=caption_copy)
+                    except Exception as e:
+                        # 媒体已经复制，说明文字失败时不再重发
+                        logging.error(f"添加媒体组说明文字失败: {e}")
+
+            elif is_sticker:
+                copied = await self.send_with_fallback(
+                    'copy_message', chat_id=channel_id, from_chat_id=source_id, message_id=message.id,
+                    reply_to_message_id=reply_to_message_id)
+                await self.record_forward(from_chat.id, message.id, channel_id, copied.message_id)
+                # 与 handle_sticker_send 一致，不是回复时在贴图后发送来源说明
+                if not reply_to_message_id:
+                    username = f"(@{from_chat.username})" if getattr(from_chat, 'username', None) else ""
+                    await self.bot.send_message(
+                        chat_id=channel_id,
+                        text=f"📨 转发自 {getattr(from_chat, 'title', 'Unknown Channel')} {username}",
+                        disable_web_page_preview=True
+                    )
+
+            else:
+                forwarded_text, _ = self.build_forwarded_text(
+                    content, from_chat, to_channel, reply_info, reply_to_message_id)
+                if len(forwarded_text) <= CAPTION_LIMIT:
+                    copied = await self.send_with_fallback(
+                        'copy_message', chat_id=channel_id, from_chat_id=source_id, message_id=message.id,
+                        caption=forwarded_text, parse_mode='Markdown', reply_to_message_id=reply_to_message_id)
+                    await self.record_forward(from_chat.id, message.id, channel_id, copied.message_id)
+                else:
+                    # 说明文字超过媒体的长度限制：先发送文本，媒体（去掉原说明文字）作为回复
+                    sent_text = await self.send_with_fallback(
+                        'send_message', chat_id=channel_id, text=forwarded_text, parse_mode='Markdown',
+                        disable_web_page_preview=True, reply_to_message_id=reply_to_message_id)
+                    await self.bot.copy_message(
+                        chat_id=channel_id, from_chat_id=source_id, message_id=message.id,
+                        caption='', reply_to_message_id=sent_text.message_id)
+                    await self.record_forward(from_chat.id, message.id, channel_id, sent_text.message_id)
+
+        except telegram_error.BadRequest as e:
+            # 消息不能复制（如开启了内容保护）或 Bot 已不能读取源频道，一段时间内不再尝试复制
+            logging.warning(f"复制消息失败，改用下载上传方式: {e}")
+            self.sources.set(source_id, False)
+            if sent_text:
+                await self.bot.delete_message(chat_id=channel_id, message_id=sent_text.message_id)
+            return False
+
+        logging.info(f"已通过 copyMessage 复制 {len(messages)} 个媒体到频道 {channel_id}")
+        return True
+
+    async def handle_forward_message(self, message, from_chat, to_channel, album=None):
+        """处理消息转发
+
+        album 为媒体组的全部消息，此时 message 是带说明文字的那一条（没有说明文字时为第一条）。
+        """
         if not message or not from_chat or not to_channel:
             logging.error(get_text('en', 'missing_parameters'))
             return
@@ -391,104 +805,50 @@ class MyMessageHandler:
 
             # 检查是否是回复消息
             reply_to_message_id = None
-            original_reply_message = None
             reply_info = None
 
             if hasattr(message, 'reply_to_msg_id') and message.reply_to_msg_id:
                 try:
-                    # 获取原始回复消息
-                    original_reply_message = await self.client.get_messages(from_chat.id, ids=message.reply_to_msg_id)
-                    if original_reply_message:
-                        # 保存回复消息信息以便后续使用
-                        reply_content = original_reply_message.text or original_reply_message.caption or ""
-                        reply_info = {
-                            'id': original_reply_message.id,
-                            'content': reply_content,
-                            'short_content': reply_content[:50] + "..." if len(reply_content) > 50 else reply_content
-                        }
-
-                    # 在数据库中查找这条消息是否已经转发过
-                    forwarded_reply = self.db.get_forwarded_message(from_chat.id, message.reply_to_msg_id, channel_id)
+                    # 查找这条消息是否已经转发过（先查缓存，再查数据库）
+                    forwarded_reply = await self.get_forwarded_record(from_chat.id, message.reply_to_msg_id, channel_id)
                     if forwarded_reply:
                         # 如果找到了转发的回复消息，使用其ID作为回复ID
                         reply_to_message_id = forwarded_reply['forwarded_message_id']
                         logging.info(f"找到原始回复消息的转发记录，将使用原生回复: {reply_to_message_id}")
+                    else:
+                        # 无法使用原生回复时，才需要原始回复消息的内容
+                        reply_info = await self.get_reply_info(from_chat.id, message.reply_to_msg_id)
                 except Exception as e:
                     logging.warning(f"获取原始回复消息失败: {e}")
 
+            # 配对设置为用户账号发送时，直接引用原媒体发送，不经过本地下载和上传
+            if to_channel.get('send_mode') == 'USER' and await self.forward_with_user_client(
+                    message, from_chat, to_channel, channel_id, album, reply_to_message_id, reply_info):
+                return
+
             forwarded_msg = None
 
             # 不使用直接转发，始终使用处理过的转发
             logging.info("按要求不使用直接转发，将使用处理过的转发方式")
 
-            # 检查频道是否存在
+            # 检查频道是否存在（使用验证缓存，不再每次调用 get_chat）
             try:
-                # 尝试获取频道信息来验证频道是否存在
-                chat = await self.bot.get_chat(channel_id)
-                if not chat:
-                    logging.error(f"频道 {channel_id} 不存在或机器人无法访问，请检查权限或频道ID")
-                    return
-            except telegram_error.BadRequest as e:
-                if "Chat not found" in str(e):
-                    logging.error(f"频道 {channel_id} 不存在或机器人无法访问，请检查权限或频道ID")
+                if not await self.destinations.is_available(channel_id):
+                    logging.info(f"频道 {channel_id} 不可用，跳过转发")
                     return
-                else:
-                    logging.warning(f"验证频道失败: {str(e)}")
             except Exception as e:
                 logging.warning(f"验证频道失败: {str(e)}")
 
+            # Bot 可以读取源频道时，媒体直接在服务器端复制，不需要下载和上传
+            if await self.forward_with_copy(message, from_chat, to_channel, channel_id, album,
+                                            reply_to_message_id, reply_info):
+                return
+
             # 如果直接转发失败，处理文本消息
             if getattr(message, 'text', None) or getattr(message, 'caption', None):
                 content = message.text or message.caption
-                # 获取频道类型
-                chat_type_key = 'chat_type_channel'  # 默认类型
-                if hasattr(from_chat, 'type'):
-                    if from_chat.type == 'channel':
-                        if getattr(from_chat, 'username', None):
-                            chat_type_key = 'chat_type_public_channel'
-                        else:
-                            chat_type_key = 'chat_type_private_channel'
-                    elif from_chat.type == 'group':
-                        chat_type_key = 'chat_type_group'
-                    elif from_chat.type == 'supergroup':
-                        chat_type_key = 'chat_type_supergroup'
-                    elif from_chat.type == 'gigagroup':
-                        chat_type_key = 'chat_type_gigagroup'
-
-                # 获取用户语言
-                lang = self.db.get_user_language(to_channel.get('channel_id', 0)) or 'en'
-
-                # 获取频道类型显示文本
-                chat_type = get_text(lang, chat_type_key)
-
-                # 获取当前时间
-                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-                # 构建用户名部分
-                username = f"(@{from_chat.username})" if getattr(from_chat, 'username', None) else ""
-
-                # 检查是否是回复消息
-                reply_text = ""
-                # 如果有回复消息但无法使用原生回复，则在消息中添加回复信息
-                if reply_info and not reply_to_message_id:
-                    reply_text = get_text(lang, 'reply_to_message', text=reply_info['short_content']) + "\n"
-                    logging.info(f"添加回复信息到消息中: {reply_info['short_content']}")
-
-                # 确保频道标题和类型正确显示
-                channel_title = getattr(from_chat, 'title', None)
-                if not channel_title:
-                    channel_title = getattr(from_chat, 'first_name', 'Unknown Channel')
-
-                # 使用新的消息模板
-                forwarded_text = get_text(lang, 'forwarded_message_template',
-                                         title=channel_title,
-                                         username=username,
-                                         chat_type=chat_type,
-                                         time=current_time,
-                                         content=reply_text + content)
-
-                # 记录转发信息以便调试
-                logging.info(f"转发消息信息: 标题={channel_title}, 类型={chat_type}, 用户名={username}")
+                forwarded_text, reply_text = self.build_forwarded_text(
+                    content, from_chat, to_channel, reply_info, reply_to_message_id)
 
                 # 检查是否有自定义表情
                 has_custom_emoji = await self.handle_custom_emoji(message, channel_id)
@@ -517,7 +877,7 @@ class MyMessageHandler:
                     try:
                         forwarded_msg = await self.bot.send_message(**send_kwargs)
                         # 保存转发关系
-                        self.db.save_forwarded_message(from_chat.id, message.id, channel_id, forwarded_msg.message_id)
+                        await self.record_forward(from_chat.id, message.id, channel_id, forwarded_msg.message_id)
                     except telegram_error.BadRequest as br_error:
                         # 处理特定的错误
                         if "Message to be replied not found" in str(br_error):
@@ -526,13 +886,13 @@ class MyMessageHandler:
                             if 'reply_to_message_id' in send_kwargs:
                                 del send_kwargs['reply_to_message_id']
                             forwarded_msg = await self.bot.send_message(**send_kwargs)
-                            self.db.save_forwarded_message(from_chat.id, message.id, channel_id, forwarded_msg.message_id)
+                            await self.record_forward(from_chat.id, message.id, channel_id, forwarded_msg.message_id)
                         elif "can't parse entities" in str(br_error).lower():
                             # 实体解析错误，尝试使用纯文本
                             logging.warning(f"实体解析错误，尝试使用纯文本: {br_error}")
                             send_kwargs['parse_mode'] = None
                             forwarded_msg = await self.bot.send_message(**send_kwargs)
-                            self.db.save_forwarded_message(from_chat.id, message.id, channel_id, forwarded_msg.message_id)
+                            await self.record_forward(from_chat.id, message.id, channel_id, forwarded_msg.message_id)
                         else:
                             # 其他BadRequest错误，重新抛出
                             raise
@@ -551,25 +911,24 @@ class MyMessageHandler:
                     forwarded_msg = await self.bot.send_message(**send_kwargs)
 
                     # 保存转发关系
-                    self.db.save_forwarded_message(from_chat.id, message.id, channel_id, forwarded_msg.message_id)
+                    await self.record_forward(from_chat.id, message.id, channel_id, forwarded_msg.message_id)
 
                 logging.info(get_text('en', 'text_send_success', channel_id=channel_id))
 
-            # 异步处理媒体消息
-            if getattr(message, 'media', None) and forwarded_msg:
-                logging.info("检测到媒体消息，开始异步处理")
+            # 媒体组在当前通道中处理完，保证同一目标中后续消息的顺序
+            if album:
+                logging.info(f"开始处理媒体组，共 {len(album)} 条消息")
+                await self.handle_media_group(
+                    messages=album,
+                    channel_id=channel_id,
+                    forwarded_msg=forwarded_msg,  # 传递已转发的消息对象（没有说明文字时为 None）
+                    from_chat=from_chat
+                )
+                return
 
-                # 检查是否是媒体组
-                if hasattr(message, 'grouped_id') and message.grouped_id:
-                    # 异步处理媒体组
-                    logging.info("检测到媒体组，开始异步处理媒体组")
-                    asyncio.create_task(self.handle_media_group(
-                        message=message,
-                        channel_id=channel_id,
-                        forwarded_msg=forwarded_msg,  # 传递已转发的消息对象
-                        from_chat=from_chat
-                    ))
-                    return
+            # 在当前通道中发送媒体，完成后才处理该目标的下一条消息
+            if getattr(message, 'media', None) and forwarded_msg:
+                logging.info("检测到媒体消息，开始处理")
 
                 # 确定媒体类型
                 media_type = self.get_media_type(message)
@@ -577,30 +936,32 @@ class MyMessageHandler:
 
                 # 如果是贴图，使用特殊处理
                 if media_type == 'sticker':
-                    asyncio.create_task(self.handle_sticker_send(
+                    await self.handle_sticker_send(
                         message=message,
                         channel_id=channel_id,
                         from_chat=from_chat,
                         reply_to_message_id=forwarded_msg.message_id
-                    ))
+                    )
                     return
 
-                # 异步处理媒体文件，使用编辑模式
-                asyncio.create_task(self.handle_media_edit(
+                # 处理媒体文件，使用编辑模式
+                await self.handle_media_edit(
                     message=message,
                     channel_id=channel_id,
                     media_type=media_type,
                     forwarded_msg=forwarded_msg,  # 传递已转发的消息对象
                     from_chat=from_chat
-                ))
+                )
         except Exception as e:
             logging.error(get_text('en', 'forward_message_error', error=str(e)))
             logging.error(get_text('en', 'error_details', details=traceback.format_exc()))
             raise
 
     async def cleanup_file(self, file_path: str):
-        """清理单个文件"""
+        """清理单个文件，媒体缓存中的文件由缓存自己淘汰"""
         try:
+            if self.media_store.owns(file_path):
+                return
             if file_path and os.path.exists(file_path):
                 os.remove(file_path)
                 self.temp_files.pop(file_path, None)
@@ -625,18 +986,14 @@ class MyMessageHandler:
             if not message:
                 return
 
-            # 获取频道信息
-            chat = await event.get_chat()
-            channel_info = self.db.get_channel_info(chat.id)
-
-            if not channel_info or not channel_info.get('is_active'):
-                return
-
             # 获取所有转发频道
-            forward_channels = self.db.get_all_forward_channels(chat.id)
-            if not forward_channels:
+            targets = self.get_route_targets(event.chat_id)
+            if not targets:
                 return
 
+            # 获取频道信息
+            chat = await event.get_chat()
+
             # 获取消息内容
             content = ""
             if hasattr(message, 'text') and message.text:
@@ -645,14 +1002,17 @@ class MyMessageHandler:
                 content = message.caption
 
             logging.info(f"编辑消息内容: {content}")
+            # 回复这条消息时显示编辑后的内容
+            self.reply_cache.remember_message(chat.id, message.id, content)
             if not content:
                 return
 
             # 获取用户语言
             lang = self.db.get_user_language(chat.id) or 'en'
 
-            # 向所有转发频道发送编辑通知
-            for channel in forward_channels:
+            # 每个转发频道在自己的通道中按顺序发送编辑通知，频道之间并发
+            async def send_edit_notice(target):
+                channel = target.channel
                 try:
                     # 手动添加 -100 前缀
                     original_channel_id = channel.get('channel_id')
@@ -664,7 +1024,7 @@ class MyMessageHandler:
                     try:
                         # 在数据库中查找这条消息是否已经转发过
                         if hasattr(message, 'id'):
-                            forwarded_msg = self.db.get_forwarded_message(chat.id, message.id, channel_id)
+                            forwarded_msg = await self.get_forwarded_record(chat.id, message.id, channel_id)
                             if forwarded_msg:
                                 logging.info(f"找到原始消息的转发记录: {forwarded_msg['forwarded_message_id']}")
                     except Exception as e:
@@ -698,7 +1058,8 @@ class MyMessageHandler:
 
                 except Exception as e:
                     logging.error(f"发送编辑通知到频道 {channel.get('channel_id')} 失败: {str(e)}")
-                    continue
+
+            await self.submit_target_jobs([(target, lambda target=target: send_edit_notice(target)) for target in targets])
 
         except Exception as e:
             logging.error(f"处理消息编辑事件时出错: {str(e)}")
@@ -728,16 +1089,15 @@ class MyMessageHandler:
                 logging.warning("MessageDeleted 事件没有删除的消息ID，无法处理")
                 return
 
-            # 获取频道信息
-            channel_info = self.db.get_channel_info(chat_id)
-            if not channel_info or not channel_info.get('is_active'):
-                return
-
             # 获取所有转发频道
-            forward_channels = self.db.get_all_forward_channels(chat_id)
-            if not forward_channels:
+            targets = self.get_route_targets(chat_id)
+            if not targets:
                 return
 
+            # 已删除的消息不再出现在回复预览中
+            for msg_id in deleted_ids:
+                self.reply_cache.forget_message(targets[0].monitor_id, msg_id)
+
             # 获取用户语言
             lang = self.db.get_user_language(chat_id) or 'en'
 
@@ -745,32 +1105,42 @@ class MyMessageHandler:
             delete_notice = get_text(lang, 'deleted_message')
             logging.info(f"准备发送删除通知: {delete_notice}")
 
-            # 向所有转发频道发送删除通知
-            for channel in forward_channels:
+            # 每个转发频道在自己的通道中按顺序发送删除通知，频道之间并发
+            async def send_delete_notice(target):
+                channel = target.channel
                 try:
                     # 手动添加 -100 前缀
                     original_channel_id = channel.get('channel_id')
                     channel_id = int("-100" + str(original_channel_id))
                     logging.info(f"处理频道ID(删除消息): 原始值={original_channel_id}, 处理后={channel_id}")
 
+                    # 在通道中查询，之前提交的转发已经完成；所有删除的消息合并为一次查询
+                    try:
+                        forwarded_records = await self.get_forwarded_records(target.monitor_id, deleted_ids, [channel_id])
+                    except Exception as e:
+                        logging.warning(f"获取原始消息的转发记录失败: {e}")
+                        forwarded_records = {}
+
                     # 尝试找到原始消息的转发消息
                     forwarded_msg = None
                     original_message_content = None
 
-                    try:
-                        # 在数据库中查找这条消息是否已经转发过
-                        if hasattr(event, 'deleted_ids') and event.deleted_ids:
-                            for msg_id in event.deleted_ids:
-                                forwarded_msg = self.db.get_forwarded_message(chat_id, msg_id, channel_id)
-                                if forwarded_msg:
-                                    logging.info(f"找到原始消息的转发记录: {forwarded_msg['forwarded_message_id']}")
-
-                                    # 尝试获取原始消息内容（如果有缓存）
-                                    # 注意：这里我们无法获取原始内容，因为消息已被删除
-                                    # 如果需要实现这个功能，需要在转发时将消息内容保存到数据库
-                                    break
-                    except Exception as e:
-                        logging.warning(f"获取原始消息的转发记录失败: {e}")
+                    # 使用第一条已经转发过的删除消息
+                    for msg_id in deleted_ids:
+                        forwarded_message_id = forwarded_records.get((msg_id, channel_id))
+                        if forwarded_message_id is not None:
+                            forwarded_msg = {
+                                'original_chat_id': target.monitor_id,
+                                'original_message_id': msg_id,
+                                'forwarded_chat_id': channel_id,
+                                'forwarded_message_id': forwarded_message_id
+                            }
+                            logging.info(f"找到原始消息的转发记录: {forwarded_message_id}")
+
+                            # 尝试获取原始消息内容（如果有缓存）
+                            # 注意：这里我们无法获取原始内容，因为消息已被删除
+                            # 如果需要实现这个功能，需要在转发时将消息内容保存到数据库
+                            break
 
                     # 发送删除通知
                     send_kwargs = {
@@ -811,7 +1181,8 @@ class MyMessageHandler:
 
                 except Exception as e:
                     logging.error(f"发送删除通知到频道 {channel.get('channel_id')} 失败: {str(e)}")
-                    continue
+
+            await self.submit_target_jobs([(target, lambda target=target: send_delete_notice(target)) for target in targets])
 
         except Exception as e:
             logging.error(f"处理消息删除事件时出错: {str(e)}")
@@ -826,106 +1197,162 @@ class MyMessageHandler:
         # 生成媒体ID
         media_id = self.get_media_id(message)
 
-        # 检查缓存
-        if media_id in self.media_cache:
+        # 检查本地媒体缓存
+        media_info = self.media_store.get(media_id)
+        if media_info:
             logging.info(f"使用缓存的媒体文件: {media_id}")
-            return self.media_cache[media_id]
+            return media_info
+
+        return await asyncio.shield(self.start_download(message, media_type, media_id))
+
+    def start_download(self, message, media_type: str, media_id: str, pipe: DownloadPipe = None) -> asyncio.Future:
+        """在后台开始下载，同一媒体同时只下载一次
+
+        pipe 不为空时，下载的数据同时交给边下载边上传的管道。
+        """
+        download = self.media_downloads.get(media_id)
+        if download is None:
+            download = asyncio.ensure_future(self._download_media_file(message, media_type, media_id, pipe))
+            self.media_downloads[media_id] = download
+            download.add_done_callback(lambda _: self.media_downloads.pop(media_id, None))
+        return download
+
+    def get_file_size(self, message) -> int:
+        """获取媒体文件大小，未知时返回 0"""
+        return message.file.size if message.file and message.file.size else 0
+
+    def collect_media_info(self, message, media_type: str, file_size: int) -> dict:
+        """收集发送时需要的媒体信息（尺寸、时长、文件名等）"""
+        media_info = {
+            'file_size': file_size,
+            'media_type': media_type
+        }
+
+        # 收集特定媒体类型的额外信息
+        if media_type == 'video' and hasattr(message.media, 'video'):
+            video = message.media.video
+            if hasattr(video, 'width'):
+                media_info['width'] = video.width
+            if hasattr(video, 'height'):
+                media_info['height'] = video.height
+            if hasattr(video, 'duration'):
+                media_info['duration'] = video.duration
+
+        # 如果是文档，获取文件名
+        elif media_type == 'document' and hasattr(message.media, 'document'):
+            if hasattr(message.media.document, 'attributes'):
+                for attr in message.media.document.attributes:
+                    if hasattr(attr, 'file_name'):
+                        media_info['filename'] = attr.file_name
+                        break
+
+        return media_info
 
+    async def download_thumb(self, message, media_type: str) -> Optional[str]:
+        """下载视频缩略图，返回文件路径"""
+        if media_type != 'video' or not hasattr(message.media, 'video'):
+            return None
+        video = message.media.video
+        if not (hasattr(video, 'thumb') and video.thumb):
+            return None
+        try:
+            return await self.client.download_media(video.thumb)
+        except Exception as e:
+            logging.warning(f"无法下载视频缩略图: {str(e)}")
+            return None
+
+    async def _download_media_file(self, message, media_type: str, media_id: str, pipe: DownloadPipe = None) -> dict:
+        """从 Telegram 下载媒体文件并加入本地缓存"""
         tmp = None
         file_path = None
-        chunk_size = 20 * 1024 * 1024  # 20MB 分块
 
         try:
             # 获取文件大小
-            file_size = getattr(message.media, 'file_size', 0) or getattr(message.media, 'size', 0)
+            file_size = self.get_file_size(message)
             logging.info(f"开始下载媒体文件，大小: {file_size / (1024*1024):.2f}MB")
 
             # 确保媒体缓存目录存在
-            media_cache_dir = "data/media_cache"
-            os.makedirs(media_cache_dir, exist_ok=True)
+            os.makedirs(self.media_store.root, exist_ok=True)
 
-            # 创建临时文件
-            tmp = NamedTemporaryFile(delete=False, prefix='tg_', suffix=f'.{media_type}', dir=media_cache_dir)
+            # 下载到 tg_ 临时文件，完成后再加入缓存；中断留下的临时文件在启动时清理
+            tmp = NamedTemporaryFile(delete=False, prefix='tg_', suffix=f'.{media_type}', dir=self.media_store.root)
             file_path = tmp.name
+            if pipe:
+                pipe.open(file_path)
 
-            # 使用分块下载
-            downloaded_size = 0
-            async for chunk in self.client.iter_download(message.media, chunk_size=chunk_size):
-                if chunk:
-                    tmp.write(chunk)
-                    downloaded_size += len(chunk)
-                    if downloaded_size % (50 * 1024 * 1024) == 0:
-                        progress = (downloaded_size / file_size) * 100 if file_size else 0
-                        logging.info(f"下载进度: {progress:.1f}% ({downloaded_size/(1024*1024):.1f}MB/{file_size/(1024*1024):.1f}MB)")
-
-                    if downloaded_size % (100 * 1024 * 1024) == 0:
-                        tmp.flush()
-                        os.fsync(tmp.fileno())
-
-            tmp.close()
+            downloaded = False
+            if self.parallel_downloader.supports(message.media, file_size):
+                # 大文件多连接分段下载，失败时改用单连接下载
+                await asyncio.to_thread(tmp.close)
+                try:
+                    await self.parallel_downloader.download(message.media, file_path, file_size,
+                                                            on_chunk=pipe.mark if pipe else None)
+                    downloaded = True
+                except Exception as e:
+                    logging.warning(f"分段下载失败，改用单连接下载: {str(e)}")
+                    tmp = await asyncio.to_thread(open, file_path, 'r+b')
+
+            if not downloaded:
+                # 单连接按块下载（每次请求最大 512KB）
+                downloaded_size = 0
+                async for chunk in self.client.iter_download(message.media):
+                    if chunk:
+                        # 写盘放到线程中，不阻塞事件循环
+                        await write_chunk(tmp, chunk)
+                        if pipe:
+                            pipe.mark(downloaded_size, len(chunk))
+                        downloaded_size += len(chunk)
+                        if downloaded_size % (50 * 1024 * 1024) == 0:
+                            progress = (downloaded_size / file_size) * 100 if file_size else 0
+                            logging.info(f"下载进度: {progress:.1f}% ({downloaded_size/(1024*1024):.1f}MB/{file_size/(1024*1024):.1f}MB)")
+
+                        if downloaded_size % (100 * 1024 * 1024) == 0:
+                            await sync_file(tmp)
+
+            await asyncio.to_thread(tmp.close)
             logging.info("媒体文件下载完成")
+            if pipe:
+                pipe.finish()
 
             if not os.path.exists(file_path):
                 raise FileNotFoundError(get_text('en', 'downloaded_file_not_found', file_path=file_path))
 
-            # 记录临时文件
-            self.temp_files[file_path] = datetime.now()
-
-            # 收集媒体信息
-            media_info = {
-                'file_path': file_path,
-                'file_size': file_size,
-                'media_type': media_type,
-                'timestamp': datetime.now()
-            }
-
-            # 收集特定媒体类型的额外信息
-            if media_type == 'video' and hasattr(message.media, 'video'):
-                video = message.media.video
-                if hasattr(video, 'width'):
-                    media_info['width'] = video.width
-                if hasattr(video, 'height'):
-                    media_info['height'] = video.height
-                if hasattr(video, 'duration'):
-                    media_info['duration'] = video.duration
-
-                # 如果有缩略图
-                if hasattr(video, 'thumb') and video.thumb:
-                    try:
-                        thumb_path = await self.client.download_media(video.thumb)
-                        media_info['thumb_path'] = thumb_path
-                    except Exception as e:
-                        logging.warning(f"无法下载视频缩略图: {str(e)}")
-
-            # 如果是文档，获取文件名
-            elif media_type == 'document' and hasattr(message.media, 'document'):
-                if hasattr(message.media.document, 'attributes'):
-                    for attr in message.media.document.attributes:
-                        if hasattr(attr, 'file_name'):
-                            media_info['filename'] = attr.file_name
-                            break
-
-            # 将结果存入缓存
-            self.media_cache[media_id] = media_info
+            # 收集媒体信息，边下载边上传时由上传方自己获取缩略图
+            media_info = self.collect_media_info(message, media_type, file_size)
+            thumb_path = None if pipe else await self.download_thumb(message, media_type)
 
-            # 设置缓存过期时间（例如10分钟后自动清理）
-            asyncio.create_task(self.clear_media_cache(media_id, 600))
+            # 将文件加入本地缓存
+            media_info = await self.media_store.put(media_id, file_path, media_info)
+            if thumb_path:
+                media_info['thumb_path'] = thumb_path
 
             return media_info
 
         except Exception as e:
             logging.error(f"下载媒体文件时出错: {str(e)}")
-            if file_path and file_path in self.temp_files:
+            if pipe:
+                pipe.fail(e)
+            if tmp and not tmp.closed:
+                tmp.close()
+            if file_path and os.path.exists(file_path):
                 await self.cleanup_file(file_path)
             return {}
 
-    async def handle_media_group(self, message, channel_id, forwarded_msg=None, from_chat=None):
-        """处理媒体组（多张图片或视频）"""
+    async def handle_media_group(self, messages, channel_id, forwarded_msg=None, from_chat=None):
+        """处理媒体组（多张图片或视频）
+
+        messages 是 AlbumAggregator 收集到的同一媒体组的全部消息（按ID排序）。
+        """
+        # 媒体组发送完成前持有所有文件的租约
+        leases = ExitStack()
         try:
-            # 获取媒体组ID
-            group_id = getattr(message, 'grouped_id', None)
-            if not group_id:
-                # 如果不是媒体组，使用普通媒体处理
+            group_media = [msg for msg in messages if getattr(msg, 'media', None)]
+            if not group_media:
+                return
+            group_id = getattr(group_media[0], 'grouped_id', None)
+            if len(group_media) == 1:
+                # 只有一个媒体，使用普通媒体处理
+                message = group_media[0]
                 media_type = self.get_media_type(message)
                 if forwarded_msg:
                     # 使用编辑模式
@@ -933,47 +1360,23 @@ class MyMessageHandler:
                 else:
                     # 使用回复模式
                     reply_to_message_id = forwarded_msg.message_id if forwarded_msg else None
-                    await self.handle_media_send(message, channel_id, media_type, reply_to_message_id=reply_to_message_id)
+                    await self.handle_media_send(message, channel_id, media_type, reply_to_message_id=reply_to_message_id, from_chat=from_chat)
                 return
 
-            # 检查是否已经处理过这个媒体组
-            if group_id in self.processed_media_groups:
-                logging.info(f"媒体组 {group_id} 已经处理过，跳过")
-                return
+            logging.info(f"开始处理媒体组: {group_id}, 共 {len(group_media)} 个媒体")
 
-            # 标记为已处理
-            self.processed_media_groups.add(group_id)
-            logging.info(f"开始处理媒体组: {group_id}")
-
-            # 获取同一组的所有媒体消息
-            # 先获取当前消息之前的消息
-            media_messages_before = await self.client.get_messages(
-                message.chat_id,
-                limit=20,  # 增加限制以确保获取到全部媒体
-                offset_id=message.id,
-                reverse=True
-            )
-
-            # 再获取当前消息及之后的消息
-            media_messages_after = await self.client.get_messages(
-                message.chat_id,
-                limit=20,  # 增加限制以确保获取到全部媒体
-                min_id=message.id - 1  # 从当前消息开始
-            )
-
-            # 合并所有消息
-            media_messages = media_messages_before + media_messages_after
-            logging.info(f"获取到媒体消息总数: {len(media_messages)}个")
-
-            # 过滤出同一组的媒体
-            group_media = [msg for msg in media_messages if hasattr(msg, 'grouped_id') and msg.grouped_id == group_id]
-            logging.info(f"找到媒体组消息: {len(group_media)} 个")
+            # 并发下载所有媒体，结果按媒体组顺序排列
+            media_types = [self.get_media_type(msg) for msg in group_media]
+            for msg in group_media:
+                leases.enter_context(self.media_store.lease(self.get_media_id(msg)))
+            media_infos = await asyncio.gather(*(
+                self.download_album_item(msg, media_type)
+                for msg, media_type in zip(group_media, media_types)
+            ))
 
             # 准备媒体列表
             media_list = []
-            for msg in group_media:
-                media_type = self.get_media_type(msg)
-                media_info = await self.download_media_file(msg, media_type)
+            for msg, media_type, media_info in zip(group_media, media_types, media_infos):
                 if media_info:
                     # 安全获取消息标题，确保属性存在
                     caption = None
@@ -983,6 +1386,7 @@ class MyMessageHandler:
                         caption = msg.caption
 
                     media_list.append({
+                        'message': msg,
                         'type': media_type,
                         'path': media_info['file_path'],
                         'caption': caption,
@@ -1004,9 +1408,8 @@ class MyMessageHandler:
                                 channel_id=channel_id,
                                 message_id=forwarded_msg.message_id,
                                 text=original_text,
-                                media_path=media['path'],
-                                media_type=media['type'],
-                                media_info=media['media_info']
+                                message=media['message'],
+                                media_type=media['type']
                             )
                             logging.info(f"成功编辑原消息添加媒体: {forwarded_msg.message_id}")
                         else:
@@ -1020,48 +1423,16 @@ class MyMessageHandler:
                                 channel_id=channel_id,
                                 message_id=forwarded_msg.message_id,
                                 text=original_text,
-                                media_path=first_media['path'],
-                                media_type=first_media['type'],
-                                media_info=first_media['media_info']
+                                message=first_media['message'],
+                                media_type=first_media['type']
                             )
                             logging.info(f"成功编辑原消息添加第一个媒体: {forwarded_msg.message_id}")
 
                             # 发送剩余媒体作为媒体组
                             if remaining_media:
-                                # 创建媒体文件的副本，防止并发删除
-                                safe_media_list = []
-                                for media in remaining_media:
-                                    try:
-                                        # 检查文件是否存在
-                                        if os.path.exists(media['path']):
-                                            # 确保媒体缓存目录存在
-                                            media_cache_dir = "data/media_cache"
-                                            os.makedirs(media_cache_dir, exist_ok=True)
-
-                                            # 创建新的临时文件
-                                            with open(media['path'], 'rb') as src_file:
-                                                content = src_file.read()
-                                                tmp = NamedTemporaryFile(delete=False, prefix='tg_copy_', suffix=f'.{media["type"]}', dir=media_cache_dir)
-                                                tmp.write(content)
-                                                tmp.close()
-
-                                                # 更新媒体路径
-                                                new_media = media.copy()
-                                                new_media['path'] = tmp.name
-                                                # 记录临时文件
-                                                self.temp_files[tmp.name] = datetime.now()
-                                                safe_media_list.append(new_media)
-                                                logging.info(f"创建媒体文件副本: {tmp.name}")
-                                        else:
-                                            logging.warning(f"媒体文件不存在，无法创建副本: {media['path']}")
-                                            # 尝试使用缓存文件
-                                            if 'cache_path' in media and os.path.exists(media['cache_path']):
-                                                new_media = media.copy()
-                                                new_media['path'] = media['cache_path']
-                                                safe_media_list.append(new_media)
-                                                logging.info(f"使用缓存文件作为副本: {media['cache_path']}")
-                                    except Exception as e:
-                                        logging.error(f"创建媒体文件副本失败: {str(e)}")
+                                # 文件由媒体缓存管理，整个媒体组持有租约，发送期间不会被删除，无需复制
+                                safe_media_list = [media for media in remaining_media
+                                                   if not media['path'] or os.path.exists(media['path'])]
 
                                 # 使用安全的媒体列表发送
                                 if safe_media_list:
@@ -1085,9 +1456,8 @@ class MyMessageHandler:
                                                     channel_id=channel_id,
                                                     message_id=temp_msg.message_id,
                                                     text="",  # 空文本
-                                                    media_path=first_media['path'],
-                                                    media_type=first_media['type'],
-                                                    media_info=first_media['media_info']
+                                                    message=first_media['message'],
+                                                    media_type=first_media['type']
                                                 )
 
                                                 # 如果有多个媒体，发送剩余的
@@ -1108,38 +1478,7 @@ class MyMessageHandler:
                                         for media in safe_media_list:
                                             try:
                                                 # 发送单个媒体
-                                                with open(media['path'], 'rb') as media_file:
-                                                    file_data = media_file.read()
-                                                    send_kwargs = {
-                                                        'chat_id': channel_id,
-                                                        'caption': media['caption'],
-                                                        'reply_to_message_id': forwarded_msg.message_id,
-                                                        'read_timeout': 1800,
-                                                        'write_timeout': 1800
-                                                    }
-
-                                                    if media['type'] == 'photo':
-                                                        send_kwargs['photo'] = file_data
-                                                        await self.bot.send_photo(**send_kwargs)
-                                                    elif media['type'] == 'video':
-                                                        send_kwargs['video'] = file_data
-                                                        send_kwargs['supports_streaming'] = True
-
-                                                        # 添加视频参数
-                                                        media_info = media['media_info']
-                                                        if 'width' in media_info:
-                                                            send_kwargs['width'] = media_info['width']
-                                                        if 'height' in media_info:
-                                                            send_kwargs['height'] = media_info['height']
-                                                        if 'duration' in media_info:
-                                                            send_kwargs['duration'] = media_info['duration']
-
-                                                        await self.bot.send_video(**send_kwargs)
-                                                    elif media['type'] == 'document':
-                                                        send_kwargs['document'] = file_data
-                                                        if 'filename' in media['media_info']:
-                                                            send_kwargs['filename'] = media['media_info']['filename']
-                                                        await self.bot.send_document(**send_kwargs)
+                                                await self.send_album_item(channel_id, media, forwarded_msg.message_id)
                                                 logging.info("成功发送单个媒体作为回复")
                                             except Exception as e2:
                                                 logging.error(f"发送单个媒体失败: {str(e2)}")
@@ -1155,110 +1494,46 @@ class MyMessageHandler:
         except Exception as e:
             logging.error(f"处理媒体组时出错: {str(e)}")
             logging.error(traceback.format_exc())
+        finally:
+            leases.close()
+
+    async def download_album_item(self, message, media_type: str) -> dict:
+        """下载媒体组中的一个媒体，并发数受 album_download_concurrency 限制
+
+        已记录 file_id 的媒体不再下载，返回的 file_path 为 None。
+        """
+        cached = self.file_ids.get(self.get_media_id(message))
+        if cached:
+            return dict(cached[1], file_path=None)
+        async with self.album_downloads:
+            return await self.download_media_file(message, media_type)
 
     async def send_media_group(self, channel_id, media_list, reply_to_message_id=None):
-        """发送媒体组"""
+        """发送媒体组
+
+        已记录 file_id 的媒体直接发送 file_id，其余媒体上传后记录返回的 file_id，
+        同一媒体组发往其余目标时不再重复上传。
+        """
         try:
             # 如果只有一个媒体文件，使用单个发送
             if len(media_list) == 1:
-                media = media_list[0]
-                with open(media['path'], 'rb') as media_file:
-                    file_data = media_file.read()
-                    send_kwargs = {
-                        'chat_id': channel_id,
-                        'caption': media['caption'],
-                        'read_timeout': 1800,
-                        'write_timeout': 1800
-                    }
-
-                    if reply_to_message_id:
-                        send_kwargs['reply_to_message_id'] = reply_to_message_id
-
-                    if media['type'] == 'photo':
-                        send_kwargs['photo'] = file_data
-                        await self.bot.send_photo(**send_kwargs)
-                    elif media['type'] == 'video':
-                        send_kwargs['video'] = file_data
-                        send_kwargs['supports_streaming'] = True
-
-                        # 添加视频参数
-                        media_info = media['media_info']
-                        if 'width' in media_info:
-                            send_kwargs['width'] = media_info['width']
-                        if 'height' in media_info:
-                            send_kwargs['height'] = media_info['height']
-                        if 'duration' in media_info:
-                            send_kwargs['duration'] = media_info['duration']
-
-                        await self.bot.send_video(**send_kwargs)
-                    elif media['type'] == 'document':
-                        send_kwargs['document'] = file_data
-                        if 'filename' in media['media_info']:
-                            send_kwargs['filename'] = media['media_info']['filename']
-                        await self.bot.send_document(**send_kwargs)
+                if await self.send_album_item(channel_id, media_list[0], reply_to_message_id) is None:
+                    raise RuntimeError("媒体文件下载失败")
 
             # 如果有多个媒体文件，使用媒体组发送
             else:
-                # 准备媒体输入列表
-                from telegram import InputMediaPhoto, InputMediaVideo, InputMediaDocument
-                input_media = []
-
-                for i, media in enumerate(media_list):
-                    with open(media['path'], 'rb') as media_file:
-                        file_data = media_file.read()
-                        caption = media['caption'] if i == 0 else None  # 只在第一个媒体上显示标题
-
-                        if media['type'] == 'photo':
-                            input_media.append(InputMediaPhoto(
-                                media=file_data,
-                                caption=caption,
-                                parse_mode='Markdown' if caption else None
-                            ))
-                        elif media['type'] == 'video':
-                            media_kwargs = {
-                                'media': file_data,
-                                'caption': caption,
-                                'parse_mode': 'Markdown' if caption else None,
-                                'supports_streaming': True
-                            }
-
-                            # 添加视频参数
-                            media_info = media['media_info']
-                            if 'width' in media_info:
-                                media_kwargs['width'] = media_info['width']
-                            if 'height' in media_info:
-                                media_kwargs['height'] = media_info['height']
-                            if 'duration' in media_info:
-                                media_kwargs['duration'] = media_info['duration']
-
-                            input_media.append(InputMediaVideo(**media_kwargs))
-                        elif media['type'] == 'document':
-                            doc_kwargs = {
-                                'media': file_data,
-                                'caption': caption,
-                                'parse_mode': 'Markdown' if caption else None
-                            }
-
-                            if 'filename' in media['media_info']:
-                                doc_kwargs['filename'] = media['media_info']['filename']
-
-                            input_media.append(InputMediaDocument(**doc_kwargs))
-                        else:
-                            # 如果是未知类型，默认作为文档处理
-                            input_media.append(InputMediaDocument(
-                                media=file_data,
-                                caption=caption,
-                                parse_mode='Markdown' if caption else None
-                            ))
-
-                # 发送媒体组
-                await self.bot.send_media_group(
-                    chat_id=channel_id,
-                    media=input_media,
-                    reply_to_message_id=reply_to_message_id,
-                    read_timeout=1800,
-                    write_timeout=1800
-                )
+                for _ in range(2):
+                    try:
+                        await self.send_album(channel_id, media_list, reply_to_message_id)
+                        break
+                    except telegram_error.BadRequest as e:
+                        media_ids = [self.get_media_id(media['message']) for media in media_list]
+                        cached_ids = [media_id for media_id in media_ids if self.file_ids.get(media_id)]
+                        if not cached_ids or not is_file_id_error(e):
+                            raise
+                        logging.warning(f"媒体组中的 file_id 已失效，重新上传: {e}")
+                        for media_id in cached_ids:
+                            self.file_ids.invalidate(media_id)
 
             # 清理媒体文件
             for media in media_list:
@@ -1273,25 +1548,7 @@ class MyMessageHandler:
             # 如果失败，尝试逐个发送
             try:
                 for media in media_list:
-                    with open(media['path'], 'rb') as media_file:
-                        file_data = media_file.read()
-                        send_kwargs = {
-                            'chat_id': channel_id,
-                            'caption': media['caption'],
-                            'reply_to_message_id': reply_to_message_id,
-                            'read_timeout': 1800,
-                            'write_timeout': 1800
-                        }
-
-                        if media['type'] == 'photo':
-                            send_kwargs['photo'] = file_data
-                            await self.bot.send_photo(**send_kwargs)
-                        elif media['type'] == 'video':
-                            send_kwargs['video'] = file_data
-                            await self.bot.send_video(**send_kwargs)
-                        elif media['type'] == 'document':
-                            send_kwargs['document'] = file_data
-                            await self.bot.send_document(**send_kwargs)
+                    await self.send_album_item(channel_id, media, reply_to_message_id)
 
                     # 清理媒体文件
                     await self.cleanup_file(media['path'])
@@ -1302,41 +1559,161 @@ class MyMessageHandler:
                 for media in media_list:
                     await self.cleanup_file(media['path'])
 
+    async def send_album(self, channel_id, media_list, reply_to_message_id=None):
+        """以一次 send_media_group 发送多个媒体，并记录上传媒体的 file_id"""
+        from telegram import InputMediaPhoto, InputMediaVideo, InputMediaDocument
+
+        # 按 media_id 顺序持有未缓存媒体的上传锁，避免多个目标同时上传同一媒体组
+        media_ids = [self.get_media_id(media['message']) for media in media_list]
+        async with AsyncExitStack() as locks:
+            for media_id in sorted({media_id for media_id in media_ids if not self.file_ids.get(media_id)}):
+                await locks.enter_async_context(self.file_ids.lock(media_id))
+
+            input_media = []
+            uploaded = []
+            # 所有文件句柄保持打开直到媒体组上传完成
+            async with AsyncExitStack() as stack:
+                for i, (media, media_id) in enumerate(zip(media_list, media_ids)):
+                    cached = self.file_ids.get(media_id)
+                    if cached:
+                        file_data, media_info = cached
+                        self.file_ids.hits += 1
+                    else:
+                        if not media['path']:
+                            # 下载时已有 file_id，之后 file_id 失效，需要重新下载
+                            media['media_info'] = await self.download_media_file(media['message'], media['type'])
+                            if not media['media_info']:
+                                raise RuntimeError("媒体文件下载失败")
+                            media['path'] = media['media_info']['file_path']
+                        media_info = media['media_info']
+                        media_file = await stack.enter_async_context(open_upload(media['path']))
+                        file_data = as_input_file(media_file, attach=True)
+                        uploaded.append(i)
+                    caption = media['caption'] if i == 0 else None  # 只在第一个媒体上显示标题
+
+                    if media['type'] == 'photo':
+                        input_media.append(InputMediaPhoto(
+                            media=file_data,
+                            caption=caption,
+                            parse_mode='Markdown' if caption else None
+                        ))
+                    elif media['type'] == 'video':
+                        media_kwargs = {
+                            'media': file_data,
+                            'caption': caption,
+                            'parse_mode': 'Markdown' if caption else None,
+                            'supports_streaming': True
+                        }
+
+                        # 添加视频参数
+                        if 'width' in media_info:
+                            media_kwargs['width'] = media_info['width']
+                        if 'height' in media_info:
+                            media_kwargs['height'] = media_info['height']
+                        if 'duration' in media_info:
+                            media_kwargs['duration'] = media_info['duration']
+
+                        input_media.append(InputMediaVideo(**media_kwargs))
+                    else:
+                        # 文档和未知类型都作为文档处理
+                        doc_kwargs = {
+                            'media': file_data,
+                            'caption': caption,
+                            'parse_mode': 'Markdown' if caption else None
+                        }
+
+                        if 'filename' in media_info:
+                            doc_kwargs['filename'] = media_info['filename']
+
+                        input_media.append(InputMediaDocument(**doc_kwargs))
+
+                # 发送媒体组
+                sent = await self.bot.send_media_group(
+                    chat_id=channel_id,
+                    media=input_media,
+                    reply_to_message_id=reply_to_message_id,
+                    read_timeout=1800,
+                    write_timeout=1800
+                )
+
+            # 返回的消息与媒体顺序一致
+            for i in uploaded:
+                if i >= len(sent):
+                    break
+                file_id = extract_file_id(sent[i], media_list[i]['type'])
+                if file_id:
+                    self.file_ids.set(media_ids[i], file_id, media_list[i]['media_info'])
+            if uploaded:
+                logging.info(f"已记录媒体组中 {len(uploaded)} 个媒体的 file_id，其余目标将直接复用")
+            return sent
+
+    async def send_album_item(self, channel_id, media, reply_to_message_id=None):
+        """单独发送媒体组中的一个媒体，同一媒体只上传一次"""
+        async def send(file_data, media_info):
+            send_kwargs = {
+                'chat_id': channel_id,
+                'caption': media['caption'],
+                'read_timeout': 1800,
+                'write_timeout': 1800
+            }
+
+            if reply_to_message_id:
+                send_kwargs['reply_to_message_id'] = reply_to_message_id
+
+            if media['type'] == 'photo':
+                send_kwargs['photo'] = as_input_file(file_data)
+                return await self.bot.send_photo(**send_kwargs)
+            elif media['type'] == 'video':
+                send_kwargs['video'] = as_input_file(file_data)
+                send_kwargs['supports_streaming'] = True
+
+                # 添加视频参数
+                if 'width' in media_info:
+                    send_kwargs['width'] = media_info['width']
+                if 'height' in media_info:
+                    send_kwargs['height'] = media_info['height']
+                if 'duration' in media_info:
+                    send_kwargs['duration'] = media_info['duration']
+
+                return await self.bot.send_video(**send_kwargs)
+            elif media['type'] == 'document':
+                send_kwargs['document'] = as_input_file(file_data, media_info.get('filename'))
+                if 'filename' in media_info:
+                    send_kwargs['filename'] = media_info['filename']
+                return await self.bot.send_document(**send_kwargs)
+            return None
+
+        return await self.send_media_once(media['message'], media['type'], send)
+
     async def handle_sticker_send(self, message, channel_id, from_chat, reply_to_message_id=None):
         """处理贴图发送"""
         try:
             logging.info("开始处理贴图发送")
 
-            # 下载贴图文件
-            sticker_path = await self.client.download_media(message.media)
-            logging.info(f"贴图下载完成: {sticker_path}")
-
             # 构建用户名部分
             username = f"(@{from_chat.username})" if getattr(from_chat, 'username', None) else ""
 
             # 使用简化的模板作为贴图标题
             caption = f"📨 转发自 {getattr(from_chat, 'title', 'Unknown Channel')} {username}"
 
-            # 发送贴图
-            with open(sticker_path, 'rb') as sticker_file:
-                await self.bot.send_sticker(
+            async def send(media, media_info):
+                return await self.bot.send_sticker(
                     chat_id=channel_id,
-                    sticker=sticker_file.read(),
+                    sticker=as_input_file(media),
                     reply_to_message_id=reply_to_message_id
                 )
 
-                # 如果有标题且没有回复消息，发送标题
-                if caption and not reply_to_message_id:
-                    await self.bot.send_message(
-                        chat_id=channel_id,
-                        text=caption,
-                        disable_web_page_preview=True
-                    )
+            # 发送贴图，多个目标共用一次下载和上传
+            if await self.send_media_once(message, 'sticker', send) is None:
+                raise RuntimeError("贴图下载失败")
 
-            # 清理临时文件
-            if sticker_path and os.path.exists(sticker_path):
-                os.remove(sticker_path)
-                logging.info(f"贴图文件已清理: {sticker_path}")
+            # 如果有标题且没有回复消息，发送标题
+            if caption and not reply_to_message_id:
+                await self.bot.send_message(
+                    chat_id=channel_id,
+                    text=caption,
+                    disable_web_page_preview=True
+                )
 
             logging.info("贴图发送成功")
 
@@ -1354,13 +1731,6 @@ class MyMessageHandler:
             except Exception as e2:
                 logging.error(f"发送错误消息失败: {str(e2)}")
 
-            # 清理临时文件
-            if 'sticker_path' in locals() and sticker_path and os.path.exists(sticker_path):
-                try:
-                    os.remove(sticker_path)
-                except Exception as e3:
-                    logging.error(f"清理贴图文件失败: {str(e3)}")
-
     async def handle_custom_emoji(self, message, channel_id):
         """处理自定义表情和特殊格式消息"""
         try:
@@ -1433,15 +1803,6 @@ class MyMessageHandler:
         try:
             logging.info(f"开始处理媒体编辑: 类型={media_type}, 消息 ID={forwarded_msg.message_id}")
 
-            # 下载媒体文件
-            media_info = await self.download_media_file(message, media_type)
-            if not media_info:
-                logging.error("媒体文件下载失败")
-                return
-
-            file_path = media_info.get('file_path')
-            media_type = media_info.get('media_type')
-
             # 获取原消息文本
             original_text = forwarded_msg.text or forwarded_msg.caption or ""
 
@@ -1454,19 +1815,17 @@ class MyMessageHandler:
 
             if has_potential_parsing_issues:
                 # 对于可能有解析问题的消息，直接使用回复方式发送媒体
-                try:
-                    await self.handle_media_send(
-                        message=message,
-                        channel_id=channel_id,
-                        media_type=media_type,
-                        reply_to_message_id=forwarded_msg.message_id,
-                        from_chat=from_chat
-                    )
+                if await self.handle_media_send(
+                    message=message,
+                    channel_id=channel_id,
+                    media_type=media_type,
+                    reply_to_message_id=forwarded_msg.message_id,
+                    from_chat=from_chat
+                ):
                     logging.info("使用回复方式成功发送媒体")
                     return
-                except Exception as reply_error:
-                    logging.error(f"回复方式发送媒体失败: {str(reply_error)}")
-                    # 继续尝试编辑方式
+                logging.error("回复方式发送媒体失败")
+                # 继续尝试编辑方式
 
             # 使用编辑消息方式添加媒体
             try:
@@ -1474,9 +1833,8 @@ class MyMessageHandler:
                     channel_id=channel_id,
                     message_id=forwarded_msg.message_id,
                     text=original_text,
-                    media_path=file_path,
-                    media_type=media_type,
-                    media_info=media_info
+                    message=message,
+                    media_type=media_type
                 )
                 logging.info(f"成功将媒体添加到消息: {forwarded_msg.message_id}")
             except telegram_error.BadRequest as br_error:
@@ -1489,9 +1847,8 @@ class MyMessageHandler:
                             channel_id=channel_id,
                             message_id=forwarded_msg.message_id,
                             text=original_text,
-                            media_path=file_path,
+                            message=message,
                             media_type=media_type,
-                            media_info=media_info,
                             force_plain_text=True
                         )
                         logging.info("使用纯文本模式成功编辑消息添加媒体")
@@ -1508,62 +1865,56 @@ class MyMessageHandler:
 
             # 如果编辑失败，尝试作为回复发送媒体
             try:
-                if 'file_path' in locals() and os.path.exists(file_path):
-                    await self.handle_media_send(
-                        message=message,
-                        channel_id=channel_id,
-                        media_type=media_type,
-                        reply_to_message_id=forwarded_msg.message_id,
-                        from_chat=from_chat
-                    )
+                if await self.handle_media_send(
+                    message=message,
+                    channel_id=channel_id,
+                    media_type=media_type,
+                    reply_to_message_id=forwarded_msg.message_id,
+                    from_chat=from_chat
+                ):
                     logging.info("使用回复方式成功发送媒体（作为备用方法）")
             except Exception as e2:
                 logging.error(f"备用方法发送媒体失败: {str(e2)}")
 
-    async def edit_message_with_media(self, channel_id, message_id, text, media_path, media_type, media_info, force_plain_text=False):
+    async def edit_message_with_media(self, channel_id, message_id, text, message, media_type, force_plain_text=False):
         """编辑消息以包含媒体文件
 
         Args:
             channel_id: 频道ID
             message_id: 消息ID
             text: 消息文本
-            media_path: 媒体文件路径
+            message: 包含媒体的源消息
             media_type: 媒体类型
-            media_info: 媒体信息字典
             force_plain_text: 是否强制使用纯文本模式（不使用Markdown）
         """
         try:
             logging.info(f"开始编辑消息添加媒体: 消息 ID={message_id}, 媒体类型={media_type}")
 
-            # 使用编辑消息API而不是删除重发
-            with open(media_path, 'rb') as media_file:
-                file_data = media_file.read()
-
-                try:
-                    # 检查消息是否包含自定义表情或强制纯文本
-                    has_custom_emoji = False
-                    if text and ('\ud83c' in text or '\ud83d' in text or '\ud83e' in text):
-                        # 简单检测是否可能包含表情
-                        has_custom_emoji = True
-                        logging.info("检测到可能包含表情的消息，禁用Markdown解析")
+            # 检查消息是否包含自定义表情或强制纯文本
+            has_custom_emoji = False
+            if text and ('\ud83c' in text or '\ud83d' in text or '\ud83e' in text):
+                # 简单检测是否可能包含表情
+                has_custom_emoji = True
+                logging.info("检测到可能包含表情的消息，禁用Markdown解析")
 
-                    # 确定是否使用Markdown
-                    use_markdown = not (has_custom_emoji or force_plain_text)
-                    if force_plain_text:
-                        logging.info("强制使用纯文本模式")
+            # 确定是否使用Markdown
+            use_markdown = not (has_custom_emoji or force_plain_text)
+            if force_plain_text:
+                logging.info("强制使用纯文本模式")
 
+            async def send(media, media_info):
+                from telegram import InputMediaPhoto, InputMediaVideo, InputMediaDocument
+                try:
                     # 准备媒体对象
                     if media_type == 'photo':
-                        from telegram import InputMediaPhoto
-                        media = InputMediaPhoto(
-                            media=file_data,
+                        input_media = InputMediaPhoto(
+                            media=as_input_file(media, attach=True),
                             caption=text,
                             parse_mode='Markdown' if use_markdown else None
                         )
                     elif media_type == 'video':
-                        from telegram import InputMediaVideo
                         media_kwargs = {
-                            'media': file_data,
+                            'media': as_input_file(media, attach=True),
                             'caption': text,
                             'parse_mode': 'Markdown' if use_markdown else None,
                             'supports_streaming': True
@@ -1577,39 +1928,38 @@ class MyMessageHandler:
                         if 'duration' in media_info:
                             media_kwargs['duration'] = media_info['duration']
 
-                        media = InputMediaVideo(**media_kwargs)
-                    elif media_type == 'document':
-                        from telegram import InputMediaDocument
+                        input_media = InputMediaVideo(**media_kwargs)
+                    else:
+                        # 文档和未知类型都作为文档处理
                         doc_kwargs = {
-                            'media': file_data,
+                            'media': as_input_file(media, media_info.get('filename'), attach=True),
                             'caption': text,
                             'parse_mode': 'Markdown' if use_markdown else None
                         }
 
-                        if 'filename' in media_info:
+                        if media_type == 'document' and 'filename' in media_info:
                             doc_kwargs['filename'] = media_info['filename']
 
-                        media = InputMediaDocument(**doc_kwargs)
-                    else:
-                        # 如果是未知类型，默认作为文档处理
-                        from telegram import InputMediaDocument
-                        media = InputMediaDocument(
-                            media=file_data,
-                            caption=text,
-                            parse_mode='Markdown' if use_markdown else None
-                        )
+                        input_media = InputMediaDocument(**doc_kwargs)
 
                     # 编辑消息媒体
-                    await self.bot.edit_message_media(
+                    edited = await self.bot.edit_message_media(
                         chat_id=channel_id,
                         message_id=message_id,
-                        media=media,
+                        media=input_media,
                         read_timeout=1800,
                         write_timeout=1800
                     )
 
                     logging.info(f"成功编辑消息并添加{media_type}")
+                    return edited
                 except Exception as edit_error:
+                    # file_id 失效时交给 send_media_once 重新上传，不删除原消息
+                    if isinstance(media, str) and is_file_id_error(edit_error):
+                        raise
+                    # 边下载边上传时下载失败，管道中的数据已被读取，交给 send_media_once 下载完成后重试，不删除原消息
+                    if isinstance(edit_error.__cause__, DownloadPipeError):
+                        raise
                     logging.error(f"编辑消息媒体失败，尝试删除重发: {str(edit_error)}")
 
                     # 删除原消息并重新发送
@@ -1627,11 +1977,12 @@ class MyMessageHandler:
                         'write_timeout': 1800
                     }
 
+                    sent = None
                     if media_type == 'photo':
-                        send_kwargs['photo'] = file_data
-                        await self.bot.send_photo(**send_kwargs)
+                        send_kwargs['photo'] = as_input_file(media)
+                        sent = await self.bot.send_photo(**send_kwargs)
                     elif media_type == 'video':
-                        send_kwargs['video'] = file_data
+                        send_kwargs['video'] = as_input_file(media)
                         send_kwargs['supports_streaming'] = True
 
                         # 添加视频参数
@@ -1642,24 +1993,20 @@ class MyMessageHandler:
                         if 'duration' in media_info:
                             send_kwargs['duration'] = media_info['duration']
                         if 'thumb_path' in media_info and os.path.exists(media_info['thumb_path']):
-                            with open(media_info['thumb_path'], 'rb') as thumb_file:
-                                send_kwargs['thumb'] = thumb_file.read()
+                            send_kwargs['thumbnail'] = await read_file(media_info['thumb_path'])
 
-                        await self.bot.send_video(**send_kwargs)
-
-                        # 清理缩略图
-                        if 'thumb_path' in media_info and os.path.exists(media_info['thumb_path']):
-                            os.remove(media_info['thumb_path'])
+                        sent = await self.bot.send_video(**send_kwargs)
                     elif media_type == 'document':
-                        send_kwargs['document'] = file_data
+                        send_kwargs['document'] = as_input_file(media, media_info.get('filename'))
                         if 'filename' in media_info:
                             send_kwargs['filename'] = media_info['filename']
-                        await self.bot.send_document(**send_kwargs)
+                        sent = await self.bot.send_document(**send_kwargs)
 
                     logging.info(f"使用删除重发方式成功添加{media_type}")
+                    return sent
 
-            # 清理媒体文件
-            await self.cleanup_file(media_path)
+            if await self.send_media_once(message, media_type, send) is None:
+                raise RuntimeError("媒体文件下载失败")
 
         except Exception as e:
             logging.error(f"编辑消息添加媒体失败: {str(e)}")
@@ -1678,6 +2025,3 @@ class MyMessageHandler:
                 )
             except Exception as e2:
                 logging.error(f"恢复消息失败: {str(e2)}")
-
-            # 清理媒体文件
-            await self.cleanup_file(media_path)
\ No newline at end of file
@@ -0,0 +1,238 @@
+# parallel_download.py
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+from telethon import TelegramClient, utils
+from telethon.network import MTProtoSender
+from telethon.tl import functions, types
+from telethon.tl.alltlobjects import LAYER
+
+# upload.getFile 的单次请求大小：4KB 的倍数且整除 1MB，最大 512KB
+REQUEST_SIZES = (64 * 1024, 128 * 1024, 256 * 1024, 512 * 1024)
+# 分配给各连接的字节范围大小（1MB 的倍数，请求不会跨越范围边界）
+PART_SIZE = 4 * 1024 * 1024
+
+
+class RequestSizer:
+    """根据实测吞吐量调整单次请求大小
+
+    每个大小记录吞吐量的滑动平均，每采样若干次后与相邻大小比较：
+    更大的大小未测过或更快时增大，更小的大小明显更快时减小。
+    """
+
+    SAMPLES = 4
+
+    def __init__(self, level: int = 1):
+        self.level = level
+        self.rates: Dict[int, float] = {}
+        self.samples = 0
+
+    @property
+    def size(self) -> int:
+        return REQUEST_SIZES[self.level]
+
+    def record(self, size: int, nbytes: int, elapsed: float):
+        """记录一次请求的字节数和耗时"""
+        if elapsed <= 0 or nbytes <= 0 or size != self.size:
+            return
+        rate = nbytes / elapsed
+        old = self.rates.get(size)
+        self.rates[size] = rate if old is None else old * 0.7 + rate * 0.3
+        self.samples += 1
+        if self.samples < self.SAMPLES:
+            return
+        self.samples = 0
+
+        current = self.rates[size]
+        if self.level + 1 < len(REQUEST_SIZES):
+            bigger = self.rates.get(REQUEST_SIZES[self.level + 1])
+            if bigger is None or bigger > current:
+                self.level += 1
+                return
+        if self.level > 0:
+            smaller = self.rates.get(REQUEST_SIZES[self.level - 1])
+            if smaller is not None and smaller > current * 1.1:
+                self.level -= 1
+
+    def aligned(self, offset: int) -> int:
+        """返回不超过当前大小、且 offset 能整除的请求大小"""
+        size = self.size
+        while size > REQUEST_SIZES[0] and offset % size:
+            size //= 2
+        return size
+
+
+class ParallelDownloader:
+    """多连接分段下载大文件
+
+    文件按 PART_SIZE 切分成字节范围，由 connections 个 MTProto 连接并行
+    请求 upload.getFile，每段数据在线程中用 pwrite 写到预分配文件的对应
+    偏移处。文件不在当前 DC 时只导出一次授权，同一 DC 的后续连接复用
+    导出的 auth key。
+    """
+
+    def __init__(self, client: TelegramClient, connections: int = 4,
+                 threshold: int = 10 * 1024 * 1024):
+        self.client = client
+        self.connections = max(1, connections)
+        self.threshold = threshold
+        # dc_id -> 导入授权后的 auth key
+        self.auth_keys = {}
+        self.export_lock = asyncio.Lock()
+
+        # 统计信息
+        self.downloads = 0
+        self.failures = 0
+        self.bytes = 0
+
+    def supports(self, media, file_size: int) -> bool:
+        """只对超过阈值的文档（视频、文件、音频等）使用分段下载"""
+        return self.connections > 1 and file_size >= self.threshold \
+            and isinstance(media, types.MessageMediaDocument)
+
+    async def download(self, media, path: str, file_size: int,
+                       on_chunk: Optional[Callable[[int, int], None]] = None):
+        """下载到 path，失败时抛出异常，由调用方改用单连接下载
+
+        on_chunk(offset, length) 在每段数据写入文件后调用。
+        """
+        dc_id, location = utils.get_input_location(media)
+        parts = asyncio.Queue()
+        for offset in range(0, file_size, PART_SIZE):
+            parts.put_nowait(offset)
+        workers = min(self.connections, parts.qsize())
+
+        fd = await asyncio.to_thread(self._preallocate, path, file_size)
+        senders: List[MTProtoSender] = []
+        tasks: List[asyncio.Task] = []
+        progress = {'bytes': 0, 'logged': 0}
+        started = time.monotonic()
+        try:
+            for _ in range(workers):
+                senders.append(await self._create_sender(dc_id))
+            tasks = [
+                asyncio.create_task(self._worker(sender, location, parts, fd, file_size, progress, on_chunk))
+                for sender in senders
+            ]
+            await asyncio.gather(*tasks)
+        except BaseException:
+            self.failures += 1
+            raise
+        finally:
+            # 一个连接失败时先停止其余连接并等待它们退出，之后才能关闭连接和文件，
+            # 避免迟到的写入落到已关闭（或被单连接下载重新打开）的文件描述符上
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*(sender.disconnect() for sender in senders), return_exceptions=True)
+            await asyncio.to_thread(os.close, fd)
+
+        if progress['bytes'] != file_size:
+            self.failures += 1
+            raise IOError(f"分段下载不完整: {progress['bytes']}/{file_size}")
+
+        elapsed = time.monotonic() - started
+        self.downloads += 1
+        self.bytes += file_size
+        logging.info(f"分段下载完成: {file_size / (1024 * 1024):.1f}MB, {workers} 个连接, "
+                     f"{elapsed:.1f}s ({file_size / (1024 * 1024) / max(elapsed, 0.001):.1f}MB/s)")
+
+    @staticmethod
+    def _preallocate(path: str, file_size: int) -> int:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, file_size)
+        except OSError:
+            os.close(fd)
+            raise
+        return fd
+
+    async def _worker(self, sender: MTProtoSender, location, parts: asyncio.Queue,
+                      fd: int, file_size: int, progress: Dict[str, int],
+                      on_chunk: Optional[Callable[[int, int], None]]):
+        sizer = RequestSizer()
+        while True:
+            try:
+                part = parts.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            offset = part
+            end = min(part + PART_SIZE, file_size)
+            while offset < end:
+                limit = sizer.aligned(offset)
+                started = time.monotonic()
+                result = await sender.send(functions.upload.GetFileRequest(location, offset, limit))
+                elapsed = time.monotonic() - started
+                if not isinstance(result, types.upload.File):
+                    # CDN 重定向等情况交给单连接下载处理
+                    raise IOError(f"不支持的下载结果: {type(result).__name__}")
+                data = result.bytes
+                if not data:
+                    raise IOError(f"偏移 {offset} 处没有返回数据")
+                await self._write(fd, data, offset)
+                if on_chunk:
+                    on_chunk(offset, len(data))
+                sizer.record(limit, len(data), elapsed)
+                offset += len(data)
+                self._progress(progress, len(data), file_size)
+                if len(data) < limit and offset < end:
+                    raise IOError(f"偏移 {offset} 处数据不完整")
+
+    @staticmethod
+    async def _write(fd: int, data: bytes, offset: int):
+        """在线程中写入文件；任务被取消时等写入完成后再退出，调用方随后才会关闭文件"""
+        write = asyncio.ensure_future(asyncio.to_thread(os.pwrite, fd, data, offset))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            await asyncio.gather(write, return_exceptions=True)
+            raise
+
+    @staticmethod
+    def _progress(progress: Dict[str, int], nbytes: int, file_size: int):
+        progress['bytes'] += nbytes
+        step = 50 * 1024 * 1024
+        if progress['bytes'] - progress['logged'] >= step:
+            progress['logged'] = progress['bytes'] - progress['bytes'] % step
+            logging.info(f"下载进度: {progress['bytes'] / file_size * 100:.1f}% "
+                         f"({progress['bytes'] / (1024 * 1024):.1f}MB/{file_size / (1024 * 1024):.1f}MB)")
+
+    async def _create_sender(self, dc_id: Optional[int]) -> MTProtoSender:
+        """为文件所在 DC 创建独立的 MTProto 连接"""
+        client = self.client
+        if not dc_id:
+            dc_id = client.session.dc_id
+        dc = await client._get_dc(dc_id)
+        if dc_id == client.session.dc_id:
+            auth_key = client.session.auth_key
+        else:
+            auth_key = self.auth_keys.get(dc_id)
+
+        sender = MTProtoSender(auth_key, loggers=client._log)
+        await sender.connect(client._connection(
+            dc.ip_address, dc.port, dc.id,
+            loggers=client._log, proxy=client._proxy, local_addr=client._local_addr
+        ))
+        if auth_key is None:
+            # 第一次连接其他 DC：导出并导入授权，之后的连接复用 auth key
+            try:
+                async with self.export_lock:
+                    auth = await client(functions.auth.ExportAuthorizationRequest(dc_id))
+                    client._init_request.query = functions.auth.ImportAuthorizationRequest(
+                        id=auth.id, bytes=auth.bytes)
+                    await sender.send(functions.InvokeWithLayerRequest(LAYER, client._init_request))
+                    self.auth_keys[dc_id] = sender.auth_key
+            except BaseException:
+                await sender.disconnect()
+                raise
+        return sender
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取下载统计信息"""
+        return {
+            'downloads': self.downloads,
+            'failures': self.failures,
+            'bytes': self.bytes
+        }
@@ -0,0 +1,190 @@
+# rate_limiter.py
+import asyncio
+import inspect
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+from telegram import error as telegram_error
+
+# 需要计入单个聊天发送频率的 Bot API 方法前缀
+CHAT_LIMITED_PREFIXES = ('send_', 'edit_message_', 'copy_message', 'forward_message', 'delete_message')
+
+# 一次发送多条消息的方法：消息列表的参数名和位置，按消息数量计入发送频率
+BATCH_SEND_ARGS = {
+    'send_media_group': ('media', 1),
+    'copy_messages': ('message_ids', 2),
+    'forward_messages': ('message_ids', 2),
+}
+
+
+class TokenBucket:
+    """令牌桶限速器
+
+    acquire 使用 asyncio.Lock 排队，调用者按先后顺序获得令牌。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """在指定时间内暂停发放令牌（用于 RetryAfter）"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self, cost: float = 1) -> float:
+        """获取 cost 个令牌，返回等待的秒数
+
+        cost 超过桶容量时在桶满后发放，不足的令牌由之后的调用者等待补足。
+        """
+        need = min(cost, self.capacity)
+        waited = 0.0
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - max(self.updated, self.blocked_until)) * self.rate)
+                    self.updated = now
+                    if self.tokens >= need:
+                        self.tokens -= cost
+                        return waited
+                    delay = (need - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+def retry_after_seconds(error: telegram_error.RetryAfter) -> float:
+    """兼容 retry_after 为 int 或 timedelta 的不同版本"""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def call_cost(method_name: str, args, kwargs) -> int:
+    """一次调用发送的消息数量"""
+    param = BATCH_SEND_ARGS.get(method_name)
+    if param is None:
+        return 1
+    name, position = param
+    items = kwargs.get(name, args[position] if len(args) > position else None)
+    return len(items) if items else 1
+
+
+class SendScheduler:
+    """Bot API 调用的统一发送调度器
+
+    包装 telegram.Bot，所有方法调用都会经过：
+    - 全局令牌桶（默认约 30 条/秒）
+    - 每个聊天的令牌桶（群组和频道默认 20 条/分钟，私聊 1 条/秒）
+    - 媒体组和批量复制按消息数量计入两个令牌桶
+    - 遇到 RetryAfter 时暂停对应的令牌桶，等待后重新排队发送
+
+    未在这里定义的属性直接转发给原始 bot 对象。
+    """
+
+    def __init__(self, bot, global_rate: float = 25, global_burst: float = 5,
+                 chat_per_minute: float = 20, chat_burst: float = 3,
+                 private_chat_rate: float = 1, max_retries: int = 5):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        # 保证任意一分钟内的发送量不超过 chat_per_minute
+        self.chat_rate = max(chat_per_minute - chat_burst, 1) / 60
+        self.chat_burst = chat_burst
+        self.private_chat_rate = private_chat_rate
+        self.max_retries = max_retries
+        self.chat_buckets: Dict[Any, TokenBucket] = {}
+        # 发送失败时的回调，参数为 (chat_id, error)
+        self.error_listeners: List[Callable[[Any, Exception], None]] = []
+
+        # 统计信息
+        self.calls = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.retry_after_events = 0
+
+    def _get_chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # 负数ID是群组或频道，正数ID是私聊
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_chat_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def call(self, method_name: str, *args, **kwargs):
+        """按限速规则调用 bot 方法，遇到 RetryAfter 时等待后重试"""
+        method = getattr(self.bot, method_name)
+        chat_id = kwargs.get('chat_id', args[0] if args else None)
+        chat_bucket: Optional[TokenBucket] = None
+        if chat_id is not None and method_name.startswith(CHAT_LIMITED_PREFIXES):
+            chat_bucket = self._get_chat_bucket(chat_id)
+        # 媒体组和批量复制的每条消息都计入频率限制
+        cost = call_cost(method_name, args, kwargs)
+
+        attempt = 0
+        while True:
+            waited = 0.0
+            if chat_bucket:
+                waited += await chat_bucket.acquire(cost)
+            waited += await self.global_bucket.acquire(cost)
+            if waited > 0:
+                self.throttled += 1
+                self.throttled_seconds += waited
+
+            self.calls += 1
+            try:
+                return await method(*args, **kwargs)
+            except telegram_error.RetryAfter as e:
+                attempt += 1
+                self.retry_after_events += 1
+                delay = retry_after_seconds(e)
+                if attempt > self.max_retries:
+                    logging.error(f"{method_name} 到聊天 {chat_id} 连续触发限流 {attempt} 次，放弃发送")
+                    raise
+                logging.warning(f"{method_name} 到聊天 {chat_id} 触发限流，{delay:.0f} 秒后重新排队 (第 {attempt} 次)")
+                # 暂停令牌桶，同一聊天的其他发送也会一起等待
+                (chat_bucket or self.global_bucket).pause(delay)
+            except telegram_error.TelegramError as e:
+                self._notify_error(chat_id, e)
+                raise
+
+    def add_error_listener(self, listener: Callable[[Any, Exception], None]):
+        """注册发送失败的回调"""
+        self.error_listeners.append(listener)
+
+    def _notify_error(self, chat_id, error: Exception):
+        for listener in self.error_listeners:
+            try:
+                listener(chat_id, error)
+            except Exception as e:
+                logging.error(f"发送失败回调出错: {e}")
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.bot, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        async def limited(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+
+        return limited
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取发送统计信息"""
+        return {
+            'calls': self.calls,
+            'throttled': self.throttled,
+            'throttled_seconds': self.throttled_seconds,
+            'retry_after_events': self.retry_after_events,
+            'chats': len(self.chat_buckets)
+        }
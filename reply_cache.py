@@ -0,0 +1,109 @@
+# reply_cache.py
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def shorten(content: str, limit: int = 50) -> str:
+    """截取回复预览文本"""
+    return content[:limit] + "..." if len(content) > limit else content
+
+
+class LRUCache:
+    """固定容量的 LRU 缓存"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = max(1, maxsize)
+        self.data: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        return key in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def get(self, key, default=None):
+        try:
+            self.data.move_to_end(key)
+        except KeyError:
+            return default
+        return self.data[key]
+
+    def set(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self.data.pop(key, default)
+
+    def clear(self):
+        self.data.clear()
+
+
+class ReplyCache:
+    """回复链解析缓存
+
+    - messages: (频道ID, 消息ID) → 消息预览文本，消息经过处理器时写入
+    - forwards: (频道ID, 消息ID, 目标频道ID) → 转发后的消息ID，None 表示没有转发记录
+
+    本进程是 forwarded_messages 的唯一写入者，转发记录写入时同步更新缓存，
+    所以"没有转发记录"也可以缓存。保留策略清理转发记录后由 clear_forwards
+    清空转发关系，已删除的记录不会继续从缓存中返回。
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.messages = LRUCache(maxsize)
+        self.forwards = LRUCache(maxsize)
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+
+    def remember_message(self, chat_id: int, message_id: int, content: Optional[str]):
+        """记录源消息的预览文本"""
+        self.messages.set((chat_id, message_id), shorten(content or ""))
+
+    def get_message(self, chat_id: int, message_id: int) -> Optional[str]:
+        """获取源消息的预览文本，未缓存时返回 None"""
+        short_content = self.messages.get((chat_id, message_id))
+        if short_content is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return short_content
+
+    def forget_message(self, chat_id: int, message_id: int):
+        """源消息被删除时移除预览文本"""
+        self.messages.pop((chat_id, message_id))
+
+    def remember_forward(self, chat_id: int, message_id: int, forwarded_chat_id: int,
+                         forwarded_message_id: Optional[int]):
+        """记录源消息在目标频道中的消息ID"""
+        self.forwards.set((chat_id, message_id, forwarded_chat_id), forwarded_message_id)
+
+    def has_forward(self, chat_id: int, message_id: int, forwarded_chat_id: int) -> bool:
+        """检查转发记录（包括"没有转发"）是否已缓存"""
+        found = (chat_id, message_id, forwarded_chat_id) in self.forwards
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def get_forward(self, chat_id: int, message_id: int, forwarded_chat_id: int) -> Optional[int]:
+        """获取缓存的转发消息ID"""
+        return self.forwards.get((chat_id, message_id, forwarded_chat_id))
+
+    def clear_forwards(self):
+        """转发记录被清理后清空缓存的转发关系"""
+        self.forwards.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return {
+            'messages': len(self.messages),
+            'forwards': len(self.forwards),
+            'hits': self.hits,
+            'misses': self.misses
+        }
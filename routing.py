@@ -0,0 +1,129 @@
+# routing.py
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from content_filter import ContentFilter, compile_content_filter
+from time_filter import TimeFilter, compile_time_filter
+
+
+class RouteTarget:
+    """单个转发目标（只读）
+
+    channel 字段与 Database.get_all_forward_channels 返回的字典结构一致（另外带有
+    配对的 send_mode），可以直接传给 MyMessageHandler.handle_forward_message。
+    """
+
+    __slots__ = ('monitor_id', 'forward_id', 'pair_id', 'channel', 'filter_rules', 'time_filters',
+                 'timezone', 'content_filter', 'time_filter')
+
+    def __init__(self, monitor_id: int, forward_id: int, channel: Dict[str, Any],
+                 filter_rules: Tuple[Dict[str, Any], ...] = (),
+                 time_filters: Tuple[Dict[str, Any], ...] = (),
+                 timezone: Optional[str] = None):
+        self.monitor_id = monitor_id
+        self.forward_id = forward_id
+        self.pair_id = f"{monitor_id}:{forward_id}"
+        self.channel = channel
+        self.filter_rules = filter_rules
+        self.time_filters = time_filters
+        self.timezone = timezone
+        # 编译后的过滤器，没有规则时为 None
+        self.content_filter: Optional[ContentFilter] = compile_content_filter(filter_rules)
+        self.time_filter: Optional[TimeFilter] = compile_time_filter(time_filters, timezone)
+
+
+class RoutingTable:
+    """监控频道 → 转发目标的路由快照
+
+    快照一旦构建就不再修改，更新时整体替换，读取方无需加锁。
+    """
+
+    def __init__(self, routes: Optional[Dict[int, Tuple[RouteTarget, ...]]] = None):
+        self._routes = routes or {}
+
+    def get_targets(self, monitor_id: int) -> Tuple[RouteTarget, ...]:
+        """获取监控频道的所有转发目标（按配对添加时间排序）"""
+        return self._routes.get(monitor_id, ())
+
+    def is_monitored(self, monitor_id: int) -> bool:
+        """检查频道是否有活跃的转发目标"""
+        return monitor_id in self._routes
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+
+def build_routing_table(cursor) -> RoutingTable:
+    """从数据库读取所有活跃配对、过滤规则和时间段设置，构建路由快照"""
+    cursor.execute('''
+        SELECT
+            cp.monitor_channel_id,
+            f.channel_id,
+            f.channel_name,
+            f.channel_username,
+            cp.added_date,
+            cp.timezone,
+            cp.send_mode
+        FROM channel_pairs cp
+        JOIN channels m ON cp.monitor_channel_id = m.channel_id
+        JOIN channels f ON cp.forward_channel_id = f.channel_id
+        WHERE cp.is_active = 1
+        AND m.is_active = 1
+        AND f.is_active = 1
+        ORDER BY cp.monitor_channel_id, cp.added_date ASC
+    ''')
+    pair_rows = cursor.fetchall()
+
+    cursor.execute('''
+        SELECT rule_id, pair_id, rule_type, filter_mode, pattern
+        FROM filter_rules
+        WHERE is_active = 1
+        ORDER BY rule_id
+    ''')
+    rules_by_pair: Dict[str, List[Dict[str, Any]]] = {}
+    for row in cursor.fetchall():
+        rules_by_pair.setdefault(row[1], []).append({
+            'rule_id': row[0],
+            'pair_id': row[1],
+            'rule_type': row[2],
+            'filter_mode': row[3],
+            'pattern': row[4]
+        })
+
+    cursor.execute('''
+        SELECT filter_id, pair_id, start_time, end_time, days_of_week, mode
+        FROM time_filters
+        WHERE is_active = 1
+        ORDER BY filter_id
+    ''')
+    time_filters_by_pair: Dict[str, List[Dict[str, Any]]] = {}
+    for row in cursor.fetchall():
+        time_filters_by_pair.setdefault(row[1], []).append({
+            'filter_id': row[0],
+            'pair_id': row[1],
+            'start_time': row[2],
+            'end_time': row[3],
+            'days_of_week': row[4],
+            'mode': row[5]
+        })
+
+    routes: Dict[int, List[RouteTarget]] = {}
+    for monitor_id, forward_id, forward_name, forward_username, added_date, tz_name, send_mode in pair_rows:
+        pair_id = f"{monitor_id}:{forward_id}"
+        routes.setdefault(monitor_id, []).append(RouteTarget(
+            monitor_id=monitor_id,
+            forward_id=forward_id,
+            channel={
+                'channel_id': forward_id,
+                'channel_name': forward_name,
+                'channel_username': forward_username,
+                'added_date': added_date,
+                'send_mode': send_mode or 'BOT'
+            },
+            filter_rules=tuple(rules_by_pair.get(pair_id, ())),
+            time_filters=tuple(time_filters_by_pair.get(pair_id, ())),
+            timezone=tz_name
+        ))
+
+    table = RoutingTable({monitor_id: tuple(targets) for monitor_id, targets in routes.items()})
+    logging.info(f"路由表已重建: {len(table)} 个监控频道, {len(pair_rows)} 个转发目标")
+    return table
@@ -0,0 +1,134 @@
+# time_filter.py
+import logging
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python 3.8 没有 zoneinfo，只能使用服务器本地时区
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+ALL_DAYS = (1, 2, 3, 4, 5, 6, 7)
+
+
+def parse_minute(value: str) -> int:
+    """把 "HH:MM" 转换成当天的分钟数"""
+    hours, minutes = value.strip().split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"invalid time: {value}")
+    return hours * 60 + minutes
+
+
+def parse_days(value: Optional[str]) -> Tuple[int, ...]:
+    """解析 "1,2,3" 格式的星期（1=周一），为空时表示每天"""
+    if not value or not value.strip():
+        return ALL_DAYS
+    days = tuple(sorted({int(day) for day in value.split(',') if day.strip()}))
+    if any(day not in ALL_DAYS for day in days):
+        raise ValueError(f"invalid days_of_week: {value}")
+    return days
+
+
+def load_timezone(name: Optional[str]):
+    """加载时区，未设置或无效时返回 None（使用服务器本地时区）"""
+    if not name:
+        return None
+    if ZoneInfo is None:
+        logging.warning(f"当前 Python 版本不支持时区 {name}，使用服务器本地时区")
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        logging.warning(f"无效的时区 {name}，使用服务器本地时区: {e}")
+        return None
+
+
+class WeekBitmap:
+    """一周 10080 分钟的位图"""
+
+    __slots__ = ('bits',)
+
+    def __init__(self):
+        self.bits = bytearray(MINUTES_PER_WEEK // 8)
+
+    def set_range(self, start: int, end: int):
+        """设置 [start, end] 范围内的分钟（包含两端），超过一周末尾时回绕到周一"""
+        bits = self.bits
+        for minute in range(start, end + 1):
+            minute %= MINUTES_PER_WEEK
+            bits[minute >> 3] |= 1 << (minute & 7)
+
+
+class TimeFilter:
+    """单个频道配对的编译后时间段过滤器
+
+    - 命中任一 BLOCK 时间段则拒绝
+    - 存在 ALLOW 时间段时，只允许落在 ALLOW 时间段内的消息
+    - 结束时间早于开始时间的时间段跨越午夜，延续到第二天
+    """
+
+    def __init__(self, rules: Iterable[Tuple[str, str, Optional[str], str]], tz_name: Optional[str] = None):
+        self.tz = load_timezone(tz_name)
+        allow = WeekBitmap()
+        block = WeekBitmap()
+        has_allow = False
+
+        for start_time, end_time, days_of_week, mode in rules:
+            try:
+                start = parse_minute(start_time)
+                end = parse_minute(end_time)
+                days = parse_days(days_of_week)
+            except (AttributeError, ValueError) as e:
+                logging.warning(f"忽略无效的时间段设置 {start_time}-{end_time} ({days_of_week}): {e}")
+                continue
+
+            bitmap = block if mode == 'BLOCK' else allow
+            has_allow = has_allow or mode != 'BLOCK'
+            if end < start:
+                end += MINUTES_PER_DAY
+            for day in days:
+                offset = (day - 1) * MINUTES_PER_DAY
+                bitmap.set_range(offset + start, offset + end)
+
+        # 合并成一个"允许发送"的位图，查询时只需一次位运算
+        allowed = WeekBitmap()
+        for index in range(len(allowed.bits)):
+            allow_byte = allow.bits[index] if has_allow else 0xFF
+            allowed.bits[index] = allow_byte & ~block.bits[index] & 0xFF
+        self.allowed = bytes(allowed.bits)
+
+    def minute_of_week(self, when: datetime) -> int:
+        """把时间转换成配对时区下的一周分钟数（周一 00:00 为 0）"""
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        local = when.astimezone(self.tz) if self.tz else when.astimezone()
+        return local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute
+
+    def is_allowed(self, when: datetime) -> bool:
+        """检查指定时间是否允许转发"""
+        minute = self.minute_of_week(when)
+        return bool(self.allowed[minute >> 3] & (1 << (minute & 7)))
+
+
+@lru_cache(maxsize=1024)
+def _compile_cached(rules: Tuple[Tuple[str, str, Optional[str], str], ...], tz_name: Optional[str]) -> TimeFilter:
+    return TimeFilter(rules, tz_name)
+
+
+def compile_time_filter(time_filters: Iterable[Dict], tz_name: Optional[str] = None) -> Optional[TimeFilter]:
+    """把时间段设置编译成 TimeFilter，没有设置时返回 None
+
+    相同的设置会复用已编译的位图，只有时间段数据变化的配对才会重新编译。
+    """
+    rules = tuple(
+        (rule.get('start_time'), rule.get('end_time'), rule.get('days_of_week'), rule.get('mode') or 'ALLOW')
+        for rule in time_filters
+    )
+    if not rules:
+        return None
+    return _compile_cached(rules, tz_name or None)
@@ -0,0 +1,209 @@
+# upload_bridge.py
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+import httpx
+from telegram._utils.defaultvalue import DefaultValue
+from telegram.error import NetworkError, TimedOut
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+
+# 上传时每次从文件读取的大小
+READ_SIZE = 512 * 1024
+
+
+class DownloadPipeError(IOError):
+    """边下载边上传时下载失败或数据不完整"""
+
+
+class DownloadPipe:
+    """下载和上传之间的管道
+
+    下载写入 tg_ 临时文件后调用 mark 登记已写入的区间，上传从文件开头
+    读取已经连续写入的部分，读到尚未下载的位置时等待。数据只经过磁盘上
+    的临时文件（下载完成后即是缓存文件），内存中每次只保留一个读取块，
+    上传遇到 RetryAfter 重试时可以从头重新读取。
+    """
+
+    def __init__(self, size: int, name: str):
+        self.size = size
+        # InputFile 根据 name 推断文件名和 MIME 类型
+        self.name = name
+        self.fd: Optional[int] = None
+        # 从文件开头连续写入的字节数
+        self.available = 0
+        # 尚未连成一片的区间，起始偏移 -> 结束偏移
+        self.segments: Dict[int, int] = {}
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+
+    def open(self, path: str):
+        """下载开始写入临时文件时打开读取句柄，文件之后被移入缓存也能继续读取"""
+        self.fd = os.open(path, os.O_RDONLY)
+        self._wake()
+
+    def mark(self, offset: int, length: int):
+        """登记已写入文件的区间"""
+        end = offset + length
+        if end <= self.available:
+            return
+        if offset > self.available:
+            self.segments[offset] = max(end, self.segments.get(offset, 0))
+            return
+        self.available = end
+        # 合并已经连上的区间
+        while self.segments:
+            merged = [start for start in self.segments if start <= self.available]
+            if not merged:
+                break
+            for start in merged:
+                self.available = max(self.available, self.segments.pop(start))
+        self._wake()
+
+    def finish(self):
+        """下载完成"""
+        self.done = True
+        self._wake()
+
+    def fail(self, error: BaseException):
+        """下载失败，正在等待的上传会抛出 DownloadPipeError"""
+        self.error = error
+        self._wake()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _wake(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def _wait(self, position: int):
+        while self.fd is None or self.available <= position:
+            if self.error is not None:
+                raise DownloadPipeError(f"下载失败: {self.error}")
+            if self.done:
+                raise DownloadPipeError(f"下载数据不完整: {self.available}/{self.size}")
+            await self.changed.wait()
+
+    async def chunks(self):
+        """按顺序读取文件内容，每次调用都从头开始"""
+        position = 0
+        while position < self.size:
+            await self._wait(position)
+            length = min(READ_SIZE, self.available - position, self.size - position)
+            data = await asyncio.to_thread(os.pread, self.fd, length, position)
+            if not data:
+                raise DownloadPipeError(f"读取位置 {position} 没有数据")
+            position += len(data)
+            yield data
+
+
+def _quote(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+def _content_length(content: Any) -> int:
+    if isinstance(content, DownloadPipe):
+        return content.size
+    if isinstance(content, bytes):
+        return len(content)
+    return os.fstat(content.fileno()).st_size
+
+
+async def _content_chunks(content: Any):
+    if isinstance(content, DownloadPipe):
+        async for chunk in content.chunks():
+            yield chunk
+    elif isinstance(content, bytes):
+        yield content
+    else:
+        await asyncio.to_thread(content.seek, 0)
+        while True:
+            chunk = await asyncio.to_thread(content.read, READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+class StreamingRequest(HTTPXRequest):
+    """在事件循环之外读取上传文件的 HTTPXRequest
+
+    httpx 在事件循环中同步读取 multipart 中的文件对象，也无法等待正在下载的
+    数据。请求中包含文件句柄或 DownloadPipe 时，这里自行生成 multipart 请求体
+    并以异步生成器交给 httpx，文件在线程中读取；文件大小已知，所以仍然带有
+    Content-Length。其余请求交给 HTTPXRequest 处理。
+    """
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        files = request_data.multipart_data if request_data else None
+        if not files or all(isinstance(field[1], bytes) for field in files.values()):
+            return await super().do_request(
+                url, method, request_data,
+                read_timeout=read_timeout, write_timeout=write_timeout,
+                connect_timeout=connect_timeout, pool_timeout=pool_timeout
+            )
+
+        if isinstance(read_timeout, DefaultValue):
+            read_timeout = self._client.timeout.read
+        if isinstance(write_timeout, DefaultValue):
+            write_timeout = self._media_write_timeout
+        if isinstance(connect_timeout, DefaultValue):
+            connect_timeout = self._client.timeout.connect
+        if isinstance(pool_timeout, DefaultValue):
+            pool_timeout = self._client.timeout.pool
+        timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout,
+                                write=write_timeout, pool=pool_timeout)
+
+        boundary = uuid4().hex
+        parts: List[Tuple[bytes, Any]] = []
+        for name, value in (request_data.json_parameters or {}).items():
+            header = f'--{boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'
+            parts.append((header.encode(), str(value).encode()))
+        for name, (filename, content, mimetype) in files.items():
+            header = (f'--{boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"; '
+                      f'filename="{_quote(filename)}"\r\nContent-Type: {mimetype}\r\n\r\n')
+            parts.append((header.encode(), content))
+        closing = f'--{boundary}--\r\n'.encode()
+        length = sum(len(header) + _content_length(content) + 2 for header, content in parts) + len(closing)
+
+        async def body():
+            for header, content in parts:
+                yield header
+                async for chunk in _content_chunks(content):
+                    yield chunk
+                yield b'\r\n'
+            yield closing
+
+        try:
+            res = await self._client.request(
+                method=method,
+                url=url,
+                headers={
+                    'User-Agent': self.USER_AGENT,
+                    'Content-Type': f'multipart/form-data; boundary={boundary}',
+                    'Content-Length': str(length)
+                },
+                timeout=timeout,
+                content=body(),
+            )
+        except httpx.TimeoutException as err:
+            raise TimedOut from err
+        except httpx.HTTPError as err:
+            raise NetworkError(f"httpx.{err.__class__.__name__}: {err}") from err
+
+        if any(isinstance(content, DownloadPipe) for _, content in parts):
+            logging.info(f"边下载边上传完成: {length / (1024 * 1024):.1f}MB")
+        return res.status_code, res.content
@@ -0,0 +1,76 @@
+# user_resend.py
+import re
+from typing import List, Optional
+from telethon import errors, types
+
+# 用户账号发送媒体时说明文字的长度上限
+CAPTION_LIMIT = 1024
+
+# 表示原媒体引用不能再使用的错误，此时改用下载上传方式
+REFERENCE_ERRORS = (
+    errors.FileReferenceExpiredError,
+    errors.FileReferenceInvalidError,
+    errors.FileReferenceEmptyError,
+    errors.FilerefUpgradeNeededError,
+    errors.MediaEmptyError,
+    errors.MediaInvalidError,
+    errors.PhotoInvalidError,
+    errors.DocumentInvalidError,
+)
+
+# Bot API 旧版 Markdown 的 *粗体*
+_BOLD = re.compile(r'(?<!\*)\*(?!\*)([^*\n]+?)\*(?!\*)')
+
+
+def is_reference_error(error: Exception) -> bool:
+    """检查错误是否表示原媒体引用被拒绝"""
+    return isinstance(error, REFERENCE_ERRORS)
+
+
+def to_telethon_markdown(text: str) -> str:
+    """把 forwarded_message_template 使用的 Bot API Markdown 转为 Telethon Markdown
+
+    两者的链接和代码语法相同，只有粗体不同（*粗体* → **粗体**）。
+    """
+    return _BOLD.sub(r'**\1**', text) if text else text
+
+
+def can_resend(message) -> bool:
+    """只有图片和文档（视频、文件、音频、贴图等）可以直接引用原媒体发送"""
+    return isinstance(getattr(message, 'media', None), (types.MessageMediaPhoto, types.MessageMediaDocument))
+
+
+async def resend(client, channel_id: int, messages: List, caption: Optional[str],
+                 reply_to: Optional[int] = None) -> List:
+    """用用户账号直接发送原消息的媒体，不下载也不上传文件
+
+    caption 放在第一个媒体上；贴图不能带说明文字，说明文字过长时也无法
+    放进媒体，这两种情况先发送文本消息，媒体作为回复发送。
+    返回发送出的消息列表，第一条是记录转发关系时使用的消息。
+    """
+    caption = to_telethon_markdown(caption) if caption else None
+    sticker = len(messages) == 1 and getattr(messages[0], 'sticker', None)
+    sent = []
+    if caption and (sticker or len(caption) > CAPTION_LIMIT):
+        text_message = await client.send_message(channel_id, caption, reply_to=reply_to,
+                                                 link_preview=False, parse_mode='md')
+        sent.append(text_message)
+        reply_to = text_message.id
+        caption = None
+
+    try:
+        if len(messages) == 1:
+            result = await client.send_file(channel_id, messages[0].media, caption=caption,
+                                            reply_to=reply_to, parse_mode='md')
+            sent.append(result)
+        else:
+            captions = [caption] + [None] * (len(messages) - 1)
+            result = await client.send_file(channel_id, [msg.media for msg in messages], caption=captions,
+                                            reply_to=reply_to, parse_mode='md')
+            sent.extend(result if isinstance(result, list) else [result])
+    except Exception:
+        # 媒体发送失败时撤回已发送的文本，改用其他方式时不会重复
+        if sent:
+            await client.delete_messages(channel_id, [msg.id for msg in sent])
+        raise
+    return sent